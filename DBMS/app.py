@@ -1,14 +1,98 @@
 # DBMS/app.py
 
-from flask import Flask, request, jsonify
+import os
+import json
+import time
+import argparse
+import threading
+from flask import Flask, request, jsonify, g, stream_with_context
 from models.database import Database
+from models.replication import ReplicationPublisher, Replica, REPLICATION_AUTHKEY
+from changelog import row_events
 from functools import wraps
 from auth import Auth
+from cache import ResultCache
+from memory import budget
+import locking
+from metrics import registry, HTTP_REQUEST_SECONDS
+from profiling import trace, SlowLog, RouteProfiler
 
 
 app = Flask(__name__)
 databases = {}
 auth = Auth()
+result_cache = ResultCache()
+replication = {'publisher': None, 'replicas': {}}
+registry_lock = threading.Lock()
+slow_log = SlowLog()
+profiler = RouteProfiler()
+# joined rows are serialized and sent in batches of this many
+JOIN_BATCH_ROWS = int(os.environ.get('DIYDB_JOIN_BATCH_ROWS', 1000))
+# change log entries read per batch by /changes, and how often an idle stream sends a keep-alive comment
+CHANGES_BATCH = int(os.environ.get('DIYDB_CHANGES_BATCH', 500))
+CHANGES_HEARTBEAT_SECONDS = float(os.environ.get('DIYDB_CHANGES_HEARTBEAT', 15))
+# users allowed to use the diagnostics routes, as a comma separated list
+ADMINS = set(filter(None, os.environ.get('DIYDB_ADMINS', '').split(',')))
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+    trace.start()
+
+def refresh_shared_database():
+    # with several server processes, the database a request names may have been created or written by another;
+    # only called once the token checks out, so anonymous requests can't make a process reload anything
+    if not locking.MULTIPROCESS:
+        return
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else request.args
+    db_name = data.get('db_name')
+    db = resolve_database(db_name) if isinstance(db_name, str) and db_name else None
+    if db is not None:
+        db.refresh()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop('started', None)
+    if started is not None:
+        # the url rule keeps label values bounded; unknown paths all count as one route
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, response.status_code)
+        entry = trace.finish()
+        if entry['elapsed_ms'] >= slow_log.threshold_ms:
+            data = request.get_json(silent=True)
+            data = data if isinstance(data, dict) else request.args
+            entry.update(route=route, method=request.method, status=response.status_code,
+                         db_name=data.get('db_name'), table_name=data.get('table_name'))
+            slow_log.record(entry)
+    return response
+
+def cache_metrics():
+    stats = result_cache.stats()
+    return [
+        ('diydb_result_cache_hits_total', 'Result cache hits', 'counter', [({}, stats['hits'])]),
+        ('diydb_result_cache_misses_total', 'Result cache misses', 'counter', [({}, stats['misses'])]),
+        ('diydb_result_cache_evictions_total', 'Result cache evictions', 'counter', [({}, stats['evictions'])]),
+        ('diydb_result_cache_bytes', 'Bytes held by the result cache', 'gauge', [({}, stats['bytes'])]),
+        ('diydb_result_cache_entries', 'Entries held by the result cache', 'gauge', [({}, stats['entries'])]),
+    ]
+
+registry.add_collector(cache_metrics)
+
+def memory_metrics():
+    stats = budget.stats()
+    return [
+        ('diydb_table_loads_total', 'Lookups of tables that had to be loaded from disk', 'counter',
+         [({}, stats['misses'])]),
+        ('diydb_table_hits_total', 'Lookups of tables that were in memory', 'counter', [({}, stats['hits'])]),
+        ('diydb_table_evictions_total', 'Tables evicted to stay within the memory budget', 'counter',
+         [({}, stats['evictions'])]),
+        ('diydb_resident_bytes', 'Estimated bytes of the tables in memory', 'gauge', [({}, stats['bytes'])]),
+        ('diydb_resident_tables', 'Tables in memory', 'gauge', [({}, len(stats['tables']))]),
+        ('diydb_memory_budget_bytes', 'Memory budget for table rows', 'gauge', [({}, stats['limit_bytes'])]),
+    ]
+
+registry.add_collector(memory_metrics)
 
 @app.route('/')
 def home():
@@ -39,12 +123,57 @@ def token_required(f):
                 return jsonify({"error": username}), 401
         except IndexError:
             return jsonify({"error": "Token format is incorrect. Ensure 'Bearer <token>' format."}), 401
-        
+        g.username = username
+        refresh_shared_database()
+
+        profile = profiler.start(request.url_rule.rule)
+        if profile is None:
+            return f(*args, **kwargs)
+        try:
+            return profile.runcall(f, *args, **kwargs)
+        finally:
+            profiler.finish(request.url_rule.rule, profile)
+    return decorated
+
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if g.get('username') not in ADMINS:
+            return jsonify({"error": "Access denied"}), 403
         return f(*args, **kwargs)
     return decorated
 
+def primary_only(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if replication['replicas']:
+            return jsonify({"error": "This server is a read-only replica"}), 403
+        return f(*args, **kwargs)
+    return decorated
+
+def register_database(db):
+    databases[db.db_name] = db
+    db.add_listener(result_cache.invalidate)
+    return db
+
+def resolve_database(db_name):
+    """
+    Return a loaded database, loading it from disk if it exists but was not selected yet, e.g.
+    since this process started or because another server process created it. Its owner comes
+    from its metadata.json. Used by the replication publisher and in multi-process mode.
+    """
+    if db_name in databases:
+        return databases[db_name]
+    with registry_lock:
+        if db_name in databases:
+            return databases[db_name]
+        if os.path.exists(os.path.join('databases', db_name, 'metadata.json')):
+            return register_database(Database(db_name, None))
+    return None
+
 
 @app.route('/register', methods=['POST'])
+@primary_only
 def register():
     data = request.json
     username = data.get('username')
@@ -84,7 +213,16 @@ def select_database():
         return jsonify({'error': "Access denied"}), 403
     
     if db_name not in databases.keys():
-        databases[db_name] = Database(db_name,username)
+        if replication['replicas']:
+            return jsonify({'error': f"Database {db_name} is not replicated to this server"}), 404
+        db = register_database(Database(db_name,username))
+        if db.shared:
+            # claim the name on disk, unless another server process got there first
+            with db.lock:
+                if not os.path.exists(db.meta_data_file):
+                    db.save_metadata()
+            if db.owner != username:
+                return jsonify({'error': "Access denied"}), 403
         #return jsonify({'message': f'Database {db_name} is created'}), 201
     
     return jsonify({"message": f"Databse {db_name} selected"}), 200
@@ -93,10 +231,12 @@ def select_database():
 
 @app.route('/create_table', methods=['POST'])
 @token_required
+@primary_only
 def create_table():
     """
     Route to create a new table.
-    Expects JSON data with 'table_name'.
+    Expects JSON data with 'table_name', and optionally 'ttl' as {'column': ..., 'seconds': ...}
+    to have rows expire at the time held in that column.
     """
     data = request.json
     db_name = data.get('db_name')
@@ -104,6 +244,9 @@ def create_table():
     columns = data.get('columns')
     datatypes = data.get('datatypes')
     constraints = data.get('constraints', {})
+    partitions = data.get('partitions', 1)
+    encoding = data.get('encoding')
+    ttl = data.get('ttl')
     
     print(f"Received db_name: {db_name}") 
     if not db_name or db_name not in databases.keys():
@@ -112,11 +255,127 @@ def create_table():
         return jsonify({'error': 'Table name, columns , datatypes are required'}), 400
     
     db = databases[db_name]
-    return jsonify({'message': db.create_table(table_name,columns,datatypes,constraints)})
+    return jsonify({'message': db.create_table(table_name,columns,datatypes,constraints,partitions,encoding,ttl)})
 
 
+@app.route('/alter_table', methods=['POST'])
+@token_required
+@primary_only
+def alter_table():
+    """
+    Route to add or drop a column of a table without rewriting its rows.
+    Expects JSON data with 'table_name', 'action' ('add_column' or 'drop_column') and 'column',
+    and for add_column 'datatype' and optionally 'default' and 'constraints'.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    action = data.get('action')
+    column = data.get('column')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or not column or action not in ('add_column', 'drop_column'):
+        return jsonify({'error': 'Table name, column and an action of add_column or drop_column are required'}), 400
+    db = databases[db_name]
+    if action == 'add_column':
+        if not data.get('datatype'):
+            return jsonify({'error': 'Datatype is required'}), 400
+        result = db.add_column(table_name, column, data['datatype'], data.get('default'), data.get('constraints'))
+    else:
+        result = db.drop_column(table_name, column)
+    if result['success']:
+        return jsonify({'message': result['message']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/create_index', methods=['POST'])
+@token_required
+@primary_only
+def create_index():
+    """
+    Route to index a column of a table.
+    Expects JSON data with 'table_name', 'column' and optionally 'kind', 'hash' (default) for
+    equality lookups, 'ordered' for range lookups as well, or on str columns 'prefix' for
+    LIKE 'abc%' and 'ngram' for LIKE '%abc%'.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    column = data.get('column')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or not column:
+        return jsonify({'error': 'Table name and column are required'}), 400
+    result = databases[db_name].create_index(table_name, column, data.get('kind', 'hash'))
+    if result['success']:
+        return jsonify({'message': result['message']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/drop_index', methods=['POST'])
+@token_required
+@primary_only
+def drop_index():
+    """
+    Route to drop the index of a column.
+    Expects JSON data with 'table_name' and 'column'.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    column = data.get('column')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or not column:
+        return jsonify({'error': 'Table name and column are required'}), 400
+    result = databases[db_name].drop_index(table_name, column)
+    if result['success']:
+        return jsonify({'message': result['message']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/analyze', methods=['POST'])
+@token_required
+@primary_only
+def analyze():
+    """
+    Route to gather the statistics of a table anew.
+    Expects JSON data with 'table_name'. Returns the row count and, per column, the distinct
+    count estimate, min, max, null fraction and histogram bounds.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name:
+        return jsonify({'error': 'Table name is required'}), 400
+    result = databases[db_name].analyze(table_name)
+    if result['success']:
+        return jsonify({'message': result['message'], 'statistics': result['statistics']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/durability', methods=['POST'])
+@token_required
+@primary_only
+def durability():
+    """
+    Route to set how writes are made durable: 'sync', 'group' or 'async'.
+    Expects JSON data with 'mode' and optionally 'table_name' to set it for one table only; a
+    table given a null mode goes back to the database setting.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if 'mode' not in data:
+        return jsonify({'error': 'Mode is required'}), 400
+    db = databases[db_name]
+    result = db.set_durability(data['mode'], data.get('table_name'))
+    if result['success']:
+        return jsonify({'message': result['message']}), 200
+    return jsonify({'error': result['message']}), 400
+
 @app.route('/insert_record', methods=['POST'])
 @token_required
+@primary_only
 def insert_record():
     """
     Route to insert a record into a table.
@@ -137,26 +396,311 @@ def insert_record():
     else:
         return jsonify({'error': result['message']}), 400
 
+@app.route('/insert_many', methods=['POST'])
+@token_required
+@primary_only
+def insert_many():
+    """
+    Route to insert many records into a table at once.
+    Expects JSON data with 'table_name' and 'rows', a list of record contents. Either every row is
+    inserted or none is.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    rows = data.get('rows')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or not rows:
+        return jsonify({'error': 'Table name and rows are required'}), 400
+    db = databases[db_name]
+    result = db.insert_many(table_name, rows)
+    if result['success']:
+        return jsonify({'message': result['message'], 'count': len(result['changes'])}), 200
+    return jsonify({'error': result['message']}), 400
+
 @app.route('/select', methods=['POST'])
 @token_required
 def select():
     """
     Route to select records from a table.
-    Expects JSON data with 'table_name'.
+    Expects JSON data with 'table_name' and optionally 'where', a list of [column, operator, value].
+    With 'order_by' (e.g. ["age desc", "name"]) and/or 'limit', 'records' is a list of
+    [record_id, record] pairs in order instead of an object keyed by record id.
     """
     data = request.json
     db_name = data.get('db_name')
     table_name = data.get('table_name')
+    where = data.get('where')
+    order_by = data.get('order_by')
+    limit = data.get('limit')
     if not db_name or db_name not in databases.keys():
         return jsonify({"error":"Invalid database name"}), 400
     
     if not table_name:
         return jsonify({'error': 'Table name is required'}), 400
+
+    db = databases[db_name]
+    def run():
+        if order_by or limit is not None:
+            result = db.order(table_name, where, order_by, limit)
+            if result['success']:
+                return {'records': result['records']}, 200
+            return {'error': result['message']}, 400
+        if not where:
+            records = db.select_table(table_name)
+            if isinstance(records, dict):
+                trace.add_rows(len(records))
+            return {'records': records}, 200
+        result = db.query(table_name, where)
+        if result['success']:
+            return {'records': result['records']}, 200
+        return {'error': result['message']}, 400
+    return cached_response(db_name, table_name, data, run)
+
+@app.route('/aggregate', methods=['POST'])
+@token_required
+def aggregate():
+    """
+    Route to aggregate a column of a table.
+    Expects JSON data with 'table_name', 'function' (count, sum, min, max, avg),
+    and optionally 'column' and 'where'.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    function = data.get('function')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or not function:
+        return jsonify({'error': 'Table name and function are required'}), 400
+
+    db = databases[db_name]
+    def run():
+        result = db.aggregate(table_name, function, data.get('column'), data.get('where'))
+        if result['success']:
+            return {'value': result['value']}, 200
+        return {'error': result['message']}, 400
+    return cached_response(db_name, table_name, data, run)
+
+@app.route('/explain', methods=['POST'])
+@token_required
+def explain():
+    """
+    Route to run a query of a table and report how it was answered.
+    Expects JSON data with 'table_name' and optionally 'where', like /select. The plan gives the
+    access path (scan, primary key or an index) and the estimated and actual row
+    counts of the query and of each of its conditions.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name:
+        return jsonify({'error': 'Table name is required'}), 400
+    result = databases[db_name].explain(table_name, data.get('where'))
+    if result['success']:
+        return jsonify({'plan': result['plan']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/join', methods=['POST'])
+@token_required
+def join():
+    """
+    Route to join two tables of a database.
+    Expects JSON data with 'left' and 'right' table names and 'on', a column both have or
+    [left column, right column], and optionally 'how' ('inner' or 'left'), 'left_where' and
+    'right_where'. The response is streamed as the rows are joined, so it is never cached.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    left = data.get('left')
+    right = data.get('right')
+    on = data.get('on')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not left or not right or not on:
+        return jsonify({'error': 'Left table, right table and on are required'}), 400
+
     db = databases[db_name]
-    return jsonify({'records': db.select_table(table_name)})
+    result = db.join(left, right, on, data.get('how', 'inner'), data.get('left_where'), data.get('right_where'))
+    if not result['success']:
+        return jsonify({'error': result['message']}), 400
+    head = json.dumps({'columns': result['columns'], 'strategy': result['strategy']})
+
+    def generate():
+        yield head[:-1] + ', "rows": ['
+        separator = ''
+        batch = []
+        for row in result['rows']:
+            batch.append(json.dumps(row))
+            if len(batch) >= JOIN_BATCH_ROWS:
+                yield separator + ', '.join(batch)
+                separator = ', '
+                batch = []
+        if batch:
+            yield separator + ', '.join(batch)
+        yield ']}'
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def cached_response(db_name, table_name, data, run):
+    """
+    Serve a read from the result cache, or run it and cache the serialized body if it succeeded.
+    """
+    key = result_cache.make_key(db_name, table_name, dict(data, route=request.path))
+    body = result_cache.get(key)
+    if body is not None:
+        return app.response_class(body, mimetype='application/json')
+
+    generation = result_cache.generation(db_name, table_name)
+    payload, status = run()
+    with trace.phase('serialization'):
+        response = jsonify(payload)
+    if status == 200:
+        result_cache.put(key, response.get_data(), generation)
+    return response, status
+
+@app.route('/changes', methods=['GET'])
+@token_required
+def changes():
+    """
+    Route to subscribe to the changes of a database, as Server-Sent Events.
+    Expects 'db_name' and optionally 'table_name', 'since' (a sequence number, by default only
+    changes from now on are sent) and 'wait'. Every insert, update and delete, including each
+    row of a set-based write, is one event in commit order; the id of the last event of a commit
+    is its sequence number, so a client can resume with since or the Last-Event-ID header.
+    Without 'wait' the stream stays open; with it, the response ends once some events were sent
+    or after 'wait' seconds without any, for clients that long-poll.
+    Returns 410 if the changes after 'since' are no longer kept, or are of an earlier 'epoch'.
+    """
+    db_name = request.args.get('db_name')
+    table_name = request.args.get('table_name')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    db = databases[db_name]
+    if table_name and table_name not in db.tables:
+        return jsonify({'error': f"Table {table_name} doesnt exist"}), 400
+    try:
+        since = int(request.args.get('since', request.headers.get('Last-Event-ID', db.changelog.seq)))
+        wait = float(request.args['wait']) if 'wait' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'since must be a sequence number and wait a number of seconds'}), 400
+    epoch = request.args.get('epoch')
+    if (epoch and epoch != db.changelog.epoch) or db.changelog.read(since, 1) is None:
+        return jsonify({'error': f"Changes after {since} are no longer available, read the table again",
+                        'epoch': db.changelog.epoch, 'head': db.changelog.seq}), 410
+
+    def generate():
+        seq = since
+        yield f"event: epoch\ndata: {json.dumps({'epoch': db.changelog.epoch, 'head': db.changelog.seq})}\n\n"
+        deadline = time.monotonic() + wait if wait is not None else None
+        while True:
+            entries = db.changelog.read(seq, CHANGES_BATCH)
+            if entries is None:
+                yield "event: gone\ndata: {}\n\n"
+                return
+            chunk = []
+            for entry in entries:
+                events = row_events(entry, table_name)
+                for event in events[:-1]:
+                    chunk.append(f"event: change\ndata: {json.dumps(event)}\n\n")
+                if events:
+                    chunk.append(f"id: {entry['seq']}\nevent: change\ndata: {json.dumps(events[-1])}\n\n")
+                seq = entry['seq']
+            if chunk:
+                yield ''.join(chunk)
+                if wait is not None:
+                    return
+            if len(entries) == CHANGES_BATCH:
+                continue
+            timeout = CHANGES_HEARTBEAT_SECONDS
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    return
+            if not db.changelog.wait_since(seq, timeout):
+                yield ": keep-alive\n\n"
+    return app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache'})
+
+@app.route('/cache_stats', methods=['GET'])
+@token_required
+def cache_stats():
+    """
+    Route to inspect the result cache.
+    Returns hit, miss and eviction counters.
+    """
+    return jsonify(result_cache.stats()), 200
+
+@app.route('/memory_stats', methods=['GET'])
+@token_required
+def memory_stats():
+    """
+    Route to inspect the memory budget.
+    Returns the tables of the caller's databases in memory with their estimated size, and the
+    hit rate of table lookups.
+    """
+    return jsonify(budget.stats(owner=g.username)), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Route for Prometheus to scrape.
+    Returns operation latencies, bytes written and cache counters in the Prometheus text format.
+    """
+    return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/slow_requests', methods=['GET', 'POST'])
+@token_required
+@admin_required
+def slow_requests():
+    """
+    Admin route for the slow request log.
+    GET returns the threshold and the most recent slow requests with their time breakdown.
+    POST expects JSON data with 'threshold_ms' and changes the threshold.
+    """
+    if request.method == 'POST':
+        threshold_ms = request.json.get('threshold_ms')
+        if not isinstance(threshold_ms, (int, float)) or threshold_ms < 0:
+            return jsonify({'error': 'threshold_ms must be a non-negative number'}), 400
+        slow_log.threshold_ms = threshold_ms
+    return jsonify({'threshold_ms': slow_log.threshold_ms, 'requests': slow_log.recent()}), 200
+
+@app.route('/profile', methods=['GET', 'POST'])
+@token_required
+@admin_required
+def profile():
+    """
+    Admin route to profile requests.
+    POST expects JSON data with 'route' and optionally 'requests' (default 1), and profiles the
+    next that many requests to the route.
+    GET with 'route' returns the profile once captured, as text or with format=pstats as a file
+    pstats can load. GET without 'route' lists pending and finished profiles.
+    """
+    routes = {rule.rule for rule in app.url_map.iter_rules()}
+    if request.method == 'POST':
+        route = request.json.get('route')
+        count = request.json.get('requests', 1)
+        if route not in routes:
+            return jsonify({'error': f"Unknown route {route}"}), 400
+        if not isinstance(count, int) or count < 1:
+            return jsonify({'error': 'requests must be a positive integer'}), 400
+        profiler.arm(route, count)
+        return jsonify({'message': f"Profiling the next {count} requests to {route}"}), 200
+
+    route = request.args.get('route')
+    if not route:
+        return jsonify(profiler.status()), 200
+    raw = request.args.get('format') == 'pstats'
+    dump = profiler.dump(route, raw=raw)
+    if dump is None:
+        return jsonify({'error': f"No finished profile for {route}"}), 404
+    return app.response_class(dump, mimetype='application/octet-stream' if raw else 'text/plain')
 
 @app.route('/update_record', methods=['PUT'])
 @token_required
+@primary_only
 def update_record():
     """
     Route to update a record in a table.
@@ -176,6 +720,7 @@ def update_record():
 
 @app.route('/delete', methods=['DELETE'])
 @token_required
+@primary_only
 def delete():
     """
     Route to delete a record from a table.
@@ -192,8 +737,55 @@ def delete():
     db = databases[db_name]
     return jsonify({'message': db.delete(table_name, primary_key)})
 
+@app.route('/update_where', methods=['PUT'])
+@token_required
+@primary_only
+def update_where():
+    """
+    Route to update every record of a table matching a where clause.
+    Expects JSON data with 'table_name', 'where' ([] for every record) and 'set', an object of
+    column -> new value.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    where = data.get('where')
+    assignments = data.get('set')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or where is None or not assignments:
+        return jsonify({'error': 'Table name, where and set are required'}), 400
+    db = databases[db_name]
+    result = db.update_where(table_name, where, assignments)
+    if result['success']:
+        return jsonify({'message': result['message'], 'count': len(result['changes'])}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/delete_where', methods=['DELETE'])
+@token_required
+@primary_only
+def delete_where():
+    """
+    Route to delete every record of a table matching a where clause.
+    Expects JSON data with 'table_name' and 'where' ([] for every record).
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    where = data.get('where')
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not table_name or where is None:
+        return jsonify({'error': 'Table name and where are required'}), 400
+    db = databases[db_name]
+    result = db.delete_where(table_name, where)
+    if result['success']:
+        return jsonify({'message': result['message'], 'count': len(result['changes'])}), 200
+    return jsonify({'error': result['message']}), 400
+
 @app.route('/drop_table', methods=['POST'])
 @token_required
+@primary_only
 def drop():
     """
     Route to delete a record from a table.
@@ -209,5 +801,135 @@ def drop():
     db = databases[db_name]
     return jsonify({'message': db.drop_table(table_name)})
 
+@app.route('/compact', methods=['GET', 'POST'])
+@token_required
+@primary_only
+def compact():
+    """
+    Admin route to compact a table.
+    POST expects JSON data with 'db_name' and 'table_name' and returns the compaction report.
+    GET returns the dead-space ratio of every table plus recent compaction reports.
+    """
+    data = request.json if request.method == 'POST' else request.args
+    db_name = data.get('db_name')
+    table_name = data.get('table_name')
+    username = auth.verify_token(extract_token(request.headers))
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    db = databases[db_name]
+    if db.owner != username:
+        return jsonify({'error': "Access denied"}), 403
+    if request.method == 'GET':
+        return jsonify(db.compaction_status()), 200
+    if not table_name:
+        return jsonify({'error': 'Table name is required'}), 400
+    result = db.compact_table(table_name)
+    if result['success']:
+        return jsonify(result), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/snapshot', methods=['GET', 'POST'])
+@token_required
+def snapshot():
+    """
+    Route to take a consistent snapshot of a database.
+    POST expects JSON data with 'db_name' and returns the snapshot manifest.
+    GET lists the snapshots of 'db_name'.
+    """
+    data = request.json if request.method == 'POST' else request.args
+    db_name = data.get('db_name')
+    username = auth.verify_token(extract_token(request.headers))
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    db = databases[db_name]
+    if db.owner != username:
+        return jsonify({'error': "Access denied"}), 403
+    if request.method == 'GET':
+        return jsonify({'snapshots': db.list_snapshots()}), 200
+    result = db.create_snapshot()
+    return jsonify(result), 201
+
+@app.route('/restore', methods=['POST'])
+@token_required
+@primary_only
+def restore():
+    """
+    Route to restore a database from a snapshot.
+    Expects JSON data with 'db_name' and 'snapshot_id'.
+    """
+    data = request.json
+    db_name = data.get('db_name')
+    snapshot_id = data.get('snapshot_id')
+    username = auth.verify_token(extract_token(request.headers))
+    if not db_name or db_name not in databases.keys():
+        return jsonify({"error":"Invalid database name"}), 400
+    if not snapshot_id:
+        return jsonify({'error': 'Snapshot id is required'}), 400
+    db = databases[db_name]
+    if db.owner != username:
+        return jsonify({'error': "Access denied"}), 403
+    result = db.restore_snapshot(snapshot_id)
+    if result['success']:
+        return jsonify({'message': result['message']}), 200
+    return jsonify({'error': result['message']}), 400
+
+@app.route('/replication_status', methods=['GET'])
+@token_required
+def replication_status():
+    """
+    Route to inspect replication.
+    On a primary it lists the connected replicas, on a replica it reports the lag per database.
+    """
+    if replication['replicas']:
+        return jsonify({'role': 'replica',
+                        'databases': [replica.status() for replica in replication['replicas'].values()]}), 200
+    if replication['publisher'] is not None:
+        return jsonify(replication['publisher'].status()), 200
+    return jsonify({'role': 'standalone'}), 200
+
+def parse_address(address):
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    parser = argparse.ArgumentParser(description='DIYDB server')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-debug', action='store_true', help='Run without the debugger and reloader')
+    parser.add_argument('--replication-port', type=int,
+                        help='Run as a primary and stream the change log to replicas on this port. '
+                             'The primary and its replicas share a secret in DIYDB_REPLICATION_KEY')
+    parser.add_argument('--replica-of', metavar='HOST:PORT',
+                        help='Run as a read-only replica of the primary listening on HOST:PORT')
+    parser.add_argument('--replica-db', action='append', default=[],
+                        help='Database to replicate (repeat for several)')
+    parser.add_argument('--replica-root', default='replica_databases',
+                        help='Directory holding the local copies of a replica')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Serve requests from up to this many forked processes sharing the databases '
+                             'directory. Each request gets a fresh fork, so nothing stays loaded between requests; '
+                             'for long-lived workers run gunicorn with DIYDB_MULTIPROCESS=1 instead')
+    args = parser.parse_args()
+
+    if args.processes > 1 and (args.replica_of or args.replication_port):
+        parser.error('--processes does not work with replication, whose change log is per process')
+
+    if (args.replica_of or args.replication_port) and not REPLICATION_AUTHKEY:
+        parser.error('replication needs a shared secret in DIYDB_REPLICATION_KEY')
+
+    if args.replica_of:
+        for db_name in args.replica_db:
+            replication['replicas'][db_name] = Replica(parse_address(args.replica_of), db_name, root=args.replica_root,
+                                                       on_database=register_database,
+                                                       database_class=Database).start()
+    elif args.replication_port:
+        replication['publisher'] = ReplicationPublisher(('127.0.0.1', args.replication_port),
+                                                        resolve_database).start()
+    if args.processes > 1:
+        # no database is loaded yet, so from here on every one is opened shared, like the users
+        locking.MULTIPROCESS = True
+        auth = Auth()
+        app.run(debug=False, port=args.port, threaded=False, processes=args.processes)
+    else:
+        # the reloader would start a second process fighting over the replication socket
+        app.run(debug=not args.no_debug, port=args.port,
+                use_reloader=not (args.no_debug or args.replica_of or args.replication_port))
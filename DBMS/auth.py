@@ -3,16 +3,30 @@ import os
 import bcrypt
 import json
 import jwt
+from contextlib import nullcontext
 from datetime import datetime, timedelta
+from metrics import AUTH_SECONDS
+from profiling import trace
+import locking
+from locking import ProcessLock, file_signature
 
 USER_FILE_PATH = 'user_credentials.json'
 SECRET_KEY = 'AbhiSoochonGa'
 
 class Auth:
-    def __init__(self):
+    def __init__(self, shared: bool = None):
+        """
+        The registered users, kept in USER_FILE_PATH. When shared, other server processes register
+        users too: registering holds an fcntl lock on the file, and the users are read again
+        whenever the file changed.
+        """
+        self.shared = locking.MULTIPROCESS if shared is None else shared
+        self.lock = ProcessLock(USER_FILE_PATH + '.lock', self.refresh) if self.shared else None
+        self.signature = None
         self.users = self.load_users()
 
     def load_users(self):
+        self.signature = file_signature(USER_FILE_PATH)
         if not os.path.exists(USER_FILE_PATH):
             return []
         with open(USER_FILE_PATH, 'r') as file:
@@ -21,40 +35,57 @@ class Auth:
             except json.JSONDecodeError:
                 return []
 
+    def refresh(self):
+        if self.shared and file_signature(USER_FILE_PATH) != self.signature:
+            self.users = self.load_users()
+
     def save_users(self):
-        with open(USER_FILE_PATH, 'w') as file:
+        with open(USER_FILE_PATH + '.tmp', 'w') as file:
             json.dump({'users': self.users}, file, indent=4)
+        # renamed into place, so other processes never read a half written file
+        os.replace(USER_FILE_PATH + '.tmp', USER_FILE_PATH)
+        self.signature = file_signature(USER_FILE_PATH)
 
     def hash_password(self, password: str) -> str:
-        salt = bcrypt.gensalt()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
+        with AUTH_SECONDS.time('hash_password'), trace.phase('auth'):
+            salt = bcrypt.gensalt()
+            hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
         return hashed_password.decode('utf-8')
 
     def convert_password(self, password: str, hashed_password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        with AUTH_SECONDS.time('check_password'), trace.phase('auth'):
+            return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
     def register_user(self, username: str, password: str) -> str:
+        self.refresh()
         if any(user['username'] == username for user in self.users):
             return f'{username} already exists'
         hash_password = self.hash_password(password)
-        self.users.append({'username': username, 'password': hash_password})
-        self.save_users()
+        with self.lock if self.lock is not None else nullcontext():
+            # another process may have registered the name while the password was hashed
+            if any(user['username'] == username for user in self.users):
+                return f'{username} already exists'
+            self.users.append({'username': username, 'password': hash_password})
+            self.save_users()
         return 'User created successfully'
 
     def authenticate_user(self, username: str, password: str) -> str:
+        self.refresh()
         for user in self.users:
             if user['username'] == username:
                 if self.convert_password(password, user['password']):
-                    token = jwt.encode({
-                        "username": username,
-                        "exp": datetime.utcnow() + timedelta(hours=1)
-                    }, SECRET_KEY, algorithm="HS256")
+                    with AUTH_SECONDS.time('encode_token'), trace.phase('auth'):
+                        token = jwt.encode({
+                            "username": username,
+                            "exp": datetime.utcnow() + timedelta(hours=1)
+                        }, SECRET_KEY, algorithm="HS256")
                     return token
         return 'Invalid credentials'
 
     def verify_token(self, token: str)->str:
         try:
-            decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            with AUTH_SECONDS.time('verify_token'), trace.phase('auth'):
+                decoded_token = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
             print("auth.py:",decoded_token['username'])
             return decoded_token['username']
         except jwt.ExpiredSignatureError:
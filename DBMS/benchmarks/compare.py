@@ -0,0 +1,54 @@
+# DBMS/benchmarks/compare.py
+"""
+Compare two benchmark result files written by benchmarks/run.py.
+
+    python benchmarks/compare.py baseline.json current.json --threshold 1.25
+
+Exits with status 1 if any benchmark's p50 got slower than threshold times the baseline.
+"""
+import sys
+import json
+import argparse
+
+
+def key(result: dict) -> tuple:
+    return (result['suite'], result['operation'], result['schema'], result['size'])
+
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str = 'p50_ms') -> list:
+    previous = {key(result): result for result in baseline['results']}
+    rows = []
+    for result in current['results']:
+        before = previous.get(key(result))
+        if before is None or not before[metric]:
+            continue
+        ratio = result[metric] / before[metric]
+        rows.append({'benchmark': key(result), 'before': before[metric], 'after': result[metric],
+                     'ratio': ratio, 'regressed': ratio > threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark runs')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Allowed slowdown ratio')
+    parser.add_argument('--metric', default='p50_ms', help='Result field to compare')
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    rows = compare(baseline, current, args.threshold, args.metric)
+    for row in rows:
+        suite, operation, schema, size = row['benchmark']
+        flag = 'REGRESSED' if row['regressed'] else ''
+        print(f"{suite:8} {operation:16} {schema:6} {size:>8} {row['before']:10.3f} -> {row['after']:10.3f} "
+              f"x{row['ratio']:.2f} {flag}")
+    sys.exit(1 if any(row['regressed'] for row in rows) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+# DBMS/benchmarks/loadtest.py
+"""
+Concurrent load test against a locally started app.py.
+
+Run from the DBMS directory:
+    python benchmarks/loadtest.py --clients 200 --duration 30 --read-ratio 0.9 --distribution zipf \\
+        --table-size 10000 --output load.json
+    python benchmarks/loadtest.py ... --baseline load.json --threshold 1.25
+
+Reports throughput and p50/p90/p99 latency per route. With --baseline it exits with status 1 if a
+route's p50 or p99 latency, or the overall throughput, regressed beyond the threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import bisect
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+
+import requests
+
+DBMS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(DBMS_DIR)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from run import populate, make_row, percentile, git_revision
+from models.database import Database
+
+USERNAME = 'loadtest'
+PASSWORD = 'loadtest'
+DB_NAME = 'loadtest'
+TABLE_NAME = 'items'
+
+
+class KeyChooser:
+    def __init__(self, size: int, distribution: str = 'uniform', skew: float = 1.1):
+        """
+        Picks primary keys between 1 and size, either uniformly or following a Zipf distribution
+        where key 1 is the hottest.
+        """
+        self.size = size
+        self.distribution = distribution
+        self.cumulative = None
+        if distribution == 'zipf':
+            total = 0.0
+            self.cumulative = []
+            for rank in range(1, size + 1):
+                total += 1.0 / rank ** skew
+                self.cumulative.append(total)
+
+    def choose(self, rng: random.Random) -> int:
+        if self.cumulative is None:
+            return rng.randint(1, self.size)
+        return bisect.bisect_left(self.cumulative, rng.random() * self.cumulative[-1]) + 1
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workdir: str, port: int, table_size: int):
+    """
+    Prepare a database of table_size rows on disk and start app.py on it.
+    The rows are written in one go instead of through table_size HTTP inserts.
+    """
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        populate(Database(DB_NAME, USERNAME), TABLE_NAME, 'plain', table_size)
+    finally:
+        os.chdir(previous)
+
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    server = subprocess.Popen([sys.executable, os.path.join(DBMS_DIR, 'app.py'), '--port', str(port), '--no-debug'],
+                              cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(base_url + '/', timeout=1)
+            return server, base_url
+        except requests.ConnectionError:
+            if server.poll() is not None:
+                raise RuntimeError(f"app.py exited, see {log.name}")
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('app.py did not start in time')
+
+
+def run_client(base_url: str, token: str, args, keys: KeyChooser, next_key, deadline: float, samples: dict, seed: int):
+    rng = random.Random(seed)
+    session = requests.Session()
+    headers = {'x-access-token': f'Bearer {token}'}
+    local = {}
+    while time.time() < deadline:
+        draw = rng.random()
+        if draw < args.login_ratio:
+            route, method, payload = '/login', session.post, {'username': USERNAME, 'password': PASSWORD}
+        elif rng.random() < args.read_ratio:
+            key = str(keys.choose(rng))
+            route, method = '/select', session.post
+            payload = {'db_name': DB_NAME, 'table_name': TABLE_NAME, 'where': [['id', '=', key]]}
+        elif rng.random() < args.insert_ratio:
+            key = str(next_key())
+            route, method = '/insert_record', session.post
+            payload = {'db_name': DB_NAME, 'table_name': TABLE_NAME, 'content': make_row(int(key))}
+        else:
+            key = str(keys.choose(rng))
+            route, method = '/update_record', session.put
+            payload = {'db_name': DB_NAME, 'table_name': TABLE_NAME, 'primary_key': key,
+                       'new_record': [key, f'updated{rng.randint(0, 1 << 30)}', str(rng.randint(18, 80))]}
+        started = time.perf_counter()
+        try:
+            ok = method(base_url + route, json=payload, headers=headers, timeout=60).status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - started
+        latencies, errors = local.setdefault(route, ([], [0]))
+        latencies.append(elapsed)
+        if not ok:
+            errors[0] += 1
+    for route, (latencies, errors) in local.items():
+        samples.setdefault(route, []).append((latencies, errors[0]))
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    routes = {}
+    total = 0
+    for route, parts in samples.items():
+        latencies = [latency for part, _ in parts for latency in part]
+        errors = sum(error for _, error in parts)
+        total += len(latencies)
+        routes[route] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p90_ms': percentile(latencies, 0.90) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'max_ms': max(latencies) * 1000,
+        }
+    return {'requests': total, 'seconds': elapsed, 'throughput': total / elapsed, 'routes': routes}
+
+
+def regressions(baseline: dict, current: dict, threshold: float) -> list:
+    found = []
+    if current['throughput'] * threshold < baseline['throughput']:
+        found.append(f"throughput {baseline['throughput']:.1f} -> {current['throughput']:.1f} req/s")
+    for route, before in baseline['routes'].items():
+        after = current['routes'].get(route)
+        if after is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if after[metric] > before[metric] * threshold:
+                found.append(f"{route} {metric} {before[metric]:.2f} -> {after[metric]:.2f} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DIYDB load test')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run the workload')
+    parser.add_argument('--read-ratio', type=float, default=0.8, help='Share of non-login requests that read')
+    parser.add_argument('--insert-ratio', type=float, default=0.2, help='Share of writes that insert new keys')
+    parser.add_argument('--login-ratio', type=float, default=0.01, help='Share of requests that log in')
+    parser.add_argument('--distribution', choices=['uniform', 'zipf'], default='uniform')
+    parser.add_argument('--zipf-skew', type=float, default=1.1)
+    parser.add_argument('--table-size', type=int, default=1000)
+    parser.add_argument('--output', default='load.json')
+    parser.add_argument('--baseline', help='Result file of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Allowed slowdown ratio')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='diydb-load-')
+    server, base_url = start_server(workdir, free_port(), args.table_size)
+    try:
+        requests.post(base_url + '/register', json={'username': USERNAME, 'password': PASSWORD})
+        token = requests.post(base_url + '/login', json={'username': USERNAME, 'password': PASSWORD}).json()['token']
+        requests.post(base_url + '/select_database', json={'db_name': DB_NAME},
+                      headers={'x-access-token': f'Bearer {token}'})
+
+        keys = KeyChooser(args.table_size, args.distribution, args.zipf_skew)
+        counter = iter(range(args.table_size + 1, sys.maxsize))
+        counter_lock = threading.Lock()
+
+        def next_key():
+            with counter_lock:
+                return next(counter)
+
+        samples = {}
+        started = time.time()
+        deadline = started + args.duration
+        clients = [threading.Thread(target=run_client,
+                                    args=(base_url, token, args, keys, next_key, deadline, samples, seed))
+                   for seed in range(args.clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        report = summarize(samples, time.time() - started)
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report['meta'] = {'created_at': datetime.utcnow().isoformat() + 'Z', 'git_revision': git_revision(),
+                      'cpu_count': os.cpu_count(), 'args': vars(args)}
+    print(f"{report['requests']} requests in {report['seconds']:.1f}s, {report['throughput']:.1f} req/s")
+    for route, stats in sorted(report['routes'].items()):
+        print(f"{route:16} {stats['requests']:>7} req {stats['errors']:>5} err  p50 {stats['p50_ms']:9.2f} ms  "
+              f"p90 {stats['p90_ms']:9.2f} ms  p99 {stats['p99_ms']:9.2f} ms")
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(json.load(file), report, args.threshold)
+        for line in found:
+            print(f"REGRESSED {line}")
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+# DBMS/benchmarks/run.py
+"""
+Benchmarks for the storage layer (Table, Database) and the Flask routes.
+
+Run from the DBMS directory:
+    python benchmarks/run.py --sizes 1000,10000,100000 --output bench.json
+
+Results are written as JSON so two runs can be diffed with benchmarks/compare.py.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+DBMS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(DBMS_DIR)
+
+from models.database import Database
+
+SCHEMAS = {
+    'plain': (['id', 'name', 'age'], ['int', 'str', 'int'], {'id': ['NOT NULL']}),
+    'unique': (['id', 'email', 'age'], ['int', 'str', 'int'], {'id': ['NOT NULL'], 'email': ['UNIQUE']}),
+}
+# rows per insert_many call
+BATCH_ROWS = 100
+
+
+def make_row(i: int) -> list:
+    return [str(i), f'user{i}@example.com', str(18 + i % 60)]
+
+
+def percentile(samples: list, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(suite: str, operation: str, schema: str, size: int, samples: list) -> dict:
+    total = sum(samples)
+    return {
+        'suite': suite,
+        'operation': operation,
+        'schema': schema,
+        'size': size,
+        'ops': len(samples),
+        'mean_ms': total / len(samples) * 1000,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'max_ms': max(samples) * 1000,
+        'ops_per_sec': len(samples) / total if total else None,
+    }
+
+
+def timed(operation, count: int) -> list:
+    samples = []
+    for i in range(count):
+        started = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def populate(db: Database, table_name: str, schema: str, size: int):
+    """
+    Create a table and load it with size rows in one save, instead of one save per insert.
+    """
+    columns, datatypes, constraints = SCHEMAS[schema]
+    db.create_table(table_name, columns, datatypes, constraints)
+    table = db.tables[table_name]
+    table.records = {str(i): make_row(i) for i in range(1, size + 1)}
+    table.primary_key_values = {str(i) for i in range(1, size + 1)}
+    table.record_id_counter = size + 1
+    table.index.build(table.records)
+    table.save_data()
+    db.save_metadata()
+    return table
+
+
+def bench_storage(size: int, schema: str, ops: int) -> list:
+    results = []
+    db = Database(f'bench_{schema}_{size}', 'bench')
+
+    table = populate(db, 'table_layer', schema, size)
+    fresh = iter(range(size + 1, size + 1 + ops))
+    results.append(summarize('table', 'insert_record', schema, size,
+                             timed(lambda i: table.insert_record(make_row(next(fresh))), ops)))
+    results.append(summarize('table', 'update_record', schema, size,
+                             timed(lambda i: table.update_record(str(i + 1), [str(i + 1), f'changed{i}@x', '40']), ops)))
+    results.append(summarize('table', 'delete_record', schema, size,
+                             timed(lambda i: table.delete_record(str(size - i)), ops)))
+    results.append(summarize('table', 'select', schema, size, timed(lambda i: table.select(), ops)))
+    # the per-row cost of checking datatypes and constraints, without storing or saving anything
+    results.append(summarize('table', 'validate_row', schema, size,
+                             timed(lambda i: table.validate_row(make_row(size + ops + i + 1)), ops)))
+
+    populate(db, 'database_layer', schema, size)
+    fresh = iter(range(size + 1, size + 1 + ops))
+    results.append(summarize('database', 'insert', schema, size,
+                             timed(lambda i: db.insert('database_layer', make_row(next(fresh))), ops)))
+    results.append(summarize('database', 'update', schema, size,
+                             timed(lambda i: db.update('database_layer', str(i + 1), [str(i + 1), f'c{i}@x', '40']), ops)))
+    results.append(summarize('database', 'delete', schema, size,
+                             timed(lambda i: db.delete('database_layer', str(size - i)), ops)))
+
+    def insert_batch(i):
+        start = size + ops + 1 + i * BATCH_ROWS
+        db.insert_many('database_layer', [make_row(n) for n in range(start, start + BATCH_ROWS)])
+
+    results.append(summarize('database', 'insert_many', schema, size, timed(insert_batch, ops)))
+    return results
+
+
+def bench_routes(size: int, schema: str, ops: int) -> list:
+    import app as app_module
+
+    app_module.databases.clear()
+    app_module.auth.users = []
+    client = app_module.app.test_client()
+    client.post('/register', json={'username': 'bench', 'password': 'bench'})
+
+    results = [summarize('routes', 'login', schema, size, timed(
+        lambda i: client.post('/login', json={'username': 'bench', 'password': 'bench'}), min(ops, 5)))]
+    token = client.post('/login', json={'username': 'bench', 'password': 'bench'}).json['token']
+    headers = {'x-access-token': f'Bearer {token}'}
+    db_name = f'routes_{schema}_{size}'
+    client.post('/select_database', json={'db_name': db_name}, headers=headers)
+    populate(app_module.databases[db_name], 'items', schema, size)
+    request = {'db_name': db_name, 'table_name': 'items'}
+
+    def select_uncached(i):
+        app_module.result_cache.invalidate(db_name, 'items')
+        client.post('/select', json=request, headers=headers)
+
+    fresh = iter(range(size + 1, size + 1 + ops))
+    results.append(summarize('routes', 'select_uncached', schema, size, timed(select_uncached, ops)))
+    results.append(summarize('routes', 'select_cached', schema, size, timed(
+        lambda i: client.post('/select', json=request, headers=headers), ops)))
+    results.append(summarize('routes', 'insert_record', schema, size, timed(
+        lambda i: client.post('/insert_record', json=dict(request, content=make_row(next(fresh))), headers=headers), ops)))
+    results.append(summarize('routes', 'update_record', schema, size, timed(
+        lambda i: client.put('/update_record', json=dict(request, primary_key=str(i + 1),
+                                                         new_record=[str(i + 1), f'r{i}@x', '41']), headers=headers), ops)))
+    results.append(summarize('routes', 'delete', schema, size, timed(
+        lambda i: client.delete('/delete', json=dict(request, primary_key=str(size - i)), headers=headers), ops)))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=DBMS_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DIYDB benchmarks')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma separated table sizes, e.g. 1000,10000,100000,1000000')
+    parser.add_argument('--schemas', default=','.join(SCHEMAS), help='Comma separated schemas: plain, unique')
+    parser.add_argument('--suites', default='storage,routes', help='Comma separated suites: storage, routes')
+    parser.add_argument('--ops', type=int, default=50, help='Operations per benchmark at 1k rows')
+    parser.add_argument('--output', default='bench.json', help='Where to write the JSON results')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix='diydb-bench-')
+    os.chdir(workdir)
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            # every write rewrites the table file, so large tables get fewer repetitions
+            ops = max(3, min(args.ops, args.ops * 1000 // size))
+            for schema in args.schemas.split(','):
+                for suite in args.suites.split(','):
+                    bench = bench_storage if suite == 'storage' else bench_routes
+                    for result in bench(size, schema, ops):
+                        results.append(result)
+                        print(f"{result['suite']:8} {result['operation']:16} {schema:6} {size:>8} "
+                              f"p50 {result['p50_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat() + 'Z',
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=4)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# cache.py
+import os
+import json
+import threading
+from collections import OrderedDict
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('DIYDB_RESULT_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        """
+        LRU cache of serialized read responses, bounded by the total size of the stored bodies.
+
+        Entries are keyed by (db_name, table_name, normalized request) and are dropped as soon
+        as the owning Database reports a write to that table.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.table_keys = {}
+        self.generations = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(db_name: str, table_name: str, request_data: dict) -> tuple:
+        """
+        Build a cache key from a request body.
+        The request is normalized so that key order and whitespace do not matter.
+        """
+        params = {k: v for k, v in (request_data or {}).items() if k not in ('db_name', 'table_name')}
+        return (db_name, table_name, json.dumps(params, sort_keys=True, separators=(',', ':')))
+
+    def generation(self, db_name: str, table_name: str) -> int:
+        """
+        Return the write generation of a table.
+        A body computed under one generation is only stored if no write happened meanwhile.
+        """
+        with self.lock:
+            return self.generations.get((db_name, table_name), 0)
+
+    def get(self, key: tuple):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: tuple, body: bytes, generation: int) -> bool:
+        size = len(body)
+        if size > self.max_bytes:
+            return False
+        table = key[:2]
+        with self.lock:
+            if self.generations.get(table, 0) != generation:
+                return False
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = body
+            self.table_keys.setdefault(table, set()).add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, db_name: str, table_name: str, operation: str = None):
+        """
+        Drop every cached response of a table. Used as a Database change listener.
+        """
+        table = (db_name, table_name)
+        with self.lock:
+            self.generations[table] = self.generations.get(table, 0) + 1
+            for key in self.table_keys.pop(table, ()):
+                body = self.entries.pop(key, None)
+                if body is not None:
+                    self.size -= len(body)
+                    self.invalidations += 1
+
+    def _remove(self, key: tuple):
+        body = self.entries.pop(key)
+        self.size -= len(body)
+        keys = self.table_keys.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.table_keys[key[:2]]
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,7 +1,10 @@
 import requests
 import click
+import csv
 import json
 import os
+import re
+import time
 import jwt
 
 BASE_URL = "http://127.0.0.1:5000"
@@ -37,6 +40,35 @@ def get_auth_token():
     config = get_config()
     return config.get('token')
 
+def parse_where(where):
+    """
+    Parse 'age>=21,name=bob' into [['age', '>=', '21'], ['name', '=', 'bob']], and
+    'name like bo%' into [['name', 'LIKE', 'bo%']].
+    """
+    conditions = []
+    for item in where.split(',') if where else []:
+        match = re.match(r'\s*(\w+)\s+like\s+(.*)$', item, re.IGNORECASE)
+        if match:
+            conditions.append([match.group(1), 'LIKE', match.group(2)])
+            continue
+        match = re.match(r'\s*(\w+)\s*(>=|<=|!=|=|<|>)\s*(.*)$', item)
+        if not match:
+            raise click.BadParameter(f"Invalid condition {item}")
+        conditions.append(list(match.groups()))
+    return conditions
+
+def parse_set(assignments):
+    """
+    Parse 'tier=gold,age=30' into {'tier': 'gold', 'age': '30'}.
+    """
+    values = {}
+    for item in assignments.split(',') if assignments else []:
+        column, sep, value = item.partition('=')
+        if not sep or not column.strip():
+            raise click.BadParameter(f"Invalid assignment {item}")
+        values[column.strip()] = value.strip()
+    return values
+
 @click.group()
 def cli():
     pass
@@ -92,7 +124,11 @@ def select_db(db_name):
 @click.argument('columns')   
 @click.argument('datatypes')
 @click.option('--constraints', default='', help='Constraints for the columns')
-def create_table(table_name, columns, datatypes, constraints):
+@click.option('--partitions', default=1, type=int, help='Spread rows over this many files by primary key hash')
+@click.option('--encoding', type=click.Choice(['json', 'block']), help='On-disk format; block is compressed')
+@click.option('--ttl-column', help='Expire rows at the time, in seconds since the epoch, held in this column')
+@click.option('--ttl-seconds', type=float, help='Rows inserted without an expiry time expire this many seconds later')
+def create_table(table_name, columns, datatypes, constraints, partitions, encoding, ttl_column, ttl_seconds):
     """
     Create a new table in the selected database.
     """
@@ -119,7 +155,10 @@ def create_table(table_name, columns, datatypes, constraints):
         'table_name': table_name,
         'columns': columns,
         'datatypes': datatypes,
-        'constraints': constraint_dict
+        'constraints': constraint_dict,
+        'partitions': partitions,
+        'encoding': encoding,
+        'ttl': {'column': ttl_column, 'seconds': ttl_seconds} if ttl_column else None
     }, headers=headers)
 
     if response.status_code == 201 or response.status_code == 200:
@@ -127,6 +166,150 @@ def create_table(table_name, columns, datatypes, constraints):
     else:
         click.echo(f"Error: {response.json()['error']}")
 
+@click.command()
+@click.argument('table_name')
+@click.argument('action', type=click.Choice(['add_column', 'drop_column']))
+@click.argument('column')
+@click.option('--datatype', type=click.Choice(['int', 'str', 'float']), help='Datatype of an added column')
+@click.option('--default', default=None, help='Value of an added column in existing records')
+@click.option('--constraints', default='', help="Constraints of an added column such as 'NOT NULL|UNIQUE'")
+def alter_table(table_name, action, column, datatype, default, constraints):
+    """
+    Add or drop a column of a table in the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/alter_table', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'action': action,
+        'column': column,
+        'datatype': datatype,
+        'default': default,
+        'constraints': constraints.split('|') if constraints else []
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.argument('column')
+@click.option('--kind', type=click.Choice(['hash', 'ordered', 'prefix', 'ngram']), default='hash',
+              help="hash for equality lookups, ordered for range lookups as well, prefix for LIKE 'abc%' "
+                   "and ngram for LIKE '%abc%' on str columns")
+def create_index(table_name, column, kind):
+    """
+    Index a column of a table in the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/create_index', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'column': column,
+        'kind': kind
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.argument('column')
+def drop_index(table_name, column):
+    """
+    Drop the index of a column of a table in the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/drop_index', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'column': column
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+def analyze(table_name):
+    """
+    Gather the statistics of a table in the selected database anew.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/analyze', json={
+        'db_name': current_db,
+        'table_name': table_name
+    }, headers=headers)
+
+    if response.status_code == 200:
+        statistics = response.json()['statistics']
+        click.echo(f"Success: {response.json()['message']}, {statistics['rows']} rows")
+        for column, entry in statistics['columns'].items():
+            click.echo(f"  {column}: ~{entry['distinct']} distinct, min {entry['min']}, max {entry['max']}, "
+                       f"{entry['null_fraction']:.1%} null")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('mode', type=click.Choice(['sync', 'group', 'async', 'inherit']))
+@click.option('--table', 'table_name', help='Only set it for this table. inherit goes back to the database setting')
+def durability(mode, table_name):
+    """
+    Set how writes to the selected database, or one of its tables, are made durable.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/durability', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'mode': None if mode == 'inherit' else mode
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
 @click.command()
 @click.argument('table_name')
 @click.argument('content')
@@ -154,9 +337,40 @@ def insert_record(table_name, content):
     else:
         click.echo(f"Error: {response.json()['error']}")
 
+@click.command()
+@click.argument('table_name')
+@click.argument('csv_file', type=click.File('r'))
+def insert_many(table_name, csv_file):
+    """
+    Insert every row of a CSV file (without a header) into a table in the selected database.
+    Either all rows are inserted or none is.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    rows = [row for row in csv.reader(csv_file) if row]
+    response = requests.post(f'{BASE_URL}/insert_many', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'rows': rows
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
 @click.command()
 @click.argument("table_name")
-def select(table_name):
+@click.option('--where', default='', help="Filter such as 'age>=21,name=bob'")
+@click.option('--order-by', default='', help="Sort keys such as 'age desc,name'")
+@click.option('--limit', type=int, help='Return at most this many records')
+def select(table_name, where, order_by, limit):
     """
     Select records from a table in the selected database.
     """
@@ -168,16 +382,178 @@ def select(table_name):
     token = get_auth_token()
     headers = {'x-access-token': f'Bearer {token}'}
 
-    response = requests.post(f'{BASE_URL}/select', json={
+    request_data = {
         'db_name': current_db,
         'table_name': table_name
-    }, headers=headers)
+    }
+    if where:
+        request_data['where'] = parse_where(where)
+    if order_by:
+        request_data['order_by'] = [key.strip() for key in order_by.split(',')]
+    if limit is not None:
+        request_data['limit'] = limit
+    response = requests.post(f'{BASE_URL}/select', json=request_data, headers=headers)
     
     if response.status_code == 200 or response.status_code == 201:
         click.echo(f"Records: {response.json()['records']}")
     else:
         click.echo(f"Error: {response.json()['error']}")
 
+@click.command()
+@click.argument('table_name')
+@click.option('--where', default='', help="Filter such as 'age>=21,name like bo%'")
+def explain(table_name, where):
+    """
+    Run a query of a table in the selected database and show how it was answered.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/explain', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'where': parse_where(where)
+    }, headers=headers)
+
+    if response.status_code == 200:
+        plan = response.json()['plan']
+        access = plan['access'] if plan['index_condition'] is None else \
+            f"{plan['access']} on {' '.join(map(str, plan['index_condition']))}"
+        click.echo(f"{plan['table']}: {access}, {plan['rows']} rows, estimated {plan['estimated_rows']}, "
+                   f"actual {plan['actual_rows']} in {plan['seconds'] * 1000:.2f} ms")
+        for condition in plan['conditions']:
+            click.echo(f"  {' '.join(map(str, condition['condition']))}: estimated {condition['estimated_rows']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.argument('function', type=click.Choice(['count', 'sum', 'min', 'max', 'avg']))
+@click.argument('column', required=False)
+@click.option('--where', default='', help="Filter such as 'age>=21,name=bob'")
+def aggregate(table_name, function, column, where):
+    """
+    Aggregate a column of a table in the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/aggregate', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'function': function,
+        'column': column,
+        'where': parse_where(where)
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"{function}: {response.json()['value']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('left')
+@click.argument('right')
+@click.argument('on')
+@click.option('--how', type=click.Choice(['inner', 'left']), default='inner', help='Join type')
+@click.option('--left-where', default='', help="Filter on the left table such as 'age>=21'")
+@click.option('--right-where', default='', help="Filter on the right table such as 'status=paid'")
+def join(left, right, on, how, left_where, right_where):
+    """
+    Join two tables in the selected database. ON is a column both tables have,
+    or 'left_column=right_column'.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/join', json={
+        'db_name': current_db,
+        'left': left,
+        'right': right,
+        'on': on.split('=', 1) if '=' in on else on,
+        'how': how,
+        'left_where': parse_where(left_where),
+        'right_where': parse_where(right_where)
+    }, headers=headers)
+
+    if response.status_code == 200:
+        result = response.json()
+        click.echo(f"Columns: {result['columns']}")
+        for row in result['rows']:
+            click.echo(row)
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.argument('assignments')
+@click.option('--where', default='', help="Filter such as 'age>=21,name=bob'. Without one every record is updated")
+def update_where(table_name, assignments, where):
+    """
+    Update every matching record of a table in the selected database.
+    ASSIGNMENTS are the new values such as 'tier=gold,age=30'.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.put(f'{BASE_URL}/update_where', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'where': parse_where(where),
+        'set': parse_set(assignments)
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.option('--where', default='', help="Filter such as 'age>=21,name=bob'. Without one every record is deleted")
+def delete_where(table_name, where):
+    """
+    Delete every matching record of a table in the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.delete(f'{BASE_URL}/delete_where', json={
+        'db_name': current_db,
+        'table_name': table_name,
+        'where': parse_where(where)
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
 @click.command()
 @click.argument('table_name')
 @click.argument('primary_key')
@@ -257,16 +633,133 @@ def drop_table(table_name):
     else:
         click.echo(f"Error: {response.json()['error']}")        
 
+@click.command()
+@click.option('--list', 'list_only', is_flag=True, help='List existing snapshots instead of taking one')
+def snapshot(list_only):
+    """
+    Take a consistent snapshot of the selected database.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    if list_only:
+        response = requests.get(f'{BASE_URL}/snapshot', params={'db_name': current_db}, headers=headers)
+    else:
+        response = requests.post(f'{BASE_URL}/snapshot', json={'db_name': current_db}, headers=headers)
+
+    if response.status_code == 200:
+        for manifest in response.json()['snapshots']:
+            click.echo(f"{manifest['snapshot_id']} {manifest['created_at']} tables: {', '.join(manifest['tables'])}")
+    elif response.status_code == 201:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('snapshot_id')
+def restore(snapshot_id):
+    """
+    Restore the selected database from a snapshot.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+
+    response = requests.post(f'{BASE_URL}/restore', json={
+        'db_name': current_db,
+        'snapshot_id': snapshot_id
+    }, headers=headers)
+
+    if response.status_code == 200:
+        click.echo(f"Success: {response.json()['message']}")
+    else:
+        click.echo(f"Error: {response.json()['error']}")
+
+@click.command()
+@click.argument('table_name')
+@click.option('--since', type=int, help='Sequence number to start after. By default only new changes are shown')
+def watch(table_name, since):
+    """
+    Print the inserts, updates and deletes of a table in the selected database as they happen.
+    """
+    current_db = get_current_db()
+    if current_db is None:
+        click.echo("No database selected. Use the select_db command first.")
+        return
+
+    token = get_auth_token()
+    headers = {'x-access-token': f'Bearer {token}'}
+    params = {'db_name': current_db, 'table_name': table_name}
+    if since is not None:
+        params['since'] = since
+
+    while True:
+        try:
+            response = requests.get(f'{BASE_URL}/changes', params=params, headers=headers, stream=True)
+            if response.status_code != 200:
+                click.echo(f"Error: {response.json()['error']}")
+                return
+            event = {}
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    field, _, value = line.partition(': ')
+                    event[field] = value
+                    continue
+                if event.get('event') == 'epoch':
+                    head = json.loads(event['data'])
+                    params['epoch'] = head['epoch']
+                    params.setdefault('since', head['head'])
+                elif event.get('event') == 'gone':
+                    click.echo("Error: Fell too far behind, read the table again")
+                    return
+                elif event.get('event') == 'change':
+                    change = json.loads(event['data'])
+                    details = {key: value for key, value in change.items()
+                               if key not in ('seq', 'ts', 'table_name', 'operation')}
+                    click.echo(f"{change['seq']} {change['operation']} {json.dumps(details)}")
+                if 'id' in event:
+                    params['since'] = int(event['id'])
+                event = {}
+        except requests.exceptions.ConnectionError:
+            # the server restarted or dropped the stream; resume where we left off
+            click.echo("Connection lost, reconnecting...")
+            time.sleep(1)
+        except KeyboardInterrupt:
+            return
+
 # Add commands to the cli group
 cli.add_command(login)
 cli.add_command(register)
 cli.add_command(select_db)
 cli.add_command(create_table)
+cli.add_command(alter_table)
+cli.add_command(create_index)
+cli.add_command(drop_index)
+cli.add_command(analyze)
+cli.add_command(durability)
 cli.add_command(insert_record)
+cli.add_command(insert_many)
 cli.add_command(select)
+cli.add_command(aggregate)
+cli.add_command(explain)
+cli.add_command(join)
 cli.add_command(update_record)
 cli.add_command(delete_record)
+cli.add_command(update_where)
+cli.add_command(delete_where)
 cli.add_command(drop_table)
+cli.add_command(snapshot)
+cli.add_command(restore)
+cli.add_command(watch)
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,89 @@
+# DBMS/locking.py
+
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # without fcntl (Windows) only a single server process is supported
+    fcntl = None
+
+# run as one of several server processes sharing the databases directory, e.g. gunicorn workers
+MULTIPROCESS = os.environ.get('DIYDB_MULTIPROCESS', '').lower() in ('1', 'true', 'yes')
+
+
+def file_signature(path: str):
+    """
+    Return what changes whenever a file is replaced or rewritten, or None if it doesn't exist.
+    Files are replaced by renaming a new one over them, which gives them a new inode.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class ProcessLock:
+    def __init__(self, path: str, on_acquire=None):
+        """
+        A reentrant lock that excludes the other threads of this process like an RLock, and other
+        processes through an exclusive fcntl lock on the file at path, taken when a thread first
+        acquires it and released when that thread is done.
+
+        on_acquire is called whenever the file lock was just taken, before anything else runs
+        under the lock, so the holder can first pick up what other processes wrote.
+        """
+        if fcntl is None:
+            raise RuntimeError("Sharing databases between processes needs fcntl, which this platform lacks")
+        self.path = path
+        self.on_acquire = on_acquire
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+        self.pid = None
+
+    def file(self) -> int:
+        # a descriptor inherited through fork shares its lock with the parent, so each process opens its own
+        if self.fd is None or self.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.pid = os.getpid()
+        return self.fd
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self.lock.acquire(blocking):
+            return False
+        if self.depth:
+            self.depth += 1
+            return True
+        try:
+            fcntl.flock(self.file(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock.release()
+            return False
+        except BaseException:
+            self.lock.release()
+            raise
+        self.depth = 1
+        if self.on_acquire is not None:
+            try:
+                self.on_acquire()
+            except BaseException:
+                self.release()
+                raise
+        return True
+
+    def release(self):
+        self.depth -= 1
+        if not self.depth:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,153 @@
+# metrics.py
+import time
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][position] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for labels, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket = format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                    lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+                bucket = format_labels(self.labelnames, labels, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{bucket} {count}')
+                lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}')
+                lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        """
+        Process-wide collection of metrics, rendered in the Prometheus text format.
+
+        Recording takes one uncontended lock and a few dict operations, so the hooks on the
+        hot paths stay on permanently. Collectors are callables run at scrape time for values
+        that are cheaper to read on demand than to track, such as cache sizes.
+        """
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, help, labelnames, buckets))
+
+    def _register(self, name: str, factory):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = factory()
+            return self.metrics[name]
+
+    def add_collector(self, collector):
+        """
+        Register a callable returning (name, help, type, [(labels dict, value)]) tuples.
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, help, kind, samples in collector():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{format_labels(tuple(labels), tuple(labels.values()))} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+OPERATION_SECONDS = registry.histogram('diydb_operation_seconds', 'Latency of Database operations',
+                                       ('db', 'operation'))
+OPERATIONS = registry.counter('diydb_operations_total', 'Database operations by outcome', ('db', 'operation', 'status'))
+TABLE_SAVE_SECONDS = registry.histogram('diydb_table_save_seconds', 'Time spent writing table files', ('db', 'table'))
+TABLE_BYTES_WRITTEN = registry.counter('diydb_table_bytes_written_total', 'Bytes written to table files',
+                                       ('db', 'table'))
+METADATA_SAVE_SECONDS = registry.histogram('diydb_metadata_save_seconds', 'Time spent writing metadata.json', ('db',))
+METADATA_BYTES_WRITTEN = registry.counter('diydb_metadata_bytes_written_total', 'Bytes written to metadata.json',
+                                          ('db',))
+CONSTRAINT_CHECK_SECONDS = registry.histogram('diydb_constraint_check_seconds',
+                                              'Time spent validating rows against the schema and constraints',
+                                              ('db', 'table', 'operation'))
+BLOOM_CHECKS = registry.counter('diydb_bloom_checks_total',
+                                'Bloom filter lookups on unique columns; negative ones skip the duplicate check',
+                                ('db', 'table', 'result'))
+AUTH_SECONDS = registry.histogram('diydb_auth_seconds', 'Latency of password hashing and token handling',
+                                  ('operation',))
+HTTP_REQUEST_SECONDS = registry.histogram('diydb_http_request_seconds', 'Latency of HTTP requests',
+                                          ('route', 'method', 'status'))
@@ -0,0 +1,109 @@
+#DBMS/models/bloom.py
+
+import os
+import math
+import json
+import base64
+import hashlib
+
+from durability import write_file
+
+BLOOM_ERROR_RATE = float(os.environ.get('DIYDB_BLOOM_ERROR_RATE', 0.01))
+BLOOM_MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = BLOOM_ERROR_RATE):
+        """
+        A Bloom filter over the values of one column.
+
+        might_contain() returning False means the value is definitely not in the column; True
+        means it may be and has to be confirmed. Values are never removed, so deleted and
+        overwritten values stay as false positives until the filter is rebuilt.
+
+        Parameters:
+        capacity (int): The number of values the filter is sized for at error_rate.
+        error_rate (float, optional): The false positive rate at capacity.
+        """
+        self.capacity = max(int(capacity), BLOOM_MIN_CAPACITY)
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        # double hashing: k positions from the two halves of a single digest
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self.positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, value) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self.positions(value))
+
+    def saturated(self) -> bool:
+        return self.count > self.capacity
+
+    def to_dict(self) -> dict:
+        return {'capacity': self.capacity, 'error_rate': self.error_rate, 'count': self.count,
+                'bits': base64.b64encode(bytes(self.bits)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'BloomFilter':
+        bloom = cls(data['capacity'], data['error_rate'])
+        bits = base64.b64decode(data['bits'])
+        if len(bits) != len(bloom.bits):
+            raise ValueError('Bloom filter size does not match its capacity')
+        bloom.bits = bytearray(bits)
+        bloom.count = data['count']
+        return bloom
+
+
+def build_filters(records: dict, columns: dict) -> dict:
+    """
+    Build one filter per column from the rows of a table.
+
+    Parameters:
+    records (dict): The records of the table.
+    columns (dict): Column name -> position of the columns to filter.
+
+    Returns:
+    dict: Column name -> BloomFilter, sized for twice the current row count.
+    """
+    filters = {column: BloomFilter(2 * len(records)) for column in columns}
+    for record in records.values():
+        for column, position in columns.items():
+            filters[column].add(record[position])
+    return filters
+
+
+def save_filters(path: str, filters: dict, files: dict):
+    """
+    Write the filters of a table, with the checksums of the data files they describe.
+    """
+    data = json.dumps({'files': files, 'filters': {column: bloom.to_dict() for column, bloom in filters.items()}})
+    return write_file(path, data)
+
+
+def load_filters(path: str, columns: dict, files: dict):
+    """
+    Load the filters of a table, or return None when they can't be trusted: the file is
+    missing or damaged, covers other columns, or was written for different data files.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as file:
+            data = json.load(file)
+        if data.get('files') != files or set(data['filters']) != set(columns):
+            return None
+        return {column: BloomFilter.from_dict(bloom) for column, bloom in data['filters'].items()}
+    except (ValueError, KeyError, TypeError):
+        return None
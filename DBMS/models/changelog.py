@@ -0,0 +1,168 @@
+#DBMS/models/changelog.py
+
+import os
+import json
+import time
+import uuid
+import shutil
+import weakref
+import threading
+from itertools import islice
+from collections import deque
+
+CHANGELOG_BUFFER_SIZE = int(os.environ.get('DIYDB_CHANGELOG_BUFFER', 10000))
+# changes written to each file of the on-disk log, and how many of the newest files are kept
+CHANGELOG_SEGMENT_ENTRIES = int(os.environ.get('DIYDB_CHANGELOG_SEGMENT', 10000))
+CHANGELOG_SEGMENTS = int(os.environ.get('DIYDB_CHANGELOG_SEGMENTS', 16))
+# a set-based write is shipped as one entry, and streamed to subscribers as one event per row
+ROW_OPERATIONS = {'insert_many': 'insert', 'update_where': 'update', 'delete_where': 'delete'}
+# changes after which a follower can't carry on applying entries, and is sent a new image of the database
+RESET_OPERATIONS = ('compact', 'restore')
+# the logs of this process, whose files on disk are still in use
+live_logs = weakref.WeakSet()
+
+
+class ChangeLog:
+    def __init__(self, buffer_size: int = CHANGELOG_BUFFER_SIZE, path: str = None):
+        """
+        Ordered log of the committed changes of one database.
+
+        Every change gets the next sequence number. The most recent changes are kept in a bounded
+        ring buffer so followers can catch up from a sequence number without a full copy. The
+        epoch changes whenever the process restarts, since sequence numbers start over.
+
+        With a path, every change is also appended to files in a directory of the epoch under it,
+        each holding CHANGELOG_SEGMENT_ENTRIES changes, so subscribers further behind than the
+        ring buffer can catch up from disk. Only the newest CHANGELOG_SEGMENTS files are kept.
+        The files of earlier epochs are removed once this one writes its first change, since
+        their sequence numbers mean nothing now; those of other logs still open in this process
+        on the same path are left alone.
+        """
+        self.epoch = uuid.uuid4().hex
+        self.seq = 0
+        self.buffer = deque(maxlen=buffer_size)
+        self.condition = threading.Condition()
+        self.path = path
+        # first sequence number of every file on disk, oldest first
+        self.segments = []
+        live_logs.add(self)
+
+    def append(self, change: dict) -> int:
+        with self.condition:
+            self.seq += 1
+            entry = {'seq': self.seq, 'ts': time.time(), 'change': change}
+            self.buffer.append(entry)
+            if self.path is not None:
+                self.write_entry(entry)
+            self.condition.notify_all()
+            return self.seq
+
+    def segment_file(self, first_seq: int) -> str:
+        return os.path.join(self.path, self.epoch, f'{first_seq:012d}.log')
+
+    def remove_stale_files(self):
+        in_use = {log.epoch for log in list(live_logs) if log.path == self.path}
+        for name in os.listdir(self.path):
+            if name not in in_use:
+                stale = os.path.join(self.path, name)
+                # segments of logs before they were kept per epoch sit directly in the path
+                if os.path.isdir(stale):
+                    shutil.rmtree(stale, ignore_errors=True)
+                else:
+                    os.remove(stale)
+
+    def write_entry(self, entry: dict):
+        if not self.segments:
+            os.makedirs(os.path.join(self.path, self.epoch), exist_ok=True)
+            self.remove_stale_files()
+        if not self.segments or entry['seq'] - self.segments[-1] >= CHANGELOG_SEGMENT_ENTRIES:
+            self.segments.append(entry['seq'])
+            for first_seq in self.segments[:-CHANGELOG_SEGMENTS]:
+                if os.path.exists(self.segment_file(first_seq)):
+                    os.remove(self.segment_file(first_seq))
+            del self.segments[:-CHANGELOG_SEGMENTS]
+        # not fsynced: the log only saves subscribers a full read, the table files hold the data
+        os.makedirs(os.path.join(self.path, self.epoch), exist_ok=True)
+        with open(self.segment_file(self.segments[-1]), 'a') as file:
+            file.write(json.dumps(entry, default=str) + '\n')
+
+    def oldest_seq(self) -> int:
+        with self.condition:
+            return self.buffer[0]['seq'] if self.buffer else self.seq + 1
+
+    def since(self, seq: int):
+        """
+        Return the entries after seq, or None if some of them already left the ring buffer.
+        """
+        with self.condition:
+            if seq > self.seq:
+                return None
+            if seq == self.seq:
+                return []
+            if not self.buffer or self.buffer[0]['seq'] > seq + 1:
+                return None
+            start = seq + 1 - self.buffer[0]['seq']
+            return list(islice(self.buffer, start, None))
+
+    def read(self, seq: int, limit: int):
+        """
+        Like since(), but returns at most limit entries, reading the ones that already left the
+        ring buffer from the files on disk. Returns None if some of them are gone from there too.
+        """
+        with self.condition:
+            if seq > self.seq:
+                return None
+            if self.buffer and self.buffer[0]['seq'] <= seq + 1:
+                start = seq + 1 - self.buffer[0]['seq']
+                return list(islice(self.buffer, start, start + limit))
+            if seq == self.seq:
+                return []
+            segments = [first_seq for first_seq in self.segments if first_seq <= seq + 1][-1:] + \
+                [first_seq for first_seq in self.segments if first_seq > seq + 1]
+        entries = []
+        for first_seq in segments:
+            try:
+                with open(self.segment_file(first_seq), 'r') as file:
+                    for line in file:
+                        entry = json.loads(line)
+                        if entry['seq'] > seq:
+                            entries.append(entry)
+                            if len(entries) == limit:
+                                break
+            except FileNotFoundError:
+                # rotated away meanwhile, or the database directory was replaced by a restore
+                break
+            if len(entries) == limit:
+                break
+        if not entries or entries[0]['seq'] != seq + 1:
+            return None
+        return entries
+
+    def wait_since(self, seq: int, timeout: float = None):
+        """
+        Like since(), but blocks up to timeout seconds while there is nothing newer than seq.
+        """
+        with self.condition:
+            if self.seq == seq:
+                self.condition.wait(timeout)
+        return self.since(seq)
+
+
+def row_events(entry: dict, table_name: str = None) -> list:
+    """
+    Turn a change log entry into the events streamed to subscribers of table_name, or of every
+    table if it is None: one per row for inserts, updates and deletes, set-based ones included.
+    Schema changes, compaction (which renumbers record ids) and restores are passed on as one
+    event each, so a subscriber knows to read the table again; index changes are left out.
+    """
+    change = entry['change']
+    operation = change['operation']
+    if table_name is not None and change['table_name'] not in (table_name, None):
+        return []
+    if operation in ('create_index', 'drop_index'):
+        return []
+    base = {'seq': entry['seq'], 'ts': entry['ts'], 'table_name': change['table_name']}
+    if operation in ROW_OPERATIONS:
+        return [dict(base, operation=ROW_OPERATIONS[operation], **row) for row in change['changes']]
+    event = {key: value for key, value in change.items() if key not in ('table_name', 'records')}
+    return [dict(base, **event)]
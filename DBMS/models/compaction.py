@@ -0,0 +1,181 @@
+#DBMS/models/compaction.py
+
+import os
+import zlib
+import time
+import logging
+import threading
+from collections import deque
+
+COMPACT_DEAD_RATIO = float(os.environ.get('DIYDB_COMPACT_RATIO', 0.5))
+COMPACT_MIN_DEAD_RECORDS = int(os.environ.get('DIYDB_COMPACT_MIN_DEAD', 1000))
+COMPACT_BYTES_PER_SEC = int(os.environ.get('DIYDB_COMPACT_BYTES_PER_SEC', 16 * 1024 * 1024))
+COMPACT_MAX_RETRIES = 3
+WRITE_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger('diydb.compaction')
+
+
+class Compactor:
+    def __init__(self, dead_ratio: float = COMPACT_DEAD_RATIO, min_dead: int = COMPACT_MIN_DEAD_RECORDS,
+                 bytes_per_sec: int = COMPACT_BYTES_PER_SEC):
+        """
+        Rewrites table files without holes and renumbers record ids from 1.
+
+        The new file is built from a copy of the records while writers keep going and is only
+        swapped in, under the database lock, if the table did not change in the meantime.
+        Writes of the new file are throttled to bytes_per_sec so compaction does not starve
+        foreground I/O.
+        """
+        self.dead_ratio = dead_ratio
+        self.min_dead = min_dead
+        self.bytes_per_sec = bytes_per_sec
+        self.pending = deque()
+        self.queued = set()
+        self.history = deque(maxlen=50)
+        self.condition = threading.Condition()
+        self.worker = None
+
+    @staticmethod
+    def dead_records(table) -> int:
+        return max(table.record_id_counter - 1 - len(table.records), 0)
+
+    def dead_space_ratio(self, table) -> float:
+        allocated = table.record_id_counter - 1
+        if allocated <= 0:
+            return 0.0
+        return self.dead_records(table) / allocated
+
+    def needs_compaction(self, table) -> bool:
+        return self.dead_records(table) >= self.min_dead and self.dead_space_ratio(table) >= self.dead_ratio
+
+    def maybe_compact(self, db, table_name: str) -> bool:
+        """
+        Queue a background compaction of the table if its dead-space ratio is over the threshold.
+        """
+        table = db.tables.get(table_name)
+        if table is None or not self.needs_compaction(table):
+            return False
+        with self.condition:
+            if (db, table_name) in self.queued:
+                return False
+            self.queued.add((db, table_name))
+            self.pending.append((db, table_name))
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='diydb-compactor', daemon=True)
+                self.worker.start()
+            self.condition.notify()
+        return True
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                db, table_name = self.pending.popleft()
+            try:
+                # the reports are kept in history, for /compaction_status
+                self.compact(db, table_name)
+            except Exception:
+                logger.exception("Compaction of %s.%s failed", db.db_name, table_name)
+            finally:
+                with self.condition:
+                    self.queued.discard((db, table_name))
+
+    def compact(self, db, table_name: str) -> dict:
+        """
+        Compact a single table.
+
+        Parameters:
+        db (Database): The database owning the table.
+        table_name (str): The name of the table.
+
+        Returns:
+        dict: A report with the bytes reclaimed and the time taken.
+        """
+        started = time.perf_counter()
+        retries = 0
+        while True:
+            with db.lock:
+                table = db.tables.get(table_name)
+                if table is None:
+                    return {'success': False, 'message': f"Table {table_name} doesn't exist"}
+                snapshot = dict(table.records)
+                version = table.version
+                dead = self.dead_records(table)
+
+            records = self.renumber(snapshot)
+            # the last attempt is done while holding the lock so a busy table still converges
+            final_attempt = retries >= COMPACT_MAX_RETRIES
+            if final_attempt:
+                db.lock.acquire()
+            try:
+                if final_attempt:
+                    records = self.renumber(dict(table.records))
+                    dead = self.dead_records(table)
+                    version = table.version
+                files = table.encode_files(records)
+                for path, payload in files.items():
+                    self.write_throttled(path + '.compact', payload, throttle=not final_attempt)
+                with db.lock:
+                    if table.version != version or db.tables.get(table_name) is not table:
+                        for path in files:
+                            os.remove(path + '.compact')
+                        retries += 1
+                        continue
+                    bytes_before = sum(os.path.getsize(path) for path in table.data_files() if os.path.exists(path))
+                    for path in files:
+                        os.replace(path + '.compact', path)
+                    table.records = records
+                    table.record_id_counter = len(records) + 1
+                    table.rebuild_indexes()
+                    table.file_crcs = {os.path.basename(path): zlib.crc32(payload) for path, payload in files.items()}
+                    # every file now holds the current schema, so older schema changes can be forgotten
+                    table.file_versions = {file_name: [table.schema_version, crc] for file_name, crc in table.file_crcs.items()}
+                    table.rebuild_filters()
+                    table.version += 1
+                    db.save_metadata()
+                    bytes_after = sum(os.path.getsize(path) for path in files)
+                    # only a marker: followers are sent a new image rather than every row in the log
+                    db.notify_change(table_name, 'compact', {})
+            finally:
+                if final_attempt:
+                    db.lock.release()
+            break
+
+        elapsed = time.perf_counter() - started
+        report = {
+            'success': True,
+            'message': f"Reclaimed {bytes_before - bytes_after} bytes and {dead} record ids in {elapsed:.3f}s",
+            'db_name': db.db_name,
+            'table_name': table_name,
+            'records': len(records),
+            'record_ids_reclaimed': dead,
+            'bytes_before': bytes_before,
+            'bytes_after': bytes_after,
+            'bytes_reclaimed': bytes_before - bytes_after,
+            'seconds': elapsed,
+            'retries': retries,
+        }
+        self.history.append(report)
+        return report
+
+    @staticmethod
+    def renumber(records: dict) -> dict:
+        ordered = sorted(records.items(), key=lambda item: int(item[0]))
+        return {str(position): record for position, (_, record) in enumerate(ordered, start=1)}
+
+    def write_throttled(self, path: str, payload: bytes, throttle: bool = True):
+        started = time.perf_counter()
+        with open(path, 'wb') as file:
+            for offset in range(0, len(payload), WRITE_CHUNK_SIZE):
+                file.write(payload[offset:offset + WRITE_CHUNK_SIZE])
+                if throttle and self.bytes_per_sec > 0:
+                    ahead = (offset + WRITE_CHUNK_SIZE) / self.bytes_per_sec - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+            file.flush()
+            os.fsync(file.fileno())
+
+
+compactor = Compactor()
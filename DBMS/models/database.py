@@ -3,68 +3,401 @@
 import sys
 import os
 import json
+import time
+import zlib
+import logging
+import threading
+from functools import wraps
 current_dir = os.path.dirname(os.path.realpath(__file__))
 models_dir = os.path.abspath(os.path.join(current_dir))
 sys.path.append(models_dir)
+# the server-wide modules (metrics) live one level up
+sys.path.append(os.path.dirname(models_dir))
 
 # import Table from table.py within models
 from table import Table
+from partition import PartitionedTable
+from compaction import compactor
+from changelog import ChangeLog, RESET_OPERATIONS
+import snapshot
+from join import Join
+from encoding import ENCODINGS, TABLE_ENCODING
+from durability import DURABILITY, DURABILITY_MODES, flusher, write_file
+from memory import Tables, budget
+from expiry import REAP_BATCH_ROWS, reaper
+from metrics import OPERATION_SECONDS, OPERATIONS, METADATA_SAVE_SECONDS, METADATA_BYTES_WRITTEN
+from profiling import trace
+import locking
+from locking import ProcessLock, file_signature
+
+logger = logging.getLogger('diydb.transaction')
+
+
+def locked(method):
+    """Run a Database method while holding the database lock."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def durable(method):
+    """
+    Run a write to a table while holding the database lock, like locked. For a table with group
+    durability, only return once the flusher has written the commit; the wait is outside the
+    lock, so the commits of other threads can join the same flush.
+    """
+    @wraps(method)
+    def wrapper(self, name, *args, **kwargs):
+        with self.lock:
+            result = method(self, name, *args, **kwargs)
+            seq = self.write_seq
+        if seq > self.flushed_seq and self.durability_of(name) == 'group':
+            flusher.wait(self, seq)
+        return result
+    return wrapper
+
+
+def instrumented(operation: str):
+    """
+    Record the latency and outcome of a Database method under the given operation name,
+    and the rows it returned or wrote in the trace of the current request.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            status = 'error'
+            trace.note(operation=operation)
+            with OPERATION_SECONDS.time(self.db_name, operation):
+                try:
+                    result = method(self, *args, **kwargs)
+                    status = 'success' if isinstance(result, dict) and result.get('success') else 'failure'
+                    if status == 'success' and 'records' in result:
+                        trace.add_rows(len(result['records']))
+                    elif status == 'success' and 'changes' in result:
+                        trace.add_rows(len(result['changes']))
+                    elif status == 'success' and operation in ('insert', 'update', 'delete'):
+                        trace.add_rows(1)
+                    return result
+                finally:
+                    OPERATIONS.inc(self.db_name, operation, status)
+        return wrapper
+    return decorator
 
 class Database:
-    def __init__(self,db_name: str,owner:str):
+    def __init__(self,db_name: str,owner:str,root: str = 'databases', shared: bool = None, replica: bool = False):
         """
         Initialize a new Database.
+
+        Parameters:
+        db_name (str): The name of the database.
+        owner (str): The user owning the database.
+        root (str, optional): The directory holding all databases.
+        shared (bool, optional): Whether other processes use the same files at the same time.
+        Defaults to DIYDB_MULTIPROCESS. Writes then hold an fcntl lock on the database, first pick up
+        what other processes wrote, and are written through before the lock is released.
+        replica (bool, optional): Whether this is a copy that follows a primary's change log. Expired
+        rows are hidden on a copy but never reaped, nor tables compacted: that would renumber the
+        records the primary's changes refer to, so the primary's delete_where and compact entries do it.
         """
-        self.tables = {}
+        self.tables = Tables(self)
+        self.replica = replica
         self.db_name = db_name
         self.owner = owner
         self.transaction_log = []
-        self.db_path = os.path.join('databases',self.db_name)
+        self.listeners = []
+        self.shared = locking.MULTIPROCESS if shared is None else shared
+        # the lock file sits next to the database directory, which a snapshot restore swaps out
+        self.lock = ProcessLock(os.path.join(root, f'.{db_name}.lock'), self.sync_from_disk) \
+            if self.shared else threading.RLock()
+        self.db_path = os.path.join(root,self.db_name)
+        # sequence numbers are per process, so the change log of a shared database isn't kept on disk
+        self.changelog = ChangeLog(path=None if self.shared else os.path.join(self.db_path, 'changes'))
         self.meta_data_file = os.path.join(self.db_path,'metadata.json')
+        self.durability = DURABILITY
+        # commits are numbered so group commits can tell when a flush has covered them
+        self.write_seq = 0
+        self.flushed_seq = 0
+        self.metadata_pending = False
+        # what metadata.json and the entry of each table looked like when this process last read or wrote them
+        self.seen_signature = None
+        self.seen_tables = {}
         self.load_metadata()
     
     
-    def save_metadata(self):
-        metadata = {'owner': self.owner,'tables': {}}
-        for table_name,table in self.tables.items():
+    def build_metadata(self) -> dict:
+        metadata = {'owner': self.owner, 'durability': self.durability, 'tables': {}}
+        resident = self.tables.resident()
+        stored = None
+        for table_name in self.tables:
+            table = resident.get(table_name)
+            if table is None:
+                # an evicted table hasn't changed since it was written, so its entry on disk is current
+                stored = stored or self.read_metadata()['tables']
+                metadata['tables'][table_name] = stored[table_name]
+                continue
             metadata['tables'][table_name] = {
                 'name' : table_name,
                 'columns': table.columns,
                 'primary_key_value':list(table.primary_key_values),
                 'datatype':[dtype.__name__ for dtype in table.column_datatype.values()],
-                'constraint': table.column_constraints
-                
+                'constraint': table.column_constraints,
+                'partitions': getattr(table, 'partitions', 1),
+                'encoding': table.encoding,
+                'schema_version': table.schema_version,
+                'schema_history': table.pending_history(),
+                'file_versions': table.file_versions,
+                'indexes': {column: secondary.kind for column, secondary in table.indexes.items()},
+                'durability': table.durability,
+                'ttl': table.ttl,
+                'statistics': table.stats.to_dict() if table.stats is not None else None,
             }
+        return metadata
+
+    def save_metadata(self, table_name: str = None):
+        """
+        Commit metadata.json after a change to the database.
+
+        Parameters:
+        table_name (str, optional): The table a row write went to. If its durability isn't sync,
+        the table and metadata.json are left to the flusher. Anything else, such as a schema
+        change, is written at once, after every table still waiting for the flusher.
+        """
+        self.write_seq += 1
+        self.metadata_pending = True
+        mode = self.durability_of(table_name) if table_name is not None else 'sync'
+        if mode != 'sync':
+            flusher.schedule(self, mode)
+            return None
+        return self.flush()
+
+    @locked
+    def flush(self):
+        """
+        Write every table with writes the flusher hasn't made yet, then metadata.json, which
+        records the checksums of the files just written.
+        """
+        for table in self.tables.resident().values():
+            if table.pending:
+                table.write_data()
+        error = None
+        if self.metadata_pending:
+            error = self.write_metadata()
+            self.metadata_pending = error is not None
+        self.flushed_seq = self.write_seq
+        return error
+
+    def write_metadata(self):
+        metadata = self.build_metadata()
         try: 
-            os.makedirs(self.db_path,exist_ok=True)
-            with open(self.meta_data_file,'w') as file:
-                json.dump(metadata,file,indent=4) 
+            with METADATA_SAVE_SECONDS.time(self.db_name):
+                with trace.phase('serialization'):
+                    data = json.dumps(metadata,indent=4)
+                with trace.phase('storage'):
+                    os.makedirs(self.db_path,exist_ok=True)
+                    write_file(self.meta_data_file, data)
+            METADATA_BYTES_WRITTEN.inc(self.db_name, amount=len(data))
+            if self.shared:
+                self.remember_metadata(metadata)
         except IOError as e:
             return f'error occured while saving metadata {e}'           
-             
+
+    def durability_of(self, table_name: str) -> str:
+        if self.shared:
+            # other processes only see a write once it is in the files
+            return 'sync'
+        table = self.tables.get(table_name)
+        return table.durability if table is not None and table.durability else self.durability
+
+    def write_mode_of(self, table: Table) -> str:
+        return 'sync' if self.shared else table.durability or self.durability
+
+    @locked
+    def set_durability(self, mode: str, table_name: str = None) -> dict:
+        """
+        Set how writes are made durable, for the whole database or for one table.
+
+        Parameters:
+        mode (str): 'sync', 'group' or 'async'. For a table, None goes back to the database setting.
+        table_name (str, optional): The table to set it for.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if mode not in DURABILITY_MODES and not (mode is None and table_name is not None):
+            return {'success': False, 'message': f"Durability must be one of {', '.join(DURABILITY_MODES)}"}
+        if table_name is not None and table_name not in self.tables:
+            return {'success': False, 'message': f"Table {table_name} doesnt exist"}
+        if table_name is None:
+            self.durability = mode
+        else:
+            self.tables[table_name].durability = mode
+        # evicted tables pick the setting up when they are loaded again
+        for table in self.tables.resident().values():
+            table.write_mode = self.write_mode_of(table)
+        # writes made under the old setting are flushed along with metadata.json
+        self.save_metadata()
+        target = f"table {table_name}" if table_name is not None else f"database {self.db_name}"
+        return {'success': True, 'message': f"Durability of {target} set to {self.durability_of(table_name)}"}
+
     def load_metadata(self):
         if os.path.exists(self.meta_data_file):
             if os.path.getsize(self.meta_data_file) > 0:
-                with open(self.meta_data_file,'r') as file:
-                    metadata=json.load(file)
-                    self.owner = metadata.get('owner')
-                    for table_name,schema in metadata['tables'].items():
-                        table = Table(table_name,self.db_path)
-                        table.columns = schema['columns']
-                        table.column_datatype = {col: table.convert_datatype(dtype) for col,dtype in zip(schema['columns'],schema['datatype'])}
-                        table.primary_key_values = set(schema['primary_key_value'])
-                        table.column_constraints = schema['constraint']
-                        self.tables[table_name] = table
-                    
-                         
+                metadata = self.read_metadata()
+                self.owner = metadata.get('owner')
+                self.durability = metadata.get('durability', DURABILITY)
+                # rows are only read when a table is first looked up
+                for table_name in metadata['tables']:
+                    self.tables.register(table_name)
+                if self.shared:
+                    self.remember_metadata(metadata)
+
+    @staticmethod
+    def entry_digest(entry: dict) -> int:
+        return zlib.crc32(json.dumps(entry, sort_keys=True).encode('utf-8'))
+
+    def remember_metadata(self, metadata: dict):
+        self.seen_signature = file_signature(self.meta_data_file)
+        self.seen_tables = {name: self.entry_digest(entry) for name, entry in metadata['tables'].items()}
+
+    def refresh(self):
+        """
+        Pick up what other processes wrote to a shared database since this one last looked.
+        Checking costs a stat of metadata.json; only when it changed is the lock taken, which
+        is what reads the changes in.
+        """
+        if self.shared and file_signature(self.meta_data_file) != self.seen_signature:
+            with self.lock:
+                pass
+
+    def sync_from_disk(self):
+        """
+        Run whenever this process takes the lock of a shared database. Tables whose entry in
+        metadata.json changed since this process last read or wrote it, which the checksums of
+        their files in it make sure of for any write of rows, are dropped from memory and loaded
+        again when next looked up; tables created or dropped elsewhere are listed or forgotten.
+        """
+        signature = file_signature(self.meta_data_file)
+        if signature is None or signature == self.seen_signature:
+            return
+        metadata = self.read_metadata()
+        self.owner = metadata.get('owner')
+        self.durability = metadata.get('durability', DURABILITY)
+        digests = {name: self.entry_digest(entry) for name, entry in metadata['tables'].items()}
+        changed = [name for name in self.tables if digests.get(name) != self.seen_tables.get(name)]
+        for name in changed:
+            if name in digests:
+                self.tables.evict(name)
+                budget.forget(self, name)
+            else:
+                self.tables.discard(name)
+        for name in digests:
+            if name not in self.tables:
+                self.tables.register(name)
+                changed.append(name)
+        self.seen_signature = signature
+        self.seen_tables = digests
+        for name in changed:
+            self.notify_change(name, 'reload')
+
+    def read_metadata(self) -> dict:
+        with open(self.meta_data_file,'r') as file:
+            return json.load(file)
+
+    def load_table(self, name: str) -> Table:
+        """
+        Load a table from its files, as described by its entry in metadata.json.
+        """
+        table = self.read_table(name)
+        if table.expiry and not self.replica:
+            reaper.schedule(self, name, table.expiry[0][0])
+        return table
+
+    def read_table(self, name: str, schema: dict = None) -> Table:
+        """
+        Read a table from its files without listing it as in memory or counting it against the budget.
+        """
+        schema = schema or self.read_metadata()['tables'][name]
+        # the schema comes first, so rows of older schema versions are upgraded as they load
+        return self.new_table(name, schema.get('partitions', 1), schema)
+
+    def live_table(self, name: str) -> Table:
+        """
+        Look up a table, first taking out the rows whose TTL has passed so no read or write sees them.
+        That only touches the rows due, found through the expiry heap; the reaper deletes them from
+        the files in the background.
+        """
+        table = self.tables[name]
+        if table.expiry_due(time.time()):
+            with self.lock:
+                if table.expire(time.time()):
+                    # cached results may still hold the rows that were taken out
+                    self.notify_change(name, 'expire')
+                    if not self.replica:
+                        reaper.schedule(self, name, time.time())
+        return table
+
+    def schedule_reap(self, table_name: str):
+        table = self.tables.peek(table_name) if table_name is not None else None
+        if table is not None and table.expiry and not self.replica:
+            reaper.schedule(self, table_name, table.expiry[0][0])
+
+    def evict_table(self, name: str, table: Table = None) -> bool:
+        """
+        Drop the rows of a table from memory, writing it and metadata.json first if they have
+        changes the flusher hasn't written yet. The table is loaded again when next looked up.
+
+        Parameters:
+        name (str): The table to evict.
+        table (Table, optional): Only evict it if it is still this object, not one loaded since.
+
+        Returns:
+        bool: False if the table stays because the database is busy, e.g. in a transaction.
+        """
+        # don't wait for an operation in progress; the memory budget tries again later
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.transaction_log:
+                return False
+            resident = self.tables.resident().get(name)
+            if resident is not None and (table is None or resident is table):
+                if resident.pending or self.metadata_pending:
+                    self.flush()
+                self.tables.evict(name)
+            return True
+        finally:
+            self.lock.release()
+
     
+    def add_listener(self, callback):
+        """
+        Register a callback that is notified whenever a table is written to.
+
+        Parameters:
+        callback (callable): Called as callback(db_name, table_name, operation).
+        """
+        self.listeners.append(callback)
+
+    def notify_change(self, table_name, operation, change: dict = None):
+        """
+        Tell listeners that a table was written to.
+        Committed changes are also appended to the change log that replicas follow.
+        """
+        if change is not None:
+            self.changelog.append(dict(change, operation=operation, table_name=table_name))
+            self.schedule_reap(table_name)
+        for callback in self.listeners:
+            callback(self.db_name, table_name, operation)
+
     def start_transaction(self):
         
         self.transaction_log = []
         
     def log_operation(self,operation,table_name,record_id=None,record = None, old_pri_key = None, new_pri_key = None):
         
-        print(f"Logging operation: {operation} for table: {table_name}, record_id: {record_id}")
+        logger.debug("Logging operation: %s for table: %s, record_id: %s", operation, table_name, record_id)
         self.transaction_log.append({
             
             "operation":operation,
@@ -83,30 +416,57 @@ class Database:
     def rollback_transaction(self):
         #print("inside rollback")
         #print(self.transaction_log)
+        # the log of a set-based write can hold many rows, so every table is saved once at the end
+        touched = []
         for log in reversed(self.transaction_log):
+            table = self.tables[log['table_name']]
+            if log['table_name'] not in touched:
+                touched.append(log['table_name'])
             if log['operation']=='insert':
                 #print(self.tables[log['table_name']].records)
-                del self.tables[log['table_name']].records[log['record_id']]
+                record = table.records.pop(log['record_id'], None)
+                if record is not None:
+                    table.primary_key_values.discard(record[0])
+                    table.index.remove_index(record[0])
+                    table.index_row(log['record_id'], old=record)
                 #print(self.tables[log['table_name']].records)
-                self.tables[log['table_name']].save_data()
                 
             elif log['operation'] == 'update':
-                self.tables[log['table_name']].records[log['record_id']] = log['record']
+                table.index_row(log['record_id'], table.records.get(log['record_id']), log['record'])
+                table.records[log['record_id']] = log['record']
                 if log['old_pri_key'] is not None and log['new_pri_key'] is not None and log['old_pri_key'] != log['new_pri_key']:
-                    self.tables[log['table_name']].primary_key_values.remove(log['new_pri_key'])
-                    self.tables[log['table_name']].primary_key_values.add(log['old_pri_key'])
-                    self.save_metadata()
-                self.tables[log['table_name']].save_data()  
+                    table.primary_key_values.remove(log['new_pri_key'])
+                    table.primary_key_values.add(log['old_pri_key'])
+                    table.index.remove_index(log['new_pri_key'])
+                    table.index.insert_index(log['old_pri_key'], log['record_id'])
                  
             elif log['operation']=='delete':
-                self.tables[log['table_name']].records[log['record_id']] = log['record']
-                self.tables[log['table_name']].primary_key_values.add(log['old_pri_key'])
-                self.save_metadata()
-                self.tables[log['table_name']].save_data()
+                table.records[log['record_id']] = log['record']
+                table.index_row(log['record_id'], new=log['record'])
+                table.primary_key_values.add(log['old_pri_key'])
+                table.index.insert_index(log['old_pri_key'], log['record_id'])
                 
         self.transaction_log = []             
+        for table_name in touched:
+            self.tables[table_name].save_data()
+        if touched:
+            self.save_metadata()
+        for table_name in touched:
+            self.notify_change(table_name, 'rollback')
     
-    def create_table(self,name:str,columns:list,datatypes:list,constraints:dict = None)->str:
+    @locked
+    def new_table(self, name: str, partitions: int = 1, schema: dict = None) -> Table:
+        if partitions and partitions > 1:
+            table = PartitionedTable(name, self.db_path, partitions, schema)
+        else:
+            table = Table(name, self.db_path, schema)
+        table.write_mode = self.write_mode_of(table)
+        return table
+
+    @instrumented('create_table')
+    @locked
+    def create_table(self,name:str,columns:list,datatypes:list,constraints:dict = None,partitions:int = 1,
+                     encoding:str = None,ttl:dict = None)->str:
         """
         Create a new table in the database.
 
@@ -115,6 +475,10 @@ class Database:
         columns (list): A list of column names.
         datatypes (list): A list of data types for the columns.
         constraints (dict, optional): A dictionary of constraints for the columns.
+        partitions (int, optional): Spread the rows over this many files by primary key hash.
+        encoding (str, optional): 'json' or 'block' (compressed, type-aware). Defaults to DIYDB_TABLE_ENCODING.
+        ttl (dict, optional): Expire rows: 'column' holds their expiry time in seconds since the epoch,
+        and rows inserted without one get it 'seconds' from then, if given.
 
         Returns:
         str: A message indicating success or failure of the operation.
@@ -122,11 +486,24 @@ class Database:
         if name in self.tables:
             return {"success": False, "message": f"Table {name} already exists"}
     
-        self.tables[name] = Table(name, self.db_path)
+        if not isinstance(partitions, int) or partitions < 1:
+            return {"success": False, "message": "Partitions must be a positive integer"}
+        encoding = encoding or TABLE_ENCODING
+        if encoding not in ENCODINGS:
+            return {"success": False, "message": f"Encoding must be one of {', '.join(ENCODINGS)}"}
+        self.tables[name] = self.new_table(name, partitions)
+        self.tables[name].encoding = encoding
         result = self.tables[name].define_columns(columns, datatypes, constraints)
+        if result["success"] and ttl is not None:
+            result = self.tables[name].set_ttl(ttl)
+            if not result["success"]:
+                self.tables.pop(name)
     
         if result["success"]:
             self.save_metadata()
+            self.notify_change(name, 'create_table', {'columns': columns, 'datatypes': datatypes,
+                                                      'constraints': constraints, 'partitions': partitions,
+                                                      'encoding': encoding, 'ttl': self.tables[name].ttl})
             return {"success": True, "message": f"Table {name} created successfully"}
         else:
             return {"success": False, "message": result["message"]}
@@ -134,6 +511,8 @@ class Database:
         
                            
     
+    @instrumented('insert')
+    @durable
     def insert(self,name:str,content:list)->str:
         """
         Insert a record into a table.
@@ -149,22 +528,55 @@ class Database:
         try:
             if name in self.tables:
                 
-                message = self.tables[name].insert_record(content)
+                message = self.live_table(name).insert_record(content)
                 if message['success']:
                     record_id = message['record_id']
-                    self.log_operation('insert', name, record_id=record_id, record=content)
+                    self.log_operation('insert', name, record_id=record_id, record=message['record'])
                     
                     #print(self.transaction_log)
                     #raise Exception("Intentional Error: This is a test for rollback functionality")
-                    self.save_metadata()
+                    self.save_metadata(name)
                     self.commit_transaction()
+                    self.notify_change(name, 'insert', {'record_id': record_id, 'record': message['record']})
                     
                     return message
-                else:
-                    return {'success': False, 'message':f'Table {name} doesnt exist'}
+                return message
+            return {'success': False, 'message':f'Table {name} doesnt exist'}
         except Exception as e:
             self.rollback_transaction()
             return {"success": False, "message": f"{e}"}    
+
+    @instrumented('insert_many')
+    @durable
+    def insert_many(self, name: str, rows: list) -> dict:
+        """
+        Insert many records into a table in one transaction.
+        Every row is validated before any is stored, and the table and metadata are written once.
+
+        Parameters:
+        name (str): The name of the table.
+        rows (list): Lists of values to insert into the table.
+
+        Returns:
+        dict: A message with the number of records inserted, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        self.start_transaction()
+        try:
+            message = self.live_table(name).insert_records(rows)
+            if not message['success']:
+                return message
+            for change in message['changes']:
+                self.log_operation('insert', name, record_id=change['record_id'], record=change['record'])
+            self.save_metadata(name)
+            self.commit_transaction()
+            if message['changes']:
+                self.notify_change(name, 'insert_many', {'changes': message['changes']})
+            return message
+        except Exception as e:
+            self.rollback_transaction()
+            return {'success': False, 'message': f"Error inserting records {e}"}
                 
     def select_table(self,name:str)->list:
         
@@ -178,11 +590,121 @@ class Database:
         list: A list of records in the table or an error message if the table doesn't exist.
         """
         if name in self.tables:
-            records = self.tables[name].select()
+            records = self.live_table(name).select()
             return records
         else:
             return f"Table {name} doesnt exist"   
         
+    @instrumented('query')
+    def query(self, name: str, where: list = None):
+        """
+        Retrieve the records of a table that match a where clause.
+
+        Parameters:
+        name (str): The name of the table.
+        where (list, optional): Conditions as [column, operator, value], all of which must hold.
+
+        Returns:
+        dict: The matching records, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        try:
+            return {'success': True, 'records': self.live_table(name).query(where)}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+    @instrumented('explain')
+    def explain(self, name: str, where: list = None) -> dict:
+        """
+        Run a query of a table and report how it was answered: the access path, and the rows the
+        table statistics estimated it to match next to the rows it actually matched.
+
+        Parameters:
+        name (str): The name of the table.
+        where (list, optional): Conditions as [column, operator, value], all of which must hold.
+
+        Returns:
+        dict: The plan, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        try:
+            return {'success': True, 'plan': self.live_table(name).explain(where)}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+    @instrumented('order')
+    def order(self, name: str, where: list = None, order_by=None, limit: int = None):
+        """
+        Retrieve the records of a table that match a where clause, sorted and/or limited.
+
+        Parameters:
+        name (str): The name of the table.
+        where (list, optional): Conditions as [column, operator, value], all of which must hold.
+        order_by (str | list, optional): Sort keys such as 'age desc', most significant first.
+        limit (int, optional): Return at most this many records.
+
+        Returns:
+        dict: The matching records as a list of [record_id, record] pairs in order, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        try:
+            return {'success': True, 'records': self.live_table(name).order(where, order_by, limit)}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+    @instrumented('join')
+    def join(self, left: str, right: str, on, how: str = 'inner', left_where: list = None, right_where: list = None):
+        """
+        Join two tables of the database on equal values of a column.
+
+        Parameters:
+        left (str): The name of the left table.
+        right (str): The name of the right table.
+        on (str | list): A column both tables have, or [left column, right column].
+        how (str, optional): 'inner' or 'left'.
+        left_where (list, optional): Conditions on the left table.
+        right_where (list, optional): Conditions on the right table.
+
+        Returns:
+        dict: The column names, the strategy used and a generator of the joined rows, each the left
+        record followed by the right one, or a message indicating failure.
+        """
+        for name in (left, right):
+            if name not in self.tables:
+                return {'success': False, 'message': f"Table {name} doesnt exist"}
+        try:
+            join = Join(self.live_table(left), self.live_table(right), on, how, left_where, right_where)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': True, 'columns': join.columns, 'strategy': join.strategy, 'rows': join.rows()}
+
+    @instrumented('aggregate')
+    def aggregate(self, name: str, function: str, column: str = None, where: list = None):
+        """
+        Compute count, sum, min, max or avg of a column of a table.
+
+        Parameters:
+        name (str): The name of the table.
+        function (str): The aggregate function.
+        column (str, optional): The column to aggregate. count without a column counts rows.
+        where (list, optional): Only aggregate the records matching these conditions.
+
+        Returns:
+        dict: The aggregate value, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        try:
+            value = self.live_table(name).aggregate(function, column, where)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': True, 'value': value}
+
+    @instrumented('update')
+    @durable
     def update(self,name:str,primary_key,new_record:list)->str:
         """
         Update a record in a table.
@@ -199,7 +721,7 @@ class Database:
         try:
             
             if name in self.tables:
-                message = self.tables[name].update_record(primary_key,new_record)
+                message = self.live_table(name).update_record(primary_key,new_record)
                 if message['success']:
                     record_id = message['record_id']
                     original_record = message['original_record']
@@ -210,14 +732,20 @@ class Database:
                     #print(self.transaction_log)
                     #raise Exception("Intentional Error: This is a test for rollback functionality")
                     
-                    self.save_metadata()
+                    self.save_metadata(name)
                     self.commit_transaction()
+                    self.notify_change(name, 'update', {'record_id': record_id, 'record': new_record,
+                                                        'old_pri_key': old_pri_key, 'new_pri_key': new_pri_key})
                     
                     return message
+                return message
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
         except Exception as e:
             self.rollback_transaction()
             return {'success': False, 'message': f"Error Updating record {e}" }
         
+    @instrumented('delete')
+    @durable
     def delete(self,name:str,primary_key)->str:
         """
         Delete a record from a table.
@@ -233,7 +761,7 @@ class Database:
         try:
             
             if name in self.tables:
-                message = self.tables[name].delete_record(primary_key)
+                message = self.live_table(name).delete_record(primary_key)
                 if message['success']:
                     record_id = message['record_id']
                     record = message['record']
@@ -242,15 +770,244 @@ class Database:
                    
                     #print(self.transaction_log)
                     #raise Exception("Intentional Error: This is a test for rollback functionality")
-                    self.save_metadata()
+                    self.save_metadata(name)
                     self.commit_transaction()
+                    self.notify_change(name, 'delete', {'record_id': record_id, 'old_pri_key': old_pri_key})
+                    compactor.maybe_compact(self, name)
                    
                     return message    
+                return message
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
         except Exception as e:
             self.rollback_transaction()
             return {'success': False, 'message':f"Error deleting record {e}. Table {name} doesn't exist "  }   
       
-    def drop_table(self, table_name: str) -> str:
+    @instrumented('update_where')
+    @durable
+    def update_where(self, name: str, where: list, assignments: dict) -> dict:
+        """
+        Update every record of a table matching a where clause in one transaction.
+        The table and metadata are written once, however many records change.
+
+        Parameters:
+        name (str): The name of the table.
+        where (list): Conditions as [column, operator, value], all of which must hold. [] matches every record.
+        assignments (dict): Column -> new value.
+
+        Returns:
+        dict: A message with the number of records updated, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        self.start_transaction()
+        try:
+            message = self.live_table(name).update_where(where, assignments)
+            if not message['success']:
+                return message
+            for change in message['changes']:
+                self.log_operation('update', name, record_id=change['record_id'], record=change['original_record'],
+                                   old_pri_key=change['old_pri_key'], new_pri_key=change['new_pri_key'])
+            self.save_metadata(name)
+            self.commit_transaction()
+            if message['changes']:
+                self.notify_change(name, 'update_where', {'changes': [
+                    {key: change[key] for key in ('record_id', 'record', 'old_pri_key', 'new_pri_key')}
+                    for change in message['changes']]})
+            return {'success': True, 'message': message['message'], 'changes': message['changes']}
+        except Exception as e:
+            self.rollback_transaction()
+            return {'success': False, 'message': f"Error Updating records {e}"}
+
+    @instrumented('delete_where')
+    @durable
+    def delete_where(self, name: str, where: list) -> dict:
+        """
+        Delete every record of a table matching a where clause in one transaction.
+        The table and metadata are written once, however many records go.
+
+        Parameters:
+        name (str): The name of the table.
+        where (list): Conditions as [column, operator, value], all of which must hold. [] matches every record.
+
+        Returns:
+        dict: A message with the number of records deleted, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        self.start_transaction()
+        try:
+            message = self.live_table(name).delete_where(where)
+            if not message['success']:
+                return message
+            for change in message['changes']:
+                self.log_operation('delete', name, change['record_id'], change['record'], change['old_pri_key'])
+            self.save_metadata(name)
+            self.commit_transaction()
+            if message['changes']:
+                self.notify_change(name, 'delete_where', {'changes': [
+                    {'record_id': change['record_id'], 'old_pri_key': change['old_pri_key']}
+                    for change in message['changes']]})
+                compactor.maybe_compact(self, name)
+            return {'success': True, 'message': message['message'], 'changes': message['changes']}
+        except Exception as e:
+            self.rollback_transaction()
+            return {'success': False, 'message': f"Error deleting records {e}"}
+
+    @instrumented('reap')
+    @durable
+    def reap(self, name: str, limit: int = REAP_BATCH_ROWS) -> dict:
+        """
+        Delete up to limit expired records of a table from its files, in one write, and ship the
+        deletes to the change log like a delete_where.
+
+        Parameters:
+        name (str): The name of the table.
+        limit (int, optional): The most records to delete.
+
+        Returns:
+        dict: The number of records deleted, how many expired ones are left to delete and the time
+        the next record expires, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        if self.replica:
+            return {'success': False, 'message': "Expired records of a replica are deleted by the primary"}
+        table = self.tables[name]
+        # not through live_table, which would take out every row due however many there are
+        table.expire(time.time(), max(limit - len(table.expired), 0))
+        taken = table.take_expired(limit)
+        if taken:
+            try:
+                table.save_data()
+                self.save_metadata(name)
+            except Exception as e:
+                table.expired.update(taken)
+                return {'success': False, 'message': f"Error deleting expired records {e}"}
+            self.notify_change(name, 'delete_where', {'changes': [
+                {'record_id': record_id, 'old_pri_key': primary_key} for record_id, primary_key in taken]})
+            compactor.maybe_compact(self, name)
+        return {'success': True, 'message': f"{len(taken)} expired records deleted", 'count': len(taken),
+                'remaining': len(table.expired),
+                'next_expiry': table.expiry[0][0] if table.expiry else None}
+
+    @instrumented('alter_table')
+    @locked
+    def add_column(self, name: str, column: str, datatype: str, default=None, constraints: list = None) -> dict:
+        """
+        ALTER TABLE ADD COLUMN. Only metadata.json is written; the data files keep their rows as they
+        are until they are next written or compacted, and rows read from them get the default.
+
+        Parameters:
+        name (str): The name of the table.
+        column (str): The name of the new column.
+        datatype (str): 'int', 'str' or 'float'.
+        default (optional): The value of the column in existing rows.
+        constraints (list, optional): Constraints of the new column.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        # rows still waiting for the flusher are written in the schema their files are recorded with
+        self.flush()
+        result = self.tables[name].add_column(column, datatype, default, constraints)
+        if result['success']:
+            self.save_metadata()
+            self.notify_change(name, 'alter_table', {'action': 'add_column', 'column': column, 'datatype': datatype,
+                                                     'default': default, 'constraints': constraints})
+        return result
+
+    @instrumented('alter_table')
+    @locked
+    def drop_column(self, name: str, column: str) -> dict:
+        """
+        ALTER TABLE DROP COLUMN. Like add_column, only metadata.json is written.
+
+        Parameters:
+        name (str): The name of the table.
+        column (str): The column to drop. The primary key can't be dropped.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        self.flush()
+        result = self.tables[name].drop_column(column)
+        if result['success']:
+            self.save_metadata()
+            self.notify_change(name, 'alter_table', {'action': 'drop_column', 'column': column})
+        return result
+
+    @instrumented('analyze')
+    @locked
+    def analyze(self, name: str) -> dict:
+        """
+        Gather the statistics of a table anew and keep them in metadata.json. Statistics are
+        otherwise gathered when a query first needs them, kept roughly current by writes, and
+        gathered again once enough rows changed, so this is only needed to refresh them early.
+
+        Parameters:
+        name (str): The name of the table.
+
+        Returns:
+        dict: The statistics, or a message indicating failure.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        stats = self.live_table(name).analyze()
+        self.save_metadata()
+        return {'success': True, 'message': f"Table {name} analyzed", 'statistics': stats.describe()}
+
+    @instrumented('create_index')
+    @locked
+    def create_index(self, name: str, column: str, kind: str = 'hash') -> dict:
+        """
+        Build a secondary index of a column. Queries, joins and set-based writes that filter on the
+        column use it from then on, and every write keeps it up to date.
+
+        Parameters:
+        name (str): The name of the table.
+        column (str): The column to index. Values don't need to be unique.
+        kind (str, optional): 'hash' for equality lookups, 'ordered' for equality and range lookups,
+        or on str columns 'prefix' for LIKE 'abc%' and 'ngram' for LIKE '%abc%'.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        result = self.tables[name].create_index(column, kind)
+        if result['success']:
+            self.save_metadata()
+            self.notify_change(name, 'create_index', {'column': column, 'kind': kind})
+        return result
+
+    @instrumented('drop_index')
+    @locked
+    def drop_index(self, name: str, column: str) -> dict:
+        """
+        Drop the secondary index of a column.
+
+        Parameters:
+        name (str): The name of the table.
+        column (str): The indexed column.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if name not in self.tables:
+            return {'success': False, 'message': f"Table {name} doesnt exist"}
+        result = self.tables[name].drop_index(column)
+        if result['success']:
+            self.save_metadata()
+            self.notify_change(name, 'drop_index', {'column': column})
+        return result
+
+    @instrumented('drop_table')
+    @locked
+    def drop_table(self, table_name: str) -> dict:
         """
         Drop an existing table from the database.
         
@@ -258,15 +1015,181 @@ class Database:
         table_name (str): The name of the table to drop.
         
         Returns:
-        str: A message indicating success or failure of the operation.
+        dict: A message indicating success or failure of the operation.
         """
         if table_name not in self.tables:
-            return f"Table {table_name} does not exist"
+            return {'success': False, 'message': f"Table {table_name} does not exist"}
 
-        del self.tables[table_name]
-        os.remove(os.path.join(self.db_path, table_name + '.json'))
+        self.tables.pop(table_name).delete_files()
         self.save_metadata()
-        return f"Table {table_name} dropped successfully"  
+        self.notify_change(table_name, 'drop_table', {})
+        return {'success': True, 'message': f"Table {table_name} dropped successfully"}
+
+    def compact_table(self, table_name: str) -> dict:
+        """
+        Rewrite a table file without holes and renumber its record ids.
+
+        Parameters:
+        table_name (str): The name of the table to compact.
+
+        Returns:
+        dict: The compaction report, including bytes reclaimed and time taken.
+        """
+        if table_name not in self.tables:
+            return {'success': False, 'message': f"Table {table_name} does not exist"}
+        return compactor.compact(self, table_name)
+
+    def create_snapshot(self) -> dict:
+        """
+        Write a consistent point-in-time copy of the database to snapshots/<db_name>/.
+
+        Writers are only blocked while the records are captured in memory, not while the
+        snapshot files are written.
+
+        Returns:
+        dict: The snapshot manifest.
+        """
+        image = snapshot.capture(self)
+        manifest = snapshot.write_snapshot(self.db_name, image)
+        return {'success': True, 'message': f"Snapshot {manifest['snapshot_id']} created", 'snapshot': manifest}
+
+    def list_snapshots(self) -> list:
+        return snapshot.list_snapshots(self.db_name)
+
+    @locked
+    def restore_snapshot(self, snapshot_id: str) -> dict:
+        """
+        Replace the contents of the database with a snapshot and reload it.
+
+        Parameters:
+        snapshot_id (str): The id of the snapshot to restore.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        try:
+            snapshot.install_snapshot(self.db_name, snapshot_id, self.db_path)
+        except (IOError, OSError) as e:
+            return {'success': False, 'message': f"Error restoring snapshot {e}"}
+        self.reload()
+        self.changelog.append({'operation': 'restore', 'table_name': None, 'snapshot_id': snapshot_id})
+        return {'success': True, 'message': f"Database {self.db_name} restored from snapshot {snapshot_id}"}
+
+    @locked
+    def reload(self):
+        """
+        Drop the in-memory tables and load the database again from its files.
+        """
+        previous_tables = list(self.tables)
+        budget.forget(self)
+        self.tables = Tables(self)
+        self.transaction_log = []
+        # writes the flusher hasn't made yet are dropped with the tables they were made to
+        self.metadata_pending = False
+        self.flushed_seq = self.write_seq
+        self.load_metadata()
+        for table_name in set(previous_tables) | set(self.tables):
+            self.notify_change(table_name, 'reload')
+
+    @locked
+    def apply_change(self, change: dict):
+        """
+        Apply a change shipped from a primary's change log to this copy of the database.
+        Record ids are taken from the primary so both copies stay identical.
+
+        Parameters:
+        change (dict): A change log entry as produced by notify_change.
+        """
+        operation = change['operation']
+        name = change['table_name']
+        if operation == 'create_table':
+            self.tables.pop(name, None)
+            self.tables[name] = self.new_table(name, change.get('partitions', 1))
+            self.tables[name].encoding = change.get('encoding', 'json')
+            self.tables[name].define_columns(change['columns'], change['datatypes'], change['constraints'])
+            self.tables[name].set_ttl(change.get('ttl'))
+            self.save_metadata()
+        elif operation == 'drop_table':
+            if name in self.tables:
+                self.tables.pop(name).delete_files()
+            self.save_metadata()
+        elif operation == 'create_index':
+            self.tables[name].create_index(change['column'], change['kind'])
+            self.save_metadata()
+        elif operation == 'drop_index':
+            self.tables[name].drop_index(change['column'])
+            self.save_metadata()
+        elif operation == 'alter_table':
+            if change['action'] == 'add_column':
+                self.tables[name].add_column(change['column'], change['datatype'], change['default'],
+                                             change['constraints'])
+            else:
+                self.tables[name].drop_column(change['column'])
+            self.save_metadata()
+        elif operation in RESET_OPERATIONS:
+            # the log only marks these; the copy is brought up to date from a new image instead
+            raise ValueError(f"A {operation} can't be applied as a change, the copy needs a new image")
+        else:
+            table = self.tables[name]
+            # set-based writes ship every row they changed in one entry, and are saved once like on the primary
+            if operation == 'insert_many':
+                for row in change['changes']:
+                    self.apply_row(table, 'insert', row)
+            elif operation == 'update_where':
+                for row in change['changes']:
+                    self.apply_row(table, 'update', row)
+            elif operation == 'delete_where':
+                for row in change['changes']:
+                    self.apply_row(table, 'delete', row)
+            else:
+                self.apply_row(table, operation, change)
+            table.save_data()
+            self.save_metadata(name)
+        self.notify_change(name, operation)
+
+    @staticmethod
+    def apply_row(table, operation: str, change: dict):
+        record_id = change.get('record_id')
+        if operation == 'insert':
+            table.records[record_id] = change['record']
+            table.index_row(record_id, new=change['record'])
+            table.primary_key_values.add(change['record'][0])
+            table.index.insert_index(change['record'][0], record_id)
+            table.record_id_counter = max(table.record_id_counter, int(record_id) + 1)
+            table.remember_unique(change['record'])
+        elif operation == 'update':
+            table.index_row(record_id, table.records.get(record_id), change['record'])
+            table.records[record_id] = change['record']
+            if change['old_pri_key'] is not None and change['old_pri_key'] != change['new_pri_key']:
+                table.primary_key_values.discard(change['old_pri_key'])
+                table.primary_key_values.add(change['new_pri_key'])
+                table.index.remove_index(change['old_pri_key'])
+                table.index.insert_index(change['new_pri_key'], record_id)
+            table.remember_unique(change['record'])
+        elif operation == 'delete':
+            # a copy takes out expired rows itself, and then only needs the delete to forget them
+            table.expired.pop(record_id, None)
+            table.index_row(record_id, old=table.records.pop(record_id, None))
+            table.primary_key_values.discard(change['old_pri_key'])
+            table.index.remove_index(change['old_pri_key'])
+
+    def compaction_status(self) -> dict:
+        tables = {}
+        for table_name, table in self.tables.resident().items():
+            tables[table_name] = {
+                'records': len(table.records),
+                'dead_records': compactor.dead_records(table),
+                'dead_space_ratio': compactor.dead_space_ratio(table),
+                'resident': True,
+            }
+        evicted = self.tables.evicted()
+        if evicted:
+            # the dead space of a table that isn't in memory is only known once it is loaded again
+            stored = self.read_metadata()['tables']
+            for table_name in evicted:
+                tables[table_name] = {'records': len(stored[table_name]['primary_key_value']), 'resident': False}
+        history = [report for report in compactor.history if report.get('db_name') == self.db_name]
+        return {'tables': tables, 'history': history}
         
 if __name__ == "__main__":
     db = Database()
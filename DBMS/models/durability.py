@@ -0,0 +1,136 @@
+#DBMS/models/durability.py
+
+import os
+import time
+import atexit
+import logging
+import threading
+
+# sync: every commit is on disk before it returns
+# group: commits wait for a flush shared with every other commit made within GROUP_COMMIT_MS
+# async: commits return at once and are flushed in the background every FLUSH_INTERVAL_MS
+DURABILITY_MODES = ('sync', 'group', 'async')
+DURABILITY = os.environ.get('DIYDB_DURABILITY', 'sync')
+GROUP_COMMIT_MS = float(os.environ.get('DIYDB_GROUP_COMMIT_MS', 10))
+FLUSH_INTERVAL_MS = float(os.environ.get('DIYDB_FLUSH_INTERVAL_MS', 1000))
+
+logger = logging.getLogger('diydb.durability')
+
+
+def write_file(path: str, data) -> int:
+    """
+    Replace a file with data, which is first written and fsynced to a temporary file next to it
+    and then renamed over it, so a crash leaves either the old or the new file, never a torn one.
+
+    Returns:
+    int: The number of bytes or characters written.
+    """
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb' if isinstance(data, bytes) else 'w') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    sync_directory(os.path.dirname(path) or '.')
+    return len(data)
+
+
+def sync_directory(path: str):
+    # the rename itself is only durable once the directory is synced; not every platform allows that
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class Flusher:
+    def __init__(self):
+        """
+        Writes the tables of databases with group or async durability in the background.
+
+        Writes to such tables only mark them dirty. Once the oldest unwritten commit of a database
+        is GROUP_COMMIT_MS (group) or FLUSH_INTERVAL_MS (async) old, everything the database has
+        pending is written in one go, so many commits cost one write of each file they touched.
+        """
+        self.due = {}
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def schedule(self, db, mode: str):
+        """
+        Flush db within the delay of mode, or sooner if it is already due sooner.
+        """
+        delay = GROUP_COMMIT_MS if mode == 'group' else FLUSH_INTERVAL_MS
+        deadline = time.monotonic() + delay / 1000
+        with self.condition:
+            if deadline < self.due.get(db, float('inf')):
+                self.due[db] = deadline
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='diydb-flusher', daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+
+    def wait(self, db, seq: int):
+        """
+        Block until the commit numbered seq of db is on disk.
+        """
+        with self.condition:
+            while db.flushed_seq < seq:
+                if db not in self.due:
+                    # nothing will flush it, e.g. the table was switched to sync in the meantime
+                    self.condition.release()
+                    try:
+                        db.flush()
+                    finally:
+                        self.condition.acquire()
+                    continue
+                self.condition.wait()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    now = time.monotonic()
+                    ready = [db for db, deadline in self.due.items() if deadline <= now]
+                    if ready:
+                        break
+                    self.condition.wait(min(self.due.values()) - now if self.due else None)
+                for db in ready:
+                    del self.due[db]
+            for db in ready:
+                self.flush(db)
+
+    def flush(self, db):
+        try:
+            db.flush()
+        except Exception:
+            # the tables stay pending, so the next flush writes them again
+            logger.exception("Flushing %s failed", db.db_name)
+        finally:
+            with self.condition:
+                self.condition.notify_all()
+
+    def flush_all(self):
+        """
+        Write everything still pending, e.g. on shutdown.
+        """
+        with self.condition:
+            ready = list(self.due)
+            self.due.clear()
+        for db in ready:
+            self.flush(db)
+
+
+flusher = Flusher()
+atexit.register(flusher.flush_all)
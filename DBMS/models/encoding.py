@@ -0,0 +1,224 @@
+#DBMS/models/encoding.py
+
+import os
+import re
+import json
+import zlib
+import struct
+
+MAGIC = b'DIYDB\x00B1'
+ENCODINGS = ('json', 'block')
+TABLE_ENCODING = os.environ.get('DIYDB_TABLE_ENCODING', 'json')
+BLOCK_ROWS = int(os.environ.get('DIYDB_BLOCK_ROWS', 4096))
+COMPRESSION_LEVEL = int(os.environ.get('DIYDB_BLOCK_COMPRESSION_LEVEL', 6))
+
+CANONICAL_INT = re.compile(r'-?(0|[1-9][0-9]*)')
+DICTIONARY_TYPES = (str, int, bool, type(None))
+
+
+def encode_varints(values) -> bytes:
+    out = bytearray()
+    for value in values:
+        while value >= 0x80:
+            out.append(value & 0x7f | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> list:
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        values.append(value)
+        value = shift = 0
+    return values
+
+
+def encode_ints(values: list) -> bytes:
+    """Delta encode a list of ints, zigzag the deltas so small negative steps stay short, and varint them."""
+    zigzags = []
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        zigzags.append(delta << 1 if delta >= 0 else (-delta << 1) - 1)
+    return encode_varints(zigzags)
+
+
+def decode_ints(data: bytes) -> list:
+    values = []
+    previous = 0
+    for zigzag in decode_varints(data):
+        previous += -((zigzag + 1) >> 1) if zigzag & 1 else zigzag >> 1
+        values.append(previous)
+    return values
+
+
+def is_int_string(value) -> bool:
+    # only strings that come back identical from str(int(value)) can be stored as ints
+    return type(value) is str and CANONICAL_INT.fullmatch(value) is not None
+
+
+def encode_column(values: list) -> tuple:
+    """
+    Pick the encoding of one column of a block.
+
+    Returns:
+    tuple: (kind, payload). Every kind decodes back to values of exactly the same type.
+    """
+    if all(type(value) is int for value in values):
+        return 'int', encode_ints(values)
+    if all(is_int_string(value) for value in values):
+        return 'intstr', encode_ints([int(value) for value in values])
+    if all(type(value) in DICTIONARY_TYPES for value in values):
+        # keyed by type as well, since 1, True and '1' must not share an entry
+        codes = {}
+        for value in values:
+            codes.setdefault((type(value), value), len(codes))
+        if len(codes) <= max(1, len(values) // 4):
+            dictionary = [value for _, value in codes]
+            return 'dict', json.dumps(dictionary).encode('utf-8') + b'\n' + \
+                encode_varints(codes[(type(value), value)] for value in values)
+    return 'json', json.dumps(values).encode('utf-8')
+
+
+def decode_column(kind: str, payload: bytes) -> list:
+    if kind == 'int':
+        return decode_ints(payload)
+    if kind == 'intstr':
+        return [str(value) for value in decode_ints(payload)]
+    if kind == 'dict':
+        head, _, codes = payload.partition(b'\n')
+        dictionary = json.loads(head)
+        return [dictionary[code] for code in decode_varints(codes)]
+    return json.loads(payload)
+
+
+def encode_block(items: list) -> tuple:
+    """
+    Encode (record_id, row) pairs into one compressed block.
+
+    Returns:
+    tuple: (meta, payload). meta describes the sections and is kept in the file header.
+    """
+    record_ids = [record_id for record_id, _ in items]
+    rows = [row for _, row in items]
+    sections = []
+    if all(is_int_string(record_id) for record_id in record_ids):
+        ids_kind = 'intstr'
+        sections.append(encode_ints([int(record_id) for record_id in record_ids]))
+    else:
+        ids_kind = 'json'
+        sections.append(json.dumps(record_ids).encode('utf-8'))
+
+    width = len(rows[0]) if type(rows[0]) is list else -1
+    kinds = []
+    if all(type(row) is list and len(row) == width for row in rows):
+        for position in range(width):
+            values = [row[position] for row in rows]
+            kind, payload = encode_column(values)
+            kinds.append(kind)
+            sections.append(payload)
+    else:
+        # rows of different shapes are kept as they are
+        width = None
+        sections.append(json.dumps(rows).encode('utf-8'))
+
+    payload = zlib.compress(b''.join(sections), COMPRESSION_LEVEL)
+    meta = {'rows': len(items), 'ids': ids_kind, 'width': width, 'columns': kinds,
+            'sections': [len(section) for section in sections], 'length': len(payload)}
+    return meta, payload
+
+
+def decode_block(meta: dict, payload: bytes) -> dict:
+    raw = zlib.decompress(payload)
+    sections = []
+    offset = 0
+    for length in meta['sections']:
+        sections.append(raw[offset:offset + length])
+        offset += length
+
+    record_ids = decode_column(meta['ids'], sections[0])
+    if meta['width'] is None:
+        rows = json.loads(sections[1])
+    elif meta['width'] == 0:
+        rows = [[] for _ in record_ids]
+    else:
+        columns = [decode_column(kind, section) for kind, section in zip(meta['columns'], sections[1:])]
+        rows = [list(row) for row in zip(*columns)]
+    return dict(zip(record_ids, rows))
+
+
+def block_key(record_id, position: int):
+    # rows are grouped by record id range, so an insert or update only changes one block
+    if is_int_string(record_id):
+        return int(record_id) // BLOCK_ROWS
+    return ('position', position // BLOCK_ROWS)
+
+
+def encode_records(records: dict, datatypes: list, cache: dict = None) -> bytes:
+    """
+    Encode the records of a table in the block format.
+
+    Parameters:
+    records (dict): The records of the table.
+    datatypes (list): The datatype names of the columns, kept in the file header.
+    cache (dict, optional): Kept by the caller between calls. Blocks whose rows are the same
+        objects as last time are not encoded again; rows are replaced, never changed in place.
+
+    Returns:
+    bytes: The file contents.
+    """
+    groups = {}
+    for position, (record_id, row) in enumerate(records.items()):
+        groups.setdefault(block_key(record_id, position), []).append((record_id, row))
+
+    if cache is not None and cache.get('datatypes') != datatypes:
+        cache.clear()
+        cache['datatypes'] = list(datatypes)
+        cache['blocks'] = {}
+    encoded = {}
+    blocks, payloads = [], []
+    offset = 0
+    for key, items in groups.items():
+        cached = cache['blocks'].get(key) if cache is not None else None
+        if cached is not None and len(cached[0]) == len(items) and \
+                all(old[0] == new[0] and old[1] is new[1] for old, new in zip(cached[0], items)):
+            _, meta, payload = cached
+        else:
+            meta, payload = encode_block(items)
+        encoded[key] = (items, meta, payload)
+        blocks.append(dict(meta, offset=offset))
+        payloads.append(payload)
+        offset += len(payload)
+    if cache is not None:
+        cache['blocks'] = encoded
+
+    header = json.dumps({'format': 1, 'datatypes': list(datatypes), 'rows': len(records),
+                         'blocks': blocks}).encode('utf-8')
+    return MAGIC + struct.pack('<I', len(header)) + header + b''.join(payloads)
+
+
+def is_block_encoded(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def decode_records(data: bytes) -> dict:
+    """
+    Decode a table file in either format, told apart by the magic bytes.
+    """
+    if not is_block_encoded(data):
+        return json.loads(data)
+    start = len(MAGIC) + 4
+    (length,) = struct.unpack('<I', data[len(MAGIC):start])
+    header = json.loads(data[start:start + length])
+    start += length
+    records = {}
+    for meta in header['blocks']:
+        records.update(decode_block(meta, data[start + meta['offset']:start + meta['offset'] + meta['length']]))
+    return records
@@ -0,0 +1,80 @@
+#DBMS/models/expiry.py
+
+import os
+import time
+import logging
+import threading
+
+# expired rows deleted from the files of a table per write, and the pause before the next batch
+REAP_BATCH_ROWS = int(os.environ.get('DIYDB_REAP_BATCH', 500))
+REAP_PAUSE_MS = float(os.environ.get('DIYDB_REAP_PAUSE_MS', 50))
+
+logger = logging.getLogger('diydb.expiry')
+
+
+class Reaper:
+    def __init__(self, batch_rows: int = REAP_BATCH_ROWS, pause_ms: float = REAP_PAUSE_MS):
+        """
+        Deletes the expired rows of tables with a TTL from their files in the background.
+
+        Expired rows are taken out of memory as soon as a read or write of their table sees them
+        due, so this only has to make the deletes durable and ship them to the change log. A table
+        is visited when its next row expires; a visit deletes at most batch_rows rows in one write,
+        and if more are left the next one is pause_ms later, so however many rows expire at once
+        other writes get the database lock in between.
+        """
+        self.batch_rows = batch_rows
+        self.pause_ms = pause_ms
+        self.due = {}
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def schedule(self, db, table_name: str, when: float):
+        """
+        Visit a table of db at the time when (seconds since the epoch), or sooner if it is already due sooner.
+        """
+        with self.condition:
+            key = (db, table_name)
+            if when >= self.due.get(key, float('inf')):
+                return
+            self.due[key] = when
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name='diydb-reaper', daemon=True)
+                self.worker.start()
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while True:
+                    # expiry times are wall clock times, so the schedule is too
+                    now = time.time()
+                    ready = [key for key, when in self.due.items() if when <= now]
+                    if ready:
+                        break
+                    self.condition.wait(min(self.due.values()) - now if self.due else None)
+                for key in ready:
+                    del self.due[key]
+            for db, table_name in ready:
+                self.reap(db, table_name)
+
+    def reap(self, db, table_name: str) -> dict:
+        """
+        Delete one batch of the expired rows of a table and schedule the next visit.
+        """
+        try:
+            result = db.reap(table_name, self.batch_rows)
+        except Exception as e:
+            logger.exception("Reaping %s.%s failed", db.db_name, table_name)
+            return {'success': False, 'message': str(e)}
+        if result['success']:
+            now = time.time()
+            next_expiry = result['next_expiry']
+            if result['remaining'] or next_expiry is not None and next_expiry <= now:
+                self.schedule(db, table_name, now + self.pause_ms / 1000)
+            elif next_expiry is not None:
+                self.schedule(db, table_name, next_expiry)
+        return result
+
+
+reaper = Reaper()
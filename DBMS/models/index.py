@@ -1,38 +1,269 @@
 #DBMS/models/index.py
 
-import os
-import json
+import re
+import sys
+import bisect
+
+from query import coerce, sort_value
 
 
 class index:
-    def __init__(table_name):
+    def __init__(self, table_name):
+        """
+        Primary key index for a single table, mapping primary key -> record_id.
+        The index lives in memory and is rebuilt from the table records on load.
+
+        The keys in order are only kept once something asked for them with ordered(), and from
+        then on every insert and removal keeps them sorted.
+        """
         self.index_dict = {}
         self.table_name = table_name
-        self.index_path = os.path.join('index','indexes.json')
-        self.load_index()
-        
-    
-    def insert_index(primary_key, record_id):
-        self.index_dict[self.table_name][primary_key] = record_id
-        self.save_index()
-    
-    def find_index(primary_key):
-        record_id = self.index_dict.get(self.table_name,{}).get(primary_key)
-        return record_id
-    
-    def save_index():
-        try:
-            os.makedirs('index',exist_ok=True)
-            with open('index.json','w') as file:
-                json.dump(self.index_dict,file,indent=4)
-
-        except IOError as e:
-            return {'success': False, 'message': e}      
-    
-    def load_index():
-        if os.path.exists(self.index_path):
-            if os.path.getsize(self.index_path) > 0:
-                with open(self.index_path,'r') as file:
-                    self.index_dict=json.load(file)
-                                        
-            
\ No newline at end of file
+        self.sorted_keys = None
+        self.sorted_dtype = None
+
+    @staticmethod
+    def sort_entry(primary_key, dtype):
+        # ties on the converted value, e.g. '1' and 1, are broken by the raw key
+        return sort_value(primary_key, dtype) + (type(primary_key).__name__, str(primary_key), primary_key)
+
+    def build(self, records):
+        self.index_dict = {record[0]: record_id for record_id, record in records.items()}
+        self.sorted_keys = None
+
+    def insert_index(self, primary_key, record_id):
+        if self.sorted_keys is not None and primary_key not in self.index_dict:
+            bisect.insort(self.sorted_keys, self.sort_entry(primary_key, self.sorted_dtype))
+        self.index_dict[primary_key] = record_id
+
+    def remove_index(self, primary_key):
+        if self.sorted_keys is not None and primary_key in self.index_dict:
+            entry = self.sort_entry(primary_key, self.sorted_dtype)
+            position = bisect.bisect_left(self.sorted_keys, entry)
+            if position < len(self.sorted_keys) and self.sorted_keys[position] == entry:
+                del self.sorted_keys[position]
+        self.index_dict.pop(primary_key, None)
+
+    def find_index(self, primary_key):
+        return self.index_dict.get(primary_key)
+
+    def ordered(self, dtype: type) -> list:
+        """
+        Return the sort entries of the primary keys in ascending order of their value as dtype.
+        The primary key itself is the last element of each entry.
+        """
+        if self.sorted_keys is None or self.sorted_dtype is not dtype:
+            self.sorted_dtype = dtype
+            self.sorted_keys = sorted(self.sort_entry(primary_key, dtype) for primary_key in self.index_dict)
+        return self.sorted_keys
+
+
+# length of the substrings an n-gram index keeps; LIKE literals shorter than this can't use it
+NGRAM_SIZE = 3
+
+
+def like_prefix(pattern: str) -> str:
+    """
+    Return the literal text a LIKE pattern starts with, up to its first wildcard.
+    """
+    return re.split('[%_]', pattern, maxsplit=1)[0]
+
+
+def prefix_end(prefix: str):
+    """
+    Return the smallest string greater than every string that starts with prefix, or None if
+    there is none because prefix is all U+10FFFF, the largest code point.
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    return stem[:-1] + chr(ord(stem[-1]) + 1) if stem else None
+
+
+def ngrams(value: str) -> set:
+    return {value[i:i + NGRAM_SIZE] for i in range(len(value) - NGRAM_SIZE + 1)}
+
+
+class HashIndex:
+    kind = 'hash'
+    # the datatypes the index can be built on, None for any
+    datatypes = None
+
+    def __init__(self, column: str, dtype: type):
+        """
+        Secondary index of a column for equality lookups, mapping value -> record ids.
+        Values are kept as the column type, the way where clauses compare them; values that
+        don't convert, or are NaN, are left out, since no condition can match them.
+        """
+        self.column = column
+        self.dtype = dtype
+        self.entries = {}
+
+    def build(self, records: dict, position: int):
+        self.entries = {}
+        for record_id, record in records.items():
+            self.add(record_id, record[position])
+
+    def add(self, record_id, value):
+        value = coerce(value, self.dtype)
+        if value is not None and value == value:
+            self.entries.setdefault(value, set()).add(record_id)
+
+    def remove(self, record_id, value):
+        value = coerce(value, self.dtype)
+        record_ids = self.entries.get(value)
+        if record_ids is not None:
+            record_ids.discard(record_id)
+            if not record_ids:
+                del self.entries[value]
+
+    def search(self, op: str, literal):
+        """
+        Return the record ids whose value satisfies op literal, or None if the index can't answer op.
+        """
+        if op in ('=', '=='):
+            return self.entries.get(literal, set())
+        return None
+
+    def answers(self, op: str, literal) -> bool:
+        """
+        Whether search can answer op literal, without searching.
+        """
+        return op in ('=', '==')
+
+
+class OrderedIndex(HashIndex):
+    kind = 'ordered'
+
+    def __init__(self, column: str, dtype: type):
+        """
+        Secondary index of a column for equality and range lookups. The values are kept sorted,
+        with the record id of each at the same position of a parallel list.
+        """
+        self.column = column
+        self.dtype = dtype
+        self.values = []
+        self.record_ids = []
+
+    def build(self, records: dict, position: int):
+        pairs = sorted((value, record_id) for value, record_id in
+                       ((coerce(record[position], self.dtype), record_id) for record_id, record in records.items())
+                       if value is not None and value == value)
+        self.values = [value for value, _ in pairs]
+        self.record_ids = [record_id for _, record_id in pairs]
+
+    def add(self, record_id, value):
+        value = coerce(value, self.dtype)
+        if value is None or value != value:
+            return
+        position = bisect.bisect_right(self.values, value)
+        self.values.insert(position, value)
+        self.record_ids.insert(position, record_id)
+
+    def remove(self, record_id, value):
+        value = coerce(value, self.dtype)
+        if value is None or value != value:
+            return
+        low = bisect.bisect_left(self.values, value)
+        high = bisect.bisect_right(self.values, value)
+        for position in range(low, high):
+            if self.record_ids[position] == record_id:
+                del self.values[position]
+                del self.record_ids[position]
+                return
+
+    def answers(self, op: str, literal) -> bool:
+        return op not in ('!=', 'LIKE')
+
+    def search(self, op: str, literal):
+        if not OrderedIndex.answers(self, op, literal):
+            return None
+        if op in ('=', '=='):
+            low, high = bisect.bisect_left(self.values, literal), bisect.bisect_right(self.values, literal)
+        elif op == '<':
+            low, high = 0, bisect.bisect_left(self.values, literal)
+        elif op == '<=':
+            low, high = 0, bisect.bisect_right(self.values, literal)
+        elif op == '>':
+            low, high = bisect.bisect_right(self.values, literal), len(self.values)
+        else:
+            low, high = bisect.bisect_left(self.values, literal), len(self.values)
+        return self.record_ids[low:high]
+
+
+class PrefixIndex(OrderedIndex):
+    kind = 'prefix'
+    datatypes = (str,)
+
+    def __init__(self, column: str, dtype: type):
+        """
+        Secondary index of a str column for LIKE 'abc%' lookups, as well as equality and range
+        lookups. The values are kept sorted like an ordered index, so the values starting with a
+        prefix are the range from the prefix up to the first string past all of them.
+        """
+        super().__init__(column, dtype)
+
+    def answers(self, op: str, literal) -> bool:
+        if op == 'LIKE':
+            return like_prefix(literal) != ''
+        return super().answers(op, literal)
+
+    def search(self, op: str, literal):
+        if op != 'LIKE':
+            return super().search(op, literal)
+        prefix = like_prefix(literal)
+        if not prefix:
+            return None
+        end = prefix_end(prefix)
+        low = bisect.bisect_left(self.values, prefix)
+        high = bisect.bisect_left(self.values, end) if end is not None else len(self.values)
+        return self.record_ids[low:high]
+
+
+class NgramIndex(HashIndex):
+    kind = 'ngram'
+    datatypes = (str,)
+
+    def __init__(self, column: str, dtype: type):
+        """
+        Secondary index of a str column for LIKE '%abc%' lookups, mapping every substring of
+        NGRAM_SIZE characters of a value -> the record ids whose value contains it. A pattern is
+        answered with the records that contain all n-grams of its literal parts; the records still
+        have to be matched against the pattern, since the n-grams may appear in another order.
+        """
+        super().__init__(column, dtype)
+
+    def add(self, record_id, value):
+        value = coerce(value, self.dtype)
+        if value is not None:
+            for gram in ngrams(value):
+                self.entries.setdefault(gram, set()).add(record_id)
+
+    def remove(self, record_id, value):
+        value = coerce(value, self.dtype)
+        if value is None:
+            return
+        for gram in ngrams(value):
+            record_ids = self.entries.get(gram)
+            if record_ids is not None:
+                record_ids.discard(record_id)
+                if not record_ids:
+                    del self.entries[gram]
+
+    def grams(self, pattern: str) -> set:
+        return {gram for part in re.split('[%_]', pattern) for gram in ngrams(part)}
+
+    def answers(self, op: str, literal) -> bool:
+        return op == 'LIKE' and bool(self.grams(literal))
+
+    def search(self, op: str, literal):
+        if not self.answers(op, literal):
+            return None
+        # intersect from the rarest n-gram, so the sets only get smaller
+        candidates = sorted((self.entries.get(gram, set()) for gram in self.grams(literal)), key=len)
+        found = set(candidates[0])
+        for record_ids in candidates[1:]:
+            if not found:
+                break
+            found &= record_ids
+        return found
+
+
+INDEX_KINDS = {'hash': HashIndex, 'ordered': OrderedIndex, 'prefix': PrefixIndex, 'ngram': NgramIndex}
@@ -0,0 +1,159 @@
+#DBMS/models/join.py
+
+from query import DATATYPES, coerce, compile_predicate
+
+JOIN_TYPES = ('inner', 'left')
+
+
+def parse_on(left, right, on) -> tuple:
+    """
+    Resolve the join key against the columns of both tables.
+
+    Parameters:
+    left (Table): The left table.
+    right (Table): The right table.
+    on (str | list): A column both tables have, or [left column, right column].
+
+    Returns:
+    tuple: (left position, right position). Raises ValueError for unknown columns.
+    """
+    if isinstance(on, str):
+        on = [on, on]
+    if not isinstance(on, list) or len(on) != 2 or not all(isinstance(column, str) for column in on):
+        raise ValueError("on must be a column name or [left column, right column]")
+    for table, column in ((left, on[0]), (right, on[1])):
+        if column not in table.columns:
+            raise ValueError(f"Column {column} doesn't exist in table {table.name}")
+    return left.columns.index(on[0]), right.columns.index(on[1])
+
+
+def join_key(table, position: int):
+    """
+    Key function of a row for the join column at position. Rows match when their values are equal
+    as the types of their columns, so '7' in an int column matches 7; values that don't convert
+    never match anything, like NULL in SQL.
+    """
+    dtype = DATATYPES.get(table.datatype_names()[position], str)
+    return lambda row: coerce(row[position], dtype)
+
+
+class Join:
+    def __init__(self, left, right, on, how: str = 'inner', left_where: list = None, right_where: list = None):
+        """
+        Equality join of two tables of the same database, inner or left.
+
+        The strategy is chosen from the indexes and sizes of the tables:
+        'index' probes the index of the inner table for every row of the outer one, without
+        reading the rest of the inner table, when the inner join column has one;
+        'hash' builds a hash table on the smaller side, after the where clauses, and streams
+        the other side past it.
+
+        Parameters:
+        left (Table): The left table.
+        right (Table): The right table.
+        on (str | list): A column both tables have, or [left column, right column].
+        how (str): 'inner', or 'left' to keep left rows without a match, padded with None.
+        left_where (list, optional): Conditions on the left table, as for query.
+        right_where (list, optional): Conditions on the right table.
+
+        Raises ValueError for unknown join types, columns or invalid conditions.
+        """
+        if how not in JOIN_TYPES:
+            raise ValueError(f"Unsupported join type {how}. Expected one of {', '.join(JOIN_TYPES)}")
+        self.left = left
+        self.right = right
+        self.how = how
+        self.left_where = left_where
+        self.right_where = right_where
+        self.left_position, self.right_position = parse_on(left, right, on)
+        # validate both where clauses now, so errors are reported before any row is sent
+        self.left_predicate = compile_predicate(left.columns, left.datatype_names(), left_where)
+        self.right_predicate = compile_predicate(right.columns, right.datatype_names(), right_where)
+        self.columns = [f'{left.name}.{column}' for column in left.columns] + \
+                       [f'{right.name}.{column}' for column in right.columns]
+        self.strategy, self.outer = self.plan()
+
+    def plan(self) -> tuple:
+        """
+        Return the strategy and, for an index join, which side is the outer one.
+        A left join can only probe the right table; an inner join probes whichever indexed
+        side is the larger one.
+        """
+        right_indexed = self.right.has_index(self.right_position)
+        left_indexed = self.how == 'inner' and self.left.has_index(self.left_position)
+        if right_indexed and left_indexed:
+            return 'index', 'left' if len(self.left.records) <= len(self.right.records) else 'right'
+        if right_indexed:
+            return 'index', 'left'
+        if left_indexed:
+            return 'index', 'right'
+        return 'hash', None
+
+    def rows(self):
+        """
+        Yield the joined rows, the left record followed by the right one.
+        Row order follows the outer or probe side and is otherwise unspecified.
+        """
+        if self.strategy == 'index':
+            return self.index_join()
+        return self.hash_join()
+
+    def index_join(self):
+        if self.outer == 'left':
+            outer, inner, outer_position, inner_position = self.left, self.right, self.left_position, self.right_position
+            outer_where, inner_predicate = self.left_where, self.right_predicate
+        else:
+            outer, inner, outer_position, inner_position = self.right, self.left, self.right_position, self.left_position
+            outer_where, inner_predicate = self.right_where, self.left_predicate
+        outer_key = join_key(outer, outer_position)
+        inner_key = join_key(inner, inner_position)
+        padding = [None] * len(self.right.columns)
+
+        # list() copies the items in one step, so concurrent writers can't change them under the join
+        for _, outer_row in list(outer.query(outer_where).items()):
+            key = outer_key(outer_row)
+            matched = False
+            if key is not None:
+                for _, inner_row in inner.lookup(inner_position, key):
+                    if inner_key(inner_row) != key or not inner_predicate(inner_row):
+                        continue
+                    matched = True
+                    yield outer_row + inner_row if self.outer == 'left' else inner_row + outer_row
+            if not matched and self.how == 'left':
+                yield outer_row + padding
+
+    def hash_join(self):
+        left_rows = list(self.left.query(self.left_where).items())
+        right_rows = list(self.right.query(self.right_where).items())
+        left_key = join_key(self.left, self.left_position)
+        right_key = join_key(self.right, self.right_position)
+        build_left = len(left_rows) <= len(right_rows)
+        build_rows, build_key, probe_rows, probe_key = (left_rows, left_key, right_rows, right_key) if build_left \
+            else (right_rows, right_key, left_rows, left_key)
+
+        table = {}
+        for record_id, row in build_rows:
+            key = build_key(row)
+            if key is not None:
+                table.setdefault(key, []).append((record_id, row))
+        del build_rows
+
+        matched = set()
+        padding = [None] * len(self.right.columns)
+        for _, probe_row in probe_rows:
+            key = probe_key(probe_row)
+            entries = table.get(key, ()) if key is not None else ()
+            if not build_left:
+                if not entries and self.how == 'left':
+                    yield probe_row + padding
+                for _, row in entries:
+                    yield probe_row + row
+                continue
+            for record_id, row in entries:
+                matched.add(record_id)
+                yield row + probe_row
+
+        if build_left and self.how == 'left':
+            for record_id, row in left_rows:
+                if record_id not in matched:
+                    yield row + padding
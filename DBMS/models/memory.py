@@ -0,0 +1,230 @@
+#DBMS/models/memory.py
+
+import os
+import sys
+import time
+import weakref
+import threading
+from itertools import islice
+from collections import OrderedDict
+
+MEMORY_BUDGET_BYTES = int(float(os.environ.get('DIYDB_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024)
+# rows sampled to estimate the size of a table, and how far its row count may drift before it is sampled again
+SAMPLE_ROWS = 64
+RESAMPLE_DRIFT = 0.1
+# what a row costs besides its values: its entries in the records dict, primary key set and index
+ENTRY_BYTES = 3 * 64
+# how long eviction backs off when every table it could evict belongs to a busy database
+EVICT_RETRY_MS = 50
+
+
+def estimate_bytes(table) -> int:
+    """
+    Estimate the memory the rows of a table and their index entries take, from a sample of rows.
+    """
+    count = len(table.records)
+    if not count:
+        return 0
+    sample = list(islice(table.records.items(), SAMPLE_ROWS))
+    values = sum(sys.getsizeof(record_id) + sys.getsizeof(record) + sum(map(sys.getsizeof, record))
+                 for record_id, record in sample)
+    per_row = values / len(sample) + ENTRY_BYTES + 64 * len(table.indexes)
+    return int(per_row * count)
+
+
+class MemoryBudget:
+    def __init__(self, limit: int = MEMORY_BUDGET_BYTES):
+        """
+        Keeps the rows of all tables of all databases within limit bytes.
+
+        Every lookup of a table marks it as recently used. When the estimated size of the resident
+        tables goes over the limit, a background thread evicts the least recently used ones: written
+        first if they have unwritten changes, then dropped from memory, to be loaded again from their
+        files the next time they are looked up. Evicting in the background means it never happens in
+        the middle of an operation that holds the database lock; a table whose database is busy is
+        skipped and tried again later.
+        """
+        self.limit = limit
+        self.resident = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def touch(self, db, table_name: str, table, loaded: bool = False):
+        """
+        Record a lookup of a table, which was just loaded from its files if loaded is True.
+        """
+        key = (id(db), table_name)
+        rows = len(table.records)
+        with self.condition:
+            if loaded:
+                self.misses += 1
+            else:
+                self.hits += 1
+            entry = self.resident.get(key)
+            if entry is None or entry['table']() is not table or \
+                    abs(rows - entry['rows']) > entry['rows'] * RESAMPLE_DRIFT:
+                size = estimate_bytes(table)
+                self.size += size - (entry['bytes'] if entry is not None else 0)
+                entry = {'db': weakref.ref(db), 'table_name': table_name, 'table': weakref.ref(table),
+                         'bytes': size, 'rows': rows}
+                self.resident[key] = entry
+            self.resident.move_to_end(key)
+            if self.size > self.limit:
+                if self.worker is None or not self.worker.is_alive():
+                    self.worker = threading.Thread(target=self._run, name='diydb-evictor', daemon=True)
+                    self.worker.start()
+                self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.size <= self.limit:
+                    self.condition.wait()
+            if not self.enforce():
+                # everything left to evict is busy
+                time.sleep(EVICT_RETRY_MS / 1000)
+
+    def enforce(self) -> bool:
+        """
+        Evict the least recently used tables until the resident ones fit the limit. The most
+        recently used table always stays, even on its own over the limit.
+
+        Returns:
+        bool: Whether the resident tables fit the limit now.
+        """
+        with self.condition:
+            candidates = list(self.resident.items())[:-1]
+        for key, entry in candidates:
+            with self.condition:
+                if self.size <= self.limit:
+                    return True
+            db, table = entry['db'](), entry['table']()
+            # the database lock is taken without the budget lock held, so lookups never wait on eviction
+            if db is not None and table is not None and not db.evict_table(entry['table_name'], table):
+                continue
+            with self.condition:
+                current = self.resident.get(key)
+                if current is not None and current['table']() is table:
+                    self.size -= self.resident.pop(key)['bytes']
+                    if db is not None:
+                        self.evictions += 1
+        with self.condition:
+            return self.size <= self.limit
+
+    def forget(self, db, table_name: str = None):
+        """
+        Stop tracking a dropped table, or every table of a database that is reloaded.
+        """
+        with self.condition:
+            for key in [key for key in self.resident if key[0] == id(db)
+                        and (table_name is None or key[1] == table_name)]:
+                self.size -= self.resident.pop(key)['bytes']
+
+    def stats(self, owner: str = None) -> dict:
+        """
+        Report the limit, the bytes in use, lookup counters and the resident tables, only those of
+        the databases of owner if given.
+        """
+        with self.condition:
+            lookups = self.hits + self.misses
+            return {
+                'limit_bytes': self.limit,
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'evictions': self.evictions,
+                'tables': [{'db': entry['db']().db_name, 'table': entry['table_name'], 'bytes': entry['bytes'],
+                            'rows': entry['rows']}
+                           for entry in self.resident.values()
+                           if entry['db']() is not None and owner in (None, entry['db']().owner)],
+            }
+
+
+budget = MemoryBudget()
+
+
+class Tables(dict):
+    def __init__(self, db):
+        """
+        The tables of a database by name. A table evicted by the memory budget stays listed with
+        None in its place, and is loaded again from its files when it is next looked up.
+        """
+        super().__init__()
+        self.db = db
+
+    def __getitem__(self, name):
+        table = super().__getitem__(name)
+        if table is not None:
+            budget.touch(self.db, name, table)
+            return table
+        with self.db.lock:
+            table = super().__getitem__(name)
+            loaded = table is None
+            if loaded:
+                table = self.db.load_table(name)
+                super().__setitem__(name, table)
+        budget.touch(self.db, name, table, loaded)
+        return table
+
+    def __setitem__(self, name, table):
+        super().__setitem__(name, table)
+        if table is not None:
+            budget.touch(self.db, name, table)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def pop(self, name, *default):
+        if name not in self:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        table = self[name]
+        super().pop(name)
+        budget.forget(self.db, name)
+        return table
+
+    def values(self):
+        return [self[name] for name in list(self)]
+
+    def items(self):
+        return [(name, self[name]) for name in list(self)]
+
+    def resident(self) -> dict:
+        """
+        Return the tables that are in memory, without loading the others.
+        """
+        return {name: table for name, table in super().items() if table is not None}
+
+    def evicted(self) -> list:
+        """
+        Return the names of the tables that are only on disk.
+        """
+        return [name for name, table in super().items() if table is None]
+
+    def peek(self, name: str):
+        """
+        Return a table if it is in memory, without loading it or counting it as used.
+        """
+        return super().get(name)
+
+    def register(self, name: str):
+        """
+        List a table whose rows are only loaded when it is first looked up.
+        """
+        super().__setitem__(name, None)
+
+    def evict(self, name: str):
+        super().__setitem__(name, None)
+
+    def discard(self, name: str):
+        """
+        Stop listing a table that was dropped by another process, without loading it.
+        """
+        super().pop(name, None)
+        budget.forget(self.db, name)
@@ -0,0 +1,156 @@
+#DBMS/models/partition.py
+
+import os
+import zlib
+
+from table import Table
+from metrics import TABLE_SAVE_SECONDS, TABLE_BYTES_WRITTEN
+from profiling import trace
+from durability import write_file
+
+def partition_of(primary_key, partitions: int) -> int:
+    # crc32 rather than hash(): str hashes are salted per process and partitions live on disk
+    return zlib.crc32(str(primary_key).encode('utf-8')) % partitions
+
+
+class PartitionedRecords(dict):
+    """
+    The records of a partitioned table. Behaves like the plain records dict, but also routes every
+    row to its partition by primary key and remembers which partitions changed since the last save.
+    """
+    def __init__(self, partitions: int, records: dict = None):
+        super().__init__()
+        self.partitions = partitions
+        self.parts = [{} for _ in range(partitions)]
+        self.located = {}
+        self.dirty = set()
+        for record_id, record in (records or {}).items():
+            self[record_id] = record
+
+    def __setitem__(self, record_id, record):
+        part = partition_of(record[0], self.partitions)
+        previous = self.located.get(record_id)
+        if previous is not None and previous != part:
+            del self.parts[previous][record_id]
+            self.dirty.add(previous)
+        self.parts[part][record_id] = record
+        self.located[record_id] = part
+        self.dirty.add(part)
+        super().__setitem__(record_id, record)
+
+    def __delitem__(self, record_id):
+        part = self.located.pop(record_id)
+        del self.parts[part][record_id]
+        self.dirty.add(part)
+        super().__delitem__(record_id)
+
+    def pop(self, record_id, *default):
+        if record_id in self:
+            record = self[record_id]
+            del self[record_id]
+            return record
+        if default:
+            return default[0]
+        raise KeyError(record_id)
+
+
+class PartitionedTable(Table):
+    def __init__(self, name: str, db_path: str, partitions: int, schema: dict = None):
+        """
+        A table whose rows are spread over several files by a hash of the primary key.
+
+        Only the partitions touched by a write are rewritten. Scans and aggregates go over the
+        rows in memory like those of any table, rather than reading the partition files again.
+
+        Parameters:
+        name (str): The name of the table.
+        db_path (str): The directory of the database.
+        partitions (int): The number of partitions.
+        schema (dict, optional): The entry of the table in metadata.json.
+        """
+        self.partitions = partitions
+        self._records = PartitionedRecords(partitions)
+        super().__init__(name, db_path, schema)
+
+    @property
+    def records(self):
+        return self._records
+
+    @records.setter
+    def records(self, records):
+        # whole-table replacements (load, compaction, replication) rewrite every partition
+        self._records = PartitionedRecords(self.partitions, records)
+
+    def partition_file(self, part: int) -> str:
+        return os.path.join(os.path.dirname(self.table_file), f'{self.name}.p{part}.json')
+
+    def data_files(self) -> list:
+        return [self.partition_file(part) for part in range(self.partitions)]
+
+    def load_data(self):
+        self.file_crcs = {}
+        if any(os.path.exists(path) for path in self.data_files()):
+            records = {}
+            for path in self.data_files():
+                if os.path.exists(path):
+                    with open(path, 'rb') as file:
+                        data = file.read()
+                    self.file_crcs[os.path.basename(path)] = zlib.crc32(data)
+                    records.update(self.read_rows(os.path.basename(path), data))
+            self.records = records
+            self.records.dirty.clear()
+        elif os.path.exists(self.table_file):
+            # a single-file copy, e.g. restored from a snapshot, is split on its next save
+            with open(self.table_file, 'rb') as file:
+                data = file.read()
+            self.file_crcs[os.path.basename(self.table_file)] = zlib.crc32(data)
+            self.records = self.read_rows(os.path.basename(self.table_file), data)
+        else:
+            self.records = {}
+            self.records.dirty.clear()
+            self.file_versions = {}
+        self.filters = None
+        self.record_id_counter = max(map(int, self.records.keys())) + 1 if self.records else 1
+        self.rebuild_indexes()
+
+    def write_data(self):
+        self.pending = False
+        try:
+            with TABLE_SAVE_SECONDS.time(self.db_name, self.name):
+                with trace.phase('serialization'):
+                    parts = {part: self.encode_records(self.records.parts[part], self.block_cache.setdefault(part, {}))
+                             for part in sorted(self.records.dirty)}
+                    for part, data in parts.items():
+                        self.file_crcs[os.path.basename(self.partition_file(part))] = zlib.crc32(data)
+                        self.file_versions[os.path.basename(self.partition_file(part))] = \
+                            [self.schema_version, zlib.crc32(data)]
+                    self.file_crcs.pop(os.path.basename(self.table_file), None)
+                    self.file_versions.pop(os.path.basename(self.table_file), None)
+                with trace.phase('storage'):
+                    os.makedirs(os.path.dirname(self.table_file), exist_ok=True)
+                    written = self.save_filters()
+                    for part, data in parts.items():
+                        written += write_file(self.partition_file(part), data)
+                self.records.dirty.clear()
+                if os.path.exists(self.table_file):
+                    os.remove(self.table_file)
+            TABLE_BYTES_WRITTEN.inc(self.db_name, self.name, amount=written)
+        except IOError as e:
+            self.pending = True
+            return f"error saving data {e}"
+
+    def encode_files(self, records: dict) -> dict:
+        split = PartitionedRecords(self.partitions, records)
+        return {self.partition_file(part): self.encode_records(split.parts[part]) for part in range(self.partitions)}
+
+    def delete_files(self):
+        super().delete_files()
+        if os.path.exists(self.table_file):
+            os.remove(self.table_file)
+
+    def replace_records(self, records: dict):
+        # rows keep their partition, so only the partitions that were already dirty need writing
+        dirty = set(self.records.dirty)
+        self.records = records
+        self.records.dirty.clear()
+        self.records.dirty.update(dirty)
@@ -0,0 +1,134 @@
+#DBMS/models/query.py
+
+import re
+import operator
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def like_pattern(pattern: str):
+    """
+    Compile a LIKE pattern, where % matches any run of characters and _ any single character.
+    """
+    return re.compile(''.join('.*' if char == '%' else '.' if char == '_' else re.escape(char)
+                              for char in pattern), re.DOTALL)
+
+
+def like(value: str, pattern: str) -> bool:
+    return like_pattern(pattern).fullmatch(value) is not None
+
+
+OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'LIKE': like,
+}
+
+AGGREGATES = ('count', 'sum', 'min', 'max', 'avg')
+
+DATATYPES = {'int': int, 'float': float, 'str': str}
+
+
+def coerce(value, dtype: type):
+    """
+    Convert a stored or literal value to the column type.
+    Returns None when the value can't be converted, so it never matches a comparison.
+    """
+    if value is None:
+        return None
+    try:
+        return dtype(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def sort_value(value, dtype: type) -> tuple:
+    """
+    Key that orders values of a column by their value as the column type.
+    Values that don't convert sort after all others.
+    """
+    value = coerce(value, dtype)
+    return (value is None, value)
+
+
+def parse_conditions(columns: list, datatypes: list, where: list) -> list:
+    """
+    Validate a where clause and resolve it against the columns of a table.
+
+    Returns:
+    list: (position, dtype, operator, literal) per condition, with the literal converted to
+    the column type. 'like' is accepted for 'LIKE', which only applies to str columns.
+    Raises ValueError for unknown columns or operators.
+    """
+    conditions = []
+    for condition in where or []:
+        if len(condition) != 3:
+            raise ValueError(f"Invalid condition {condition}. Expected [column, operator, value]")
+        column, op, value = condition
+        op = 'LIKE' if op == 'like' else op
+        if column not in columns:
+            raise ValueError(f"Column {column} doesn't exist")
+        if op not in OPERATORS:
+            raise ValueError(f"Unsupported operator {op}")
+        position = columns.index(column)
+        dtype = DATATYPES.get(datatypes[position], str)
+        if op == 'LIKE' and dtype is not str:
+            raise ValueError(f"LIKE only applies to str columns, {column} is {dtype.__name__}")
+        literal = coerce(value, dtype)
+        if literal is None:
+            raise ValueError(f"Value {value} is not a valid {dtype.__name__} for column {column}")
+        conditions.append((position, dtype, op, literal))
+    return conditions
+
+
+def compile_predicate(columns: list, datatypes: list, where: list):
+    """
+    Compile a where clause into a function of a row.
+
+    Parameters:
+    columns (list): The column names of the table.
+    datatypes (list): The datatype names of the columns ('int', 'str', 'float').
+    where (list): Conditions as [column, operator, value]; all of them must hold.
+
+    Returns:
+    callable: predicate(row) -> bool. Raises ValueError for unknown columns or operators.
+    """
+    conditions = [(position, dtype, OPERATORS[op], literal)
+                  for position, dtype, op, literal in parse_conditions(columns, datatypes, where)]
+
+    if not conditions:
+        return lambda row: True
+
+    def predicate(row):
+        for position, dtype, compare, literal in conditions:
+            value = coerce(row[position], dtype)
+            if value is None or not compare(value, literal):
+                return False
+        return True
+    return predicate
+
+
+def aggregate(rows, function: str, position: int, dtype: type):
+    """
+    Compute count, sum, min, max or avg of the column at position over rows; count without a
+    position counts the rows. Values that don't convert to dtype are skipped.
+    """
+    if function not in AGGREGATES:
+        raise ValueError(f"Unsupported aggregate {function}")
+    if function == 'count' and position is None:
+        return sum(1 for _ in rows)
+    values = [value for value in (coerce(row[position], dtype) for row in rows) if value is not None]
+    if function == 'count':
+        return len(values)
+    if function == 'sum':
+        return sum(values)
+    if not values:
+        return None
+    if function == 'avg':
+        return sum(values) / len(values)
+    return min(values) if function == 'min' else max(values)
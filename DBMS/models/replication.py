@@ -0,0 +1,236 @@
+#DBMS/models/replication.py
+
+import os
+import time
+import logging
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+import snapshot
+from changelog import RESET_OPERATIONS
+
+# shared secret of a primary and its replicas; messages are pickled, so nothing without it may connect
+REPLICATION_AUTHKEY = os.environ.get('DIYDB_REPLICATION_KEY', '').encode('utf-8') or None
+HEARTBEAT_INTERVAL = 1.0
+RECONNECT_DELAY = 0.5
+
+logger = logging.getLogger('diydb.replication')
+
+
+def replication_key(authkey: bytes = None) -> bytes:
+    """
+    Return authkey, or the key from DIYDB_REPLICATION_KEY when none is given.
+    Raises RuntimeError when neither is set, rather than fall back to a key anyone could know.
+    """
+    authkey = authkey or REPLICATION_AUTHKEY
+    if not authkey:
+        raise RuntimeError("Replication needs a shared secret: set DIYDB_REPLICATION_KEY on the primary and its replicas")
+    return authkey
+
+
+class ReplicationPublisher:
+    def __init__(self, address: tuple, resolve_database, authkey: bytes = None):
+        """
+        Streams the change log of the primary to replica processes over a local socket.
+
+        A replica says which database it follows and the last sequence number it applied. It is
+        sent a consistent image of the database first when it is new, when it followed another
+        primary process, or when it fell behind the ring buffer, and then every change in order.
+        A compaction or restore in the log is sent as a new image too.
+
+        Parameters:
+        address (tuple): (host, port) to listen on. Port 0 picks a free port.
+        resolve_database (callable): Returns the Database for a name, or None.
+        authkey (bytes, optional): The shared secret replicas must prove they know. Defaults to DIYDB_REPLICATION_KEY.
+        """
+        self.listener = Listener(address, authkey=replication_key(authkey))
+        self.address = self.listener.address
+        self.resolve_database = resolve_database
+        self.replicas = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._accept_loop, name='diydb-replication', daemon=True).start()
+        return self
+
+    def close(self):
+        self.running = False
+        self.listener.close()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected a replication connection that didn't know DIYDB_REPLICATION_KEY")
+                continue
+            except (OSError, EOFError):
+                if not self.running:
+                    return
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        replica_id = id(conn)
+        try:
+            hello = conn.recv()
+            db = self.resolve_database(hello['db_name'])
+            if db is None:
+                conn.send({'type': 'error', 'message': f"Database {hello['db_name']} doesn't exist"})
+                return
+            with self.lock:
+                self.replicas[replica_id] = {'db_name': db.db_name, 'sent_seq': 0, 'connected_at': time.time()}
+
+            seq = hello.get('seq') or 0
+            if hello.get('epoch') != db.changelog.epoch or db.changelog.since(seq) is None:
+                seq = self.send_snapshot(conn, db)
+            while self.running:
+                entries = db.changelog.wait_since(seq, HEARTBEAT_INTERVAL)
+                if entries is None:
+                    seq = self.send_snapshot(conn, db)
+                    continue
+                if not entries:
+                    conn.send({'type': 'heartbeat', 'head': db.changelog.seq, 'ts': time.time()})
+                    continue
+                head = db.changelog.seq
+                for entry in entries:
+                    if entry['change']['operation'] in RESET_OPERATIONS:
+                        seq = self.send_snapshot(conn, db)
+                        break
+                    conn.send({'type': 'change', 'seq': entry['seq'], 'ts': entry['ts'], 'head': head,
+                               'change': entry['change']})
+                    seq = entry['seq']
+                with self.lock:
+                    self.replicas[replica_id]['sent_seq'] = seq
+        except (EOFError, OSError, BrokenPipeError):
+            pass
+        finally:
+            with self.lock:
+                self.replicas.pop(replica_id, None)
+            conn.close()
+
+    def send_snapshot(self, conn, db) -> int:
+        image = snapshot.capture(db)
+        conn.send({'type': 'snapshot', 'image': image, 'ts': time.time()})
+        return image['seq']
+
+    def status(self) -> dict:
+        with self.lock:
+            return {'role': 'primary', 'address': list(self.address), 'replicas': list(self.replicas.values())}
+
+
+class Replica:
+    def __init__(self, address: tuple, db_name: str, root: str = 'replica_databases',
+                 authkey: bytes = None, on_database=None, database_class=None):
+        """
+        Follows one database of a primary and applies its changes to a local copy.
+
+        Parameters:
+        address (tuple): (host, port) of the primary's ReplicationPublisher.
+        db_name (str): The database to follow.
+        root (str, optional): The directory holding the local copy.
+        authkey (bytes, optional): The primary's shared secret. Defaults to DIYDB_REPLICATION_KEY.
+        on_database (callable, optional): Called with the local Database once it is first loaded.
+        database_class (type, optional): The Database class to build the local copy with.
+        """
+        self.address = tuple(address)
+        self.db_name = db_name
+        self.root = root
+        self.authkey = replication_key(authkey)
+        self.on_database = on_database
+        self.database_class = database_class
+        self.database = None
+        self.epoch = None
+        self.applied_seq = 0
+        self.head_seq = 0
+        self.last_applied_ts = None
+        self.connected = False
+        self.running = False
+        self.conn = None
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, name=f'diydb-replica-{self.db_name}', daemon=True).start()
+        return self
+
+    def close(self):
+        self.running = False
+        if self.conn is not None:
+            self.conn.close()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.conn = Client(self.address, authkey=self.authkey)
+                self.conn.send({'db_name': self.db_name, 'epoch': self.epoch, 'seq': self.applied_seq})
+                self.connected = True
+                while self.running:
+                    self.handle(self.conn.recv())
+            except (EOFError, OSError):
+                pass
+            except AuthenticationError:
+                logger.error("Replication of %s failed: the primary has another DIYDB_REPLICATION_KEY", self.db_name)
+                self.running = False
+            except Exception:
+                # e.g. a change that didn't apply: reconnect, and the primary resends from applied_seq
+                logger.exception("Replication of %s failed at seq %s, reconnecting", self.db_name, self.applied_seq)
+                if self.conn is not None:
+                    self.conn.close()
+            self.connected = False
+            if self.running:
+                time.sleep(RECONNECT_DELAY)
+
+    def handle(self, message: dict):
+        if message['type'] == 'snapshot':
+            self.install(message['image'])
+        elif message['type'] == 'change':
+            self.database.apply_change(message['change'])
+            self.applied_seq = message['seq']
+            self.head_seq = max(self.head_seq, message['head'])
+            self.last_applied_ts = message['ts']
+        elif message['type'] == 'heartbeat':
+            self.head_seq = max(self.head_seq, message['head'])
+        elif message['type'] == 'error':
+            logger.error("Replication of %s failed: %s", self.db_name, message['message'])
+            self.running = False
+
+    def install(self, image: dict):
+        if self.database_class is None:
+            # imported here because database.py itself imports this module's neighbours by file name
+            from database import Database
+            self.database_class = Database
+
+        db_path = os.path.join(self.root, self.db_name)
+        if self.database is None:
+            snapshot.install_image(image, db_path)
+            self.database = self.database_class(self.db_name, image['metadata']['owner'], root=self.root,
+                                                 replica=True)
+            if self.on_database is not None:
+                self.on_database(self.database)
+        else:
+            with self.database.lock:
+                snapshot.install_image(image, db_path)
+                self.database.reload()
+        self.epoch = image['epoch']
+        self.applied_seq = image['seq']
+        self.head_seq = image['seq']
+        self.last_applied_ts = time.time()
+
+    def status(self) -> dict:
+        lag_events = max(self.head_seq - self.applied_seq, 0)
+        lag_seconds = 0.0
+        if lag_events and self.last_applied_ts is not None:
+            lag_seconds = max(time.time() - self.last_applied_ts, 0.0)
+        return {
+            'role': 'replica',
+            'db_name': self.db_name,
+            'primary': list(self.address),
+            'connected': self.connected,
+            'applied_seq': self.applied_seq,
+            'head_seq': self.head_seq,
+            'lag_events': lag_events,
+            'lag_seconds': lag_seconds,
+        }
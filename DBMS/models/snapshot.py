@@ -0,0 +1,161 @@
+#DBMS/models/snapshot.py
+
+import os
+import copy
+import json
+import shutil
+from datetime import datetime
+
+from encoding import encode_records
+
+SNAPSHOT_ROOT = 'snapshots'
+# attempts at an image; the last one reads evicted tables while holding the database lock
+CAPTURE_ATTEMPTS = 3
+
+
+def snapshot_dir(db_name: str, snapshot_id: str = None) -> str:
+    path = os.path.join(SNAPSHOT_ROOT, db_name)
+    return os.path.join(path, snapshot_id) if snapshot_id else path
+
+
+def capture(db) -> dict:
+    """
+    Take a point-in-time image of a database.
+
+    Only the dict of records of each table in memory is copied while the database lock is held.
+    Writers replace rows instead of mutating them in place, so the copied dicts keep pointing at
+    the rows as they were at the checkpoint while the live tables move on. Tables evicted from
+    memory are read from their files after the lock is released, without loading them back into
+    the database. If one was written meanwhile, its files no longer match the checksums in the
+    metadata and the image is taken again; the last attempt reads them while holding the lock.
+    """
+    for attempt in range(CAPTURE_ATTEMPTS):
+        final_attempt = attempt == CAPTURE_ATTEMPTS - 1
+        with db.lock:
+            metadata = copy.deepcopy(db.build_metadata())
+            resident = db.tables.resident()
+            records = {name: dict(resident[name].records) for name in metadata['tables'] if name in resident}
+            versions = {name: resident[name].version for name in records}
+            seq, epoch = db.changelog.seq, db.changelog.epoch
+            if final_attempt:
+                evicted = read_evicted(db, metadata, records)
+        if not final_attempt:
+            expected = {name: file_crcs(schema) for name, schema in metadata['tables'].items() if name not in records}
+            evicted = read_evicted(db, metadata, records)
+            if any(table.file_crcs != expected[name] for name, table in evicted.items()):
+                continue
+        records.update({name: table.records for name, table in evicted.items()})
+        versions.update({name: table.version for name, table in evicted.items()})
+        # the image holds every row in the current schema
+        for schema in metadata['tables'].values():
+            schema['schema_history'] = []
+            schema['file_versions'] = {}
+        return {
+            'metadata': metadata,
+            'tables': {name: records[name] for name in metadata['tables']},
+            'versions': versions,
+            'seq': seq,
+            'epoch': epoch,
+        }
+
+
+def read_evicted(db, metadata: dict, resident: dict) -> dict:
+    # a table keeps the schema it is given and records the checksums of the files it reads in it
+    return {name: db.read_table(name, copy.deepcopy(schema)) for name, schema in metadata['tables'].items()
+            if name not in resident}
+
+
+def file_crcs(schema: dict) -> dict:
+    return {file_name: crc for file_name, (_, crc) in schema.get('file_versions', {}).items()}
+
+
+def write_image(path: str, image: dict):
+    """Write the table files and metadata.json of a captured image into a directory."""
+    os.makedirs(path, exist_ok=True)
+    for table_name, records in image['tables'].items():
+        schema = image['metadata']['tables'].get(table_name, {})
+        if schema.get('encoding') == 'block':
+            data = encode_records(records, schema['datatype'])
+        else:
+            data = json.dumps(records, indent=4).encode('utf-8')
+        with open(os.path.join(path, table_name + '.json'), 'wb') as file:
+            file.write(data)
+    with open(os.path.join(path, 'metadata.json'), 'w') as file:
+        json.dump(image['metadata'], file, indent=4)
+
+
+def write_snapshot(db_name: str, image: dict) -> dict:
+    """
+    Write a captured image to snapshots/<db_name>/<snapshot_id>/ without holding any lock.
+    The directory only appears under its final name once every file is on disk.
+    """
+    created_at = datetime.utcnow()
+    snapshot_id = created_at.strftime('%Y%m%dT%H%M%S%fZ')
+    final_path = snapshot_dir(db_name, snapshot_id)
+    temp_path = final_path + '.tmp'
+    write_image(temp_path, image)
+
+    manifest = {
+        'db_name': db_name,
+        'snapshot_id': snapshot_id,
+        'created_at': created_at.isoformat() + 'Z',
+        'tables': {name: {'records': len(records), 'version': image['versions'][name]}
+                   for name, records in image['tables'].items()},
+    }
+    with open(os.path.join(temp_path, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, final_path)
+    return manifest
+
+
+def list_snapshots(db_name: str) -> list:
+    path = snapshot_dir(db_name)
+    if not os.path.isdir(path):
+        return []
+    manifests = []
+    for snapshot_id in sorted(os.listdir(path)):
+        manifest_file = os.path.join(path, snapshot_id, 'manifest.json')
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as file:
+                manifests.append(json.load(file))
+    return manifests
+
+
+def install_snapshot(db_name: str, snapshot_id: str, db_path: str):
+    """
+    Replace the files of a database with the files of a snapshot.
+
+    The snapshot is staged next to the database directory and swapped in with renames, so a
+    crash leaves either the old or the restored database in place, never a mix.
+    """
+    if not snapshot_id or os.path.basename(snapshot_id) != snapshot_id or snapshot_id.startswith('.'):
+        raise FileNotFoundError(f"Invalid snapshot id {snapshot_id}")
+    source = snapshot_dir(db_name, snapshot_id)
+    if not os.path.exists(os.path.join(source, 'manifest.json')):
+        raise FileNotFoundError(f"Snapshot {snapshot_id} of database {db_name} doesn't exist")
+
+    staging = db_path + '.restore'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for file_name in os.listdir(source):
+        if file_name != 'manifest.json':
+            # copied rather than linked: table files are rewritten in place by save_data
+            shutil.copy2(os.path.join(source, file_name), os.path.join(staging, file_name))
+    swap_in(staging, db_path)
+
+
+def install_image(image: dict, db_path: str):
+    """Replace the files of a database with a captured image, e.g. one received from a primary."""
+    staging = db_path + '.restore'
+    shutil.rmtree(staging, ignore_errors=True)
+    write_image(staging, image)
+    swap_in(staging, db_path)
+
+
+def swap_in(staging: str, db_path: str):
+    retired = db_path + '.old'
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(db_path):
+        os.replace(db_path, retired)
+    os.replace(staging, db_path)
+    shutil.rmtree(retired, ignore_errors=True)
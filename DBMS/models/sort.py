@@ -0,0 +1,93 @@
+#DBMS/models/sort.py
+
+import heapq
+
+from query import DATATYPES, sort_value
+
+DIRECTIONS = ('asc', 'desc')
+
+
+class Descending:
+    """Wraps a sort key so that it orders in reverse inside a tuple of keys."""
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def parse_order(columns: list, datatypes: list, order_by) -> list:
+    """
+    Resolve an ORDER BY clause against the columns of a table.
+
+    Parameters:
+    columns (list): The column names of the table.
+    datatypes (list): The datatype names of the columns.
+    order_by (str | list): Sort keys, most significant first, each either 'column',
+        'column desc' or [column, direction]. A single key may be given on its own.
+
+    Returns:
+    list: (position, dtype, descending) per key. Raises ValueError for unknown columns or directions.
+    """
+    if not order_by:
+        return []
+    if not isinstance(order_by, (str, list)):
+        raise ValueError("order_by must be a column, 'column desc' or a list of them")
+    if isinstance(order_by, str) or is_single_pair(order_by, columns):
+        order_by = [order_by]
+    order = []
+    for key in order_by:
+        parts = key.split() if isinstance(key, str) else list(key) if isinstance(key, list) else [key]
+        if not 1 <= len(parts) <= 2:
+            raise ValueError(f"Invalid sort key {key}. Expected 'column' or 'column desc'")
+        column = parts[0]
+        direction = str(parts[1]).lower() if len(parts) == 2 else 'asc'
+        if column not in columns:
+            raise ValueError(f"Column {column} doesn't exist")
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unsupported sort direction {parts[1]}")
+        position = columns.index(column)
+        order.append((position, DATATYPES.get(datatypes[position], str), direction == 'desc'))
+    return order
+
+
+def is_single_pair(order_by: list, columns: list) -> bool:
+    # ['age', 'desc'] is one key with a direction unless desc is also a column
+    return (len(order_by) == 2 and all(isinstance(part, str) for part in order_by)
+            and order_by[1].lower() in DIRECTIONS and order_by[1] not in columns)
+
+
+def make_key(order: list):
+    """
+    Build the key function of (record_id, record) pairs for a parsed ORDER BY clause.
+    Values that don't convert to the column type sort last ascending and first descending.
+    """
+    def key(item):
+        row = item[1]
+        return tuple(Descending(sort_value(row[position], dtype)) if descending else sort_value(row[position], dtype)
+                     for position, dtype, descending in order)
+    return key
+
+
+def order_records(items, order: list, limit: int = None) -> list:
+    """
+    Sort (record_id, record) pairs.
+
+    With a limit the k first pairs are kept in a bounded heap, in O(n log k) time and O(k)
+    memory; without one they are sorted in place, since the caller already holds all of them
+    and returns them all. Both are stable.
+
+    Returns:
+    list: The pairs in order.
+    """
+    key = make_key(order)
+    if limit is not None:
+        return heapq.nsmallest(limit, items, key=key)
+    items = list(items)
+    items.sort(key=key)
+    return items
@@ -0,0 +1,222 @@
+#DBMS/models/stats.py
+
+import os
+import math
+import base64
+import bisect
+import random
+import hashlib
+
+from query import coerce
+from index import like_prefix, prefix_end
+
+# registers of a distinct count estimate are 2 ** HLL_PRECISION bytes, for a standard error of about 3%
+HLL_PRECISION = 10
+HISTOGRAM_BUCKETS = 16
+# rows the histograms are built from; the other statistics look at every row
+STATS_SAMPLE_ROWS = int(os.environ.get('DIYDB_STATS_SAMPLE', 10000))
+# fraction of the rows analyzed that may change before the statistics are gathered again
+STATS_REFRESH_FRACTION = float(os.environ.get('DIYDB_STATS_REFRESH', 0.2))
+# fraction of rows assumed to match a LIKE pattern with no literal prefix
+LIKE_SELECTIVITY = 0.1
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytearray = None):
+        """
+        Estimates the number of distinct values added to it in 2 ** precision bytes.
+
+        Each value is hashed to 64 bits; the first precision bits pick a register, which keeps the
+        longest run of leading zeros seen in the rest. Values can't be removed, so the estimate of
+        a column only goes down again when its statistics are gathered anew.
+        """
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        digest = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        width = 64 - self.precision
+        register = digest >> width
+        rank = width - (digest & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self) -> int:
+        size = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / size) * size * size / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(0)
+        if estimate <= 2.5 * size and empty:
+            # few values: count them from the registers still empty
+            estimate = size * math.log(size / empty)
+        return int(round(estimate))
+
+    def to_dict(self) -> dict:
+        return {'precision': self.precision, 'registers': base64.b64encode(bytes(self.registers)).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'HyperLogLog':
+        return cls(data['precision'], bytearray(base64.b64decode(data['registers'])))
+
+
+def text_key(value: str) -> float:
+    # the first characters of a string as a number, to interpolate between strings
+    return sum(ord(char) / 0x110000 ** (i + 1) for i, char in enumerate(value[:4]))
+
+
+def interpolate(value, low, high) -> float:
+    """
+    Return where value lies between low and high, as a fraction.
+    """
+    if isinstance(value, str):
+        common = len(os.path.commonprefix([low, high]))
+        value, low, high = text_key(value[common:]), text_key(low[common:]), text_key(high[common:])
+    return min(max((value - low) / (high - low), 0.0), 1.0) if high > low else 0.5
+
+
+class TableStats:
+    def __init__(self, rows: int = 0, columns: dict = None, modified: int = 0):
+        """
+        Statistics of the rows of a table, for estimating how many rows a where clause matches.
+
+        Per column: a distinct count estimate, the min and max, the fraction of null values and the
+        bounds of an equi-depth histogram, whose buckets each hold about the same number of rows.
+        Writes keep the distinct counts and the min and max current and count the rows they change;
+        the rest is only as fresh as the last time the statistics were gathered, which happens again
+        once the rows changed since are more than STATS_REFRESH_FRACTION of the rows then.
+        """
+        self.rows = rows
+        self.columns = columns or {}
+        self.modified = modified
+
+    @classmethod
+    def gather(cls, column_datatype: dict, records: dict, sample_rows: int = STATS_SAMPLE_ROWS) -> 'TableStats':
+        """
+        Gather the statistics of every column from the records, with histograms from a sample of them.
+        """
+        rows = list(records.values())
+        sample = rows if len(rows) <= sample_rows else random.sample(rows, sample_rows)
+        columns = {}
+        for position, (column, dtype) in enumerate(column_datatype.items()):
+            distinct = HyperLogLog()
+            nulls = 0
+            low = high = None
+            for row in rows:
+                value = coerce(row[position], dtype)
+                if value is None or value == '' or value != value:
+                    nulls += 1
+                    continue
+                distinct.add(value)
+                if low is None or value < low:
+                    low = value
+                if high is None or value > high:
+                    high = value
+            values = sorted(value for value in (coerce(row[position], dtype) for row in sample)
+                            if value is not None and value != '' and value == value)
+            buckets = min(HISTOGRAM_BUCKETS, len(values))
+            histogram = [values[min(i * len(values) // buckets, len(values) - 1)] for i in range(buckets)] + \
+                        [values[-1]] if values else []
+            columns[column] = {'distinct': distinct, 'min': low, 'max': high,
+                               'null_fraction': nulls / len(rows) if rows else 0.0, 'histogram': histogram}
+        return cls(len(rows), columns)
+
+    def record(self, column_datatype: dict, old: list = None, new: list = None):
+        """
+        Count a row that was inserted (old None), deleted (new None) or replaced, and add the values
+        of the new row to the distinct counts and the min and max.
+        """
+        self.modified += 1
+        if new is None:
+            return
+        for position, (column, dtype) in enumerate(column_datatype.items()):
+            entry = self.columns.get(column)
+            value = coerce(new[position], dtype)
+            if entry is None or value is None or value == '' or value != value:
+                continue
+            if old is None or old[position] != new[position]:
+                entry['distinct'].add(value)
+            if entry['min'] is None or value < entry['min']:
+                entry['min'] = value
+            if entry['max'] is None or value > entry['max']:
+                entry['max'] = value
+
+    def stale(self) -> bool:
+        return self.modified > self.rows * STATS_REFRESH_FRACTION
+
+    def fraction_below(self, entry: dict, literal) -> float:
+        """
+        Return the fraction of the non-null values of a column that are less than literal.
+        """
+        bounds = entry['histogram']
+        if not bounds or literal <= bounds[0]:
+            return 0.0
+        if literal > bounds[-1]:
+            return 1.0
+        bucket = bisect.bisect_left(bounds, literal) - 1
+        return (bucket + interpolate(literal, bounds[bucket], bounds[bucket + 1])) / (len(bounds) - 1)
+
+    def selectivity(self, column: str, op: str, literal) -> float:
+        """
+        Estimate the fraction of rows for which column op literal holds.
+        """
+        entry = self.columns.get(column)
+        if entry is None:
+            # a column added since the statistics were gathered
+            return LIKE_SELECTIVITY if op in ('=', '==', 'LIKE') else 1.0
+        present = 1.0 - entry['null_fraction']
+        in_range = entry['min'] is not None and entry['min'] <= literal <= entry['max']
+        equal = 1.0 / max(entry['distinct'].count(), 1) if in_range else 0.0
+        if op in ('=', '=='):
+            return present * equal
+        if op == '!=':
+            return present * (1.0 - equal)
+        if op == 'LIKE':
+            prefix = like_prefix(literal)
+            if prefix == literal:
+                return self.selectivity(column, '=', literal)
+            if not prefix:
+                return present * LIKE_SELECTIVITY
+            end = prefix_end(prefix)
+            upper = self.fraction_below(entry, end) if end is not None else 1.0
+            return present * max(upper - self.fraction_below(entry, prefix), equal)
+        below = self.fraction_below(entry, literal)
+        if op == '<':
+            fraction = below
+        elif op == '<=':
+            fraction = below + equal
+        elif op == '>':
+            fraction = 1.0 - below - equal
+        else:
+            fraction = 1.0 - below
+        return present * min(max(fraction, 0.0), 1.0)
+
+    def estimate(self, columns: list, conditions: list, rows: int) -> int:
+        """
+        Estimate the rows out of rows that match parsed conditions, taking the conditions to be independent.
+        """
+        fraction = 1.0
+        for position, _, op, literal in conditions:
+            if position == 0 and op in ('=', '=='):
+                # primary keys are unique
+                fraction *= 1.0 / rows if rows else 0.0
+            else:
+                fraction *= self.selectivity(columns[position], op, literal)
+        return int(round(rows * fraction))
+
+    def describe(self) -> dict:
+        return {
+            'rows': self.rows,
+            'modified': self.modified,
+            'columns': {column: {'distinct': entry['distinct'].count(), 'min': entry['min'], 'max': entry['max'],
+                                 'null_fraction': entry['null_fraction'], 'histogram': entry['histogram']}
+                        for column, entry in self.columns.items()},
+        }
+
+    def to_dict(self) -> dict:
+        return {'rows': self.rows, 'modified': self.modified,
+                'columns': {column: dict(entry, distinct=entry['distinct'].to_dict())
+                            for column, entry in self.columns.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'TableStats':
+        return cls(data['rows'], {column: dict(entry, distinct=HyperLogLog.from_dict(entry['distinct']))
+                                  for column, entry in data['columns'].items()}, data['modified'])
@@ -1,27 +1,87 @@
 import os
 import json
+import time
+import zlib
+import heapq
+from itertools import islice
 
-from index import index
+from index import index, INDEX_KINDS
+from bloom import build_filters, load_filters, save_filters
+from encoding import TABLE_ENCODING, encode_records, decode_records
+from query import aggregate, coerce, compile_predicate, parse_conditions
+from stats import TableStats
+from sort import parse_order, order_records
+from metrics import TABLE_SAVE_SECONDS, TABLE_BYTES_WRITTEN, CONSTRAINT_CHECK_SECONDS, BLOOM_CHECKS
+from profiling import trace
+from durability import write_file
+
+# how values are checked against a column type on write; str columns only check the type
+CONVERTERS = {int: int, float: float, str: None}
 
 class Table:
-    def __init__(self, name: str, db_path : str):
+    def __init__(self, name: str, db_path : str, schema: dict = None):
         """
         Initialize a new Table with a given name.
         
         Parameters:
         name (str): The name of the table.
+        schema (dict, optional): The entry of the table in metadata.json, applied before the rows are loaded.
         """
         self.name = name
         self.columns = []
         self.record_id_counter = 1
+        self.version = 0
         self.records = {}
         self.primary_key_values = set()
         self.column_datatype = {}
         self.column_constraints = {}
         self.table_file =os.path.join (db_path,self.name + '.json')
-        index(self.name)
+        self.db_name = os.path.basename(os.path.normpath(db_path))
+        self.bloom_file = os.path.join(db_path, self.name + '.bloom.json')
+        self.filters = None
+        self.file_crcs = {}
+        self.encoding = TABLE_ENCODING
+        self.block_cache = {}
+        self.schema_version = 1
+        self.schema_history = []
+        self.file_versions = {}
+        self.index = index(self.name)
+        self.indexes = {}
+        self.validator = ()
+        self.durability = None
+        self.write_mode = 'sync'
+        self.pending = False
+        self.ttl = None
+        # (expiry time, record id) of the rows with one, soonest first; entries of rows changed since are skipped
+        self.expiry = []
+        # primary keys by record id of expired rows taken out of memory but not yet deleted from the files
+        self.expired = {}
+        # statistics for estimating how many rows a where clause matches, gathered when first needed
+        self.stats = None
+        if schema is not None:
+            self.apply_schema(schema)
         self.load_data()
 
+    def apply_schema(self, schema: dict):
+        """
+        Set the columns, constraints and schema history from the entry of the table in metadata.json.
+        """
+        self.columns = schema['columns']
+        self.column_datatype = {col: self.convert_datatype(dtype) for col,dtype in zip(schema['columns'],schema['datatype'])}
+        self.primary_key_values = set(schema['primary_key_value'])
+        self.column_constraints = schema['constraint']
+        self.encoding = schema.get('encoding', 'json')
+        self.schema_version = schema.get('schema_version', 1)
+        self.schema_history = schema.get('schema_history', [])
+        self.file_versions = schema.get('file_versions', {})
+        self.durability = schema.get('durability')
+        self.ttl = schema.get('ttl')
+        self.stats = TableStats.from_dict(schema['statistics']) if schema.get('statistics') else None
+        # secondary indexes live in memory and are filled when the rows load
+        self.indexes = {column: INDEX_KINDS[kind](column, self.column_datatype[column])
+                        for column, kind in schema.get('indexes', {}).items()}
+        self.compile_validator()
+
     @staticmethod
     def convert_to_type(value: str, dtype: type):
         """
@@ -57,8 +117,10 @@ class Table:
     def load_data(self):
         if os.path.exists(self.table_file):
             file_path = self.table_file
-            with open(file_path, 'r') as file:
-                self.records = json.load(file)
+            with open(file_path, 'rb') as file:
+                data = file.read()
+                self.file_crcs = {os.path.basename(file_path): zlib.crc32(data)}
+                self.records = self.read_rows(os.path.basename(file_path), data)
                 if self.records:
                     # Set record_id_counter to one more than the maximum record_id in the file
                     self.record_id_counter = max(map(int, self.records.keys())) + 1
@@ -68,15 +130,552 @@ class Table:
         else:
             self.records = {}
             self.record_id_counter = 1   
+            self.file_crcs = {}
+            self.file_versions = {}
+        self.filters = None
+        self.rebuild_indexes()
     
     def save_data(self):
+        self.version += 1
+        if self.write_mode != 'sync':
+            # the flusher writes the table later, once for every write made until then
+            self.pending = True
+            return None
+        return self.write_data()
+
+    def write_data(self):
+        self.pending = False
         try:
-            os.makedirs(os.path.dirname(self.table_file),exist_ok=True)
-            with open(self.table_file, 'w') as file:
-                json.dump(self.records,file,indent = 4)
+            with TABLE_SAVE_SECONDS.time(self.db_name, self.name):
+                with trace.phase('serialization'):
+                    data = self.encode_records(self.records, self.block_cache)
+                    self.file_crcs = {os.path.basename(self.table_file): zlib.crc32(data)}
+                    self.file_versions = {os.path.basename(self.table_file):
+                                          [self.schema_version, self.file_crcs[os.path.basename(self.table_file)]]}
+                with trace.phase('storage'):
+                    os.makedirs(os.path.dirname(self.table_file),exist_ok=True)
+                    written = self.save_filters()
+                    write_file(self.table_file, data)
+            TABLE_BYTES_WRITTEN.inc(self.db_name, self.name, amount=len(data) + written)
         except IOError as e:
+            self.pending = True
             return f"error saving data {e}"    
     
+    def data_files(self) -> list:
+        return [self.table_file]
+
+    def read_rows(self, file_name: str, data: bytes) -> dict:
+        """
+        Decode a data file and bring its rows up to the current schema.
+
+        ALTER TABLE doesn't rewrite data files, so a file may still hold rows of an older schema
+        version. metadata.json records the version of every file together with its checksum; a
+        file whose checksum doesn't match was written after metadata.json, and so with the
+        current schema, since every schema change saves metadata.json first.
+        """
+        crc = zlib.crc32(data)
+        recorded = self.file_versions.get(file_name)
+        version = recorded[0] if recorded and recorded[1] == crc else self.schema_version
+        self.file_versions[file_name] = [version, crc]
+        return self.upgrade_rows(decode_records(data), version)
+
+    def upgrade_rows(self, records: dict, version: int) -> dict:
+        """
+        Replay the schema changes made after version on rows written with that version.
+        """
+        changes = [change for change in self.schema_history if change['version'] > version]
+        if not changes:
+            return records
+        upgraded = {}
+        for record_id, row in records.items():
+            for change in changes:
+                row = self.change_row(row, change)
+            upgraded[record_id] = row
+        return upgraded
+
+    @staticmethod
+    def change_row(row: list, change: dict) -> list:
+        if change['operation'] == 'add_column':
+            return row + [change['default']]
+        position = change['position']
+        return row[:position] + row[position + 1:]
+
+    def files_current(self) -> bool:
+        """
+        Return True if every data file is written with the current schema.
+        """
+        return all(version == self.schema_version for version, _ in self.file_versions.values())
+
+    def pending_history(self) -> list:
+        """
+        Return the schema changes some data file still has to be upgraded through.
+        """
+        oldest = min((version for version, _ in self.file_versions.values()), default=self.schema_version)
+        return [change for change in self.schema_history if change['version'] > oldest]
+
+    def add_column(self, column: str, datatype: str, default=None, constraints: list = None) -> dict:
+        """
+        Add a column at the end of the table. Only the schema changes: rows in memory get the
+        default without being validated or written, and data files are upgraded when they are
+        next read, written or compacted.
+
+        Parameters:
+        column (str): The name of the new column.
+        datatype (str): 'int', 'str' or 'float'.
+        default (optional): The value of the column in existing rows.
+        constraints (list, optional): Constraints of the column, e.g. ['NOT NULL'].
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        constraints = constraints or []
+        if column in self.columns:
+            return {"success": False, "message": f"Column {column} already exists"}
+        if datatype not in ('int', 'str', 'float'):
+            return {"success": False, "message": f"Unsupported data type: {datatype}"}
+        if (default is None or default == '') and 'NOT NULL' in constraints and self.records:
+            return {"success": False, "message": f"Column {column} doesn't allow NULL values and needs a default"}
+        if 'UNIQUE' in constraints and len(self.records) > 1:
+            return {"success": False, "message": f"Column {column} only allows unique values"}
+        if default is not None and default != '':
+            try:
+                self.convert_to_type(default, self.convert_datatype(datatype))
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+
+        change = {'version': self.schema_version + 1, 'operation': 'add_column', 'column': column,
+                  'datatype': datatype, 'default': default}
+        self.columns = self.columns + [column]
+        self.column_datatype[column] = self.convert_datatype(datatype)
+        self.column_constraints[column] = constraints
+        self.apply_change(change)
+        return {"success": True, "message": f"Column {column} added"}
+
+    def drop_column(self, column: str) -> dict:
+        """
+        Drop a column. Like add_column, only the schema changes until files are next written.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if column not in self.columns:
+            return {"success": False, "message": f"Column {column} doesn't exist"}
+        position = self.columns.index(column)
+        if position == 0:
+            return {"success": False, "message": f"Column {column} is the primary key and can't be dropped"}
+
+        change = {'version': self.schema_version + 1, 'operation': 'drop_column', 'column': column,
+                  'position': position}
+        self.columns = self.columns[:position] + self.columns[position + 1:]
+        del self.column_datatype[column]
+        self.column_constraints.pop(column, None)
+        self.indexes.pop(column, None)
+        if self.stats is not None:
+            self.stats.columns.pop(column, None)
+        if self.ttl is not None and self.ttl['column'] == column:
+            self.ttl = None
+            self.expiry = []
+        self.apply_change(change)
+        return {"success": True, "message": f"Column {column} dropped"}
+
+    def apply_change(self, change: dict):
+        self.schema_history = self.schema_history + [change]
+        self.schema_version = change['version']
+        # the rows in memory are replaced, never changed in place, so snapshots and cached blocks stay valid
+        self.replace_records({record_id: self.change_row(row, change) for record_id, row in self.records.items()})
+        self.filters = None
+        self.compile_validator()
+        self.version += 1
+
+    def encode_records(self, records: dict, cache: dict = None) -> bytes:
+        """
+        Serialize records in the encoding of the table, 'json' or the compressed 'block' format.
+        Either is read back by load_data, which tells them apart by the first bytes of the file.
+        """
+        if self.encoding == 'block':
+            return encode_records(records, self.datatype_names(), cache)
+        return json.dumps(records, indent=4).encode('utf-8')
+
+    def unique_columns(self) -> dict:
+        """
+        Return column name -> position of the UNIQUE columns other than the primary key.
+        Only those get Bloom filters: they save a scan of the rows, while a primary key is looked
+        up in primary_key_values, which costs less than the filter itself.
+        """
+        return {column: position for position, column in enumerate(self.columns)
+                if position and 'UNIQUE' in self.column_constraints.get(column, [])}
+
+    def bloom_filters(self) -> dict:
+        """
+        Return the Bloom filters of the unique columns, loading them on first use.
+        The saved filters are only used if they were written together with the current data
+        files; otherwise, e.g. after a crash or a restore, they are rebuilt from the records.
+        """
+        if self.filters is None:
+            columns = self.unique_columns()
+            self.filters = load_filters(self.bloom_file, columns, self.file_crcs) if columns else {}
+            if self.filters is None:
+                self.filters = build_filters(self.records, columns)
+        return self.filters
+
+    def might_contain(self, column: str, value) -> bool:
+        """
+        Return False if no row holds value in a unique column, True if one may.
+        """
+        bloom = self.bloom_filters().get(column)
+        if bloom is None:
+            return True
+        found = bloom.might_contain(value)
+        BLOOM_CHECKS.inc(self.db_name, self.name, 'positive' if found else 'negative')
+        return found
+
+    def remember_unique(self, record: list):
+        """
+        Add the unique values of a row just stored in records to the filters.
+        """
+        if self.filters is None:
+            return
+        columns = self.unique_columns()
+        for column, bloom in self.filters.items():
+            bloom.add(record[columns[column]])
+        if any(bloom.saturated() for bloom in self.filters.values()):
+            self.filters = build_filters(self.records, columns)
+
+    def rebuild_filters(self):
+        """
+        Rebuild the filters from the records, dropping deleted and overwritten values, and save them.
+        """
+        self.filters = build_filters(self.records, self.unique_columns())
+        self.save_filters()
+
+    def save_filters(self) -> int:
+        if not self.filters:
+            return 0
+        return save_filters(self.bloom_file, self.filters, self.file_crcs)
+
+    def replace_records(self, records: dict):
+        """
+        Swap in reshaped rows with the same record ids, without marking anything to be written.
+        """
+        self.records = records
+
+    def rebuild_indexes(self):
+        """
+        Rebuild the primary key index and the secondary indexes from the records.
+        """
+        self.index.build(self.records)
+        for column, secondary in self.indexes.items():
+            secondary.build(self.records, self.columns.index(column))
+        # rows loaded or swapped in by a compaction don't hold the expired ones, so there is nothing left to delete
+        self.expired = {}
+        self.rebuild_expiry()
+
+    def index_row(self, record_id, old: list = None, new: list = None):
+        """
+        Update the secondary indexes for a row that was inserted (old None), deleted (new None) or replaced.
+        """
+        for column, secondary in self.indexes.items():
+            position = self.columns.index(column)
+            if old is not None and new is not None and old[position] == new[position]:
+                continue
+            if old is not None:
+                secondary.remove(record_id, old[position])
+            if new is not None:
+                secondary.add(record_id, new[position])
+        if self.stats is not None:
+            self.stats.record(self.column_datatype, old, new)
+        if self.ttl is not None and new is not None:
+            expires_at = self.expires_at(new)
+            if expires_at is not None and (old is None or self.expires_at(old) != expires_at):
+                heapq.heappush(self.expiry, (expires_at, record_id))
+                # entries of deleted or re-timed rows are only dropped once due, so trim them now and then
+                if len(self.expiry) > 2 * len(self.records) + 64:
+                    self.rebuild_expiry()
+
+    def set_ttl(self, ttl: dict = None) -> dict:
+        """
+        Make rows expire at the time, in seconds since the epoch, held in one of their columns.
+
+        Parameters:
+        ttl (dict): 'column', an int or float column holding the expiry time, and optionally
+        'seconds': rows inserted without an expiry time get one that many seconds from then.
+        None turns expiry off.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if ttl is not None:
+            if not isinstance(ttl, dict) or ttl.get('column') not in self.columns[1:]:
+                return {"success": False, "message": "TTL needs a column other than the primary key for the expiry time"}
+            if self.column_datatype[ttl['column']] not in (int, float):
+                return {"success": False, "message": f"TTL column {ttl['column']} must be int or float"}
+            seconds = ttl.get('seconds')
+            if seconds is not None and (type(seconds) not in (int, float) or not seconds > 0):
+                return {"success": False, "message": "TTL seconds must be a positive number"}
+            ttl = {'column': ttl['column'], 'seconds': seconds}
+        self.ttl = ttl
+        self.rebuild_expiry()
+        return {"success": True, "message": "TTL set" if ttl is not None else "TTL removed"}
+
+    def expires_at(self, record: list):
+        """
+        Return the expiry time of a row, or None if it never expires.
+        """
+        try:
+            value = float(record[self.columns.index(self.ttl['column'])])
+        except (TypeError, ValueError, IndexError):
+            return None
+        return value if value == value else None
+
+    def rebuild_expiry(self):
+        self.expiry = []
+        if self.ttl is not None:
+            self.expiry = [(expires_at, record_id) for record_id, expires_at
+                           in ((record_id, self.expires_at(record)) for record_id, record in self.records.items())
+                           if expires_at is not None]
+            heapq.heapify(self.expiry)
+
+    def stamp_expiry(self, row: list) -> list:
+        """
+        Return a row about to be inserted with its expiry time filled in from the TTL seconds, if it has none.
+        """
+        if self.ttl is None or self.ttl['seconds'] is None or not isinstance(row, list) or \
+                len(row) != len(self.columns):
+            return row
+        position = self.columns.index(self.ttl['column'])
+        if row[position] is not None and row[position] != '':
+            return row
+        expires_at = self.column_datatype[self.ttl['column']](time.time() + self.ttl['seconds'])
+        return row[:position] + [str(expires_at)] + row[position + 1:]
+
+    def expiry_due(self, now: float) -> bool:
+        return bool(self.expiry) and self.expiry[0][0] <= now
+
+    def expire(self, now: float, limit: int = None) -> int:
+        """
+        Take the rows whose expiry time has passed out of the records and indexes, found through
+        the expiry heap. Nothing is written; the rows wait in expired until they are reaped.
+
+        Parameters:
+        now (float): The current time in seconds since the epoch.
+        limit (int, optional): Take out at most this many rows.
+
+        Returns:
+        int: The number of rows taken out.
+        """
+        count = 0
+        while self.expiry and self.expiry[0][0] <= now and (limit is None or count < limit):
+            expires_at, record_id = heapq.heappop(self.expiry)
+            record = self.records.get(record_id)
+            if record is None or self.expires_at(record) != expires_at:
+                continue
+            del self.records[record_id]
+            self.primary_key_values.discard(record[0])
+            self.index.remove_index(record[0])
+            self.index_row(record_id, old=record)
+            self.expired[record_id] = record[0]
+            count += 1
+        if count:
+            # the rows changed, so e.g. a compaction started before doesn't swap in a copy that still has them
+            self.version += 1
+        return count
+
+    def take_expired(self, limit: int) -> list:
+        """
+        Remove and return up to limit (record id, primary key) pairs of expired rows to delete from the files.
+        """
+        taken = list(islice(self.expired.items(), limit))
+        for record_id, _ in taken:
+            del self.expired[record_id]
+        return taken
+
+    def create_index(self, column: str, kind: str = 'hash') -> dict:
+        """
+        Build a secondary index of a column.
+
+        Parameters:
+        column (str): The column to index.
+        kind (str): 'hash' for equality lookups, 'ordered' for equality and range lookups, and for
+        str columns 'prefix' for LIKE 'abc%' as well as what 'ordered' does, or 'ngram' for LIKE '%abc%'.
+
+        Returns:
+        dict: A message indicating success or failure of the operation.
+        """
+        if column not in self.columns:
+            return {"success": False, "message": f"Column {column} doesn't exist"}
+        if kind not in INDEX_KINDS:
+            return {"success": False, "message": f"Index kind must be one of {', '.join(INDEX_KINDS)}"}
+        datatypes = INDEX_KINDS[kind].datatypes
+        if datatypes is not None and self.column_datatype[column] not in datatypes:
+            return {"success": False, "message": f"A {kind} index needs a "
+                                                 f"{' or '.join(dtype.__name__ for dtype in datatypes)} column"}
+        if column in self.indexes:
+            return {"success": False, "message": f"Column {column} already has a {self.indexes[column].kind} index"}
+        secondary = INDEX_KINDS[kind](column, self.column_datatype[column])
+        secondary.build(self.records, self.columns.index(column))
+        self.indexes[column] = secondary
+        return {"success": True, "message": f"Index on {column} created"}
+
+    def drop_index(self, column: str) -> dict:
+        if self.indexes.pop(column, None) is None:
+            return {"success": False, "message": f"Column {column} has no index"}
+        return {"success": True, "message": f"Index on {column} dropped"}
+
+    def analyze(self) -> TableStats:
+        """
+        Gather the statistics of the table anew.
+        """
+        self.stats = TableStats.gather(self.column_datatype, self.records)
+        return self.stats
+
+    def statistics(self) -> TableStats:
+        """
+        Return the statistics of the table, gathered again first if they are missing or enough rows
+        changed since. Gathering looks at every row, so its cost is spread over the writes that made
+        the statistics stale.
+        """
+        if self.stats is None or self.stats.stale():
+            self.analyze()
+        return self.stats
+
+    def access_path(self, conditions: list):
+        """
+        Choose the parsed condition to look records up by: the one of those an index can answer
+        that is estimated to match the fewest rows, or None if the records have to be scanned.
+        The statistics are only consulted when there is a choice to make.
+        """
+        usable = [condition for condition in conditions if self.answerable(condition)]
+        if len(usable) < 2:
+            return usable[0] if usable else None
+        stats, rows = self.statistics(), len(self.records)
+        return min(usable, key=lambda condition: stats.estimate(self.columns, [condition], rows))
+
+    def answerable(self, condition: tuple) -> bool:
+        """
+        Return True if a parsed condition can be answered from the primary key or a secondary index.
+        """
+        position, _, op, literal = condition
+        return (position == 0 and op in ('=', '==')) or \
+            (self.columns[position] in self.indexes and self.indexes[self.columns[position]].answers(op, literal))
+
+    def index_search(self, where: list):
+        """
+        Return the record ids the access path of a where clause gives, or None when no condition
+        can be answered from an index. The records still have to be checked against the whole
+        where clause.
+        """
+        condition = self.access_path(parse_conditions(self.columns, self.datatype_names(), where))
+        if condition is None:
+            return None
+        position, _, op, literal = condition
+        if position == 0 and op in ('=', '=='):
+            return [record_id for record_id, _ in self.lookup(0, literal)]
+        return self.indexes[self.columns[position]].search(op, literal)
+
+    def explain(self, where: list = None) -> dict:
+        """
+        Describe how a where clause is answered: the access path, and the rows the statistics
+        estimate each condition and the whole clause to match next to the rows it actually does.
+        """
+        conditions = parse_conditions(self.columns, self.datatype_names(), where)
+        condition = self.access_path(conditions)
+        stats, rows = self.statistics(), len(self.records)
+        start = time.perf_counter()
+        actual = len(self.query(where))
+        seconds = time.perf_counter() - start
+        return {
+            'table': self.name,
+            'rows': rows,
+            'access': 'scan' if condition is None else 'primary key' if condition[0] == 0 else
+                      f"{self.indexes[self.columns[condition[0]]].kind} index",
+            'index_condition': None if condition is None else
+                               [self.columns[condition[0]], condition[2], condition[3]],
+            'conditions': [{'condition': [self.columns[position], op, literal],
+                            'estimated_rows': stats.estimate(self.columns, [(position, dtype, op, literal)], rows)}
+                           for position, dtype, op, literal in conditions],
+            'estimated_rows': stats.estimate(self.columns, conditions, rows),
+            'actual_rows': actual,
+            'seconds': seconds,
+        }
+
+    def indexable(self, where: list) -> bool:
+        return any(map(self.answerable, parse_conditions(self.columns, self.datatype_names(), where)))
+
+    def encode_files(self, records: dict) -> dict:
+        """
+        Serialize records the way save_data would, keyed by the file each part belongs in.
+        """
+        return {self.table_file: self.encode_records(records)}
+
+    def delete_files(self):
+        for path in self.data_files() + [self.bloom_file]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def compile_validator(self):
+        """
+        Work out once per schema what validating a row takes, so writes don't look up constraints
+        and column positions for every value: one (position, column, converter, not null, unique)
+        entry per column. The primary key is checked against primary_key_values instead of as UNIQUE.
+        """
+        entries = []
+        for position, column in enumerate(self.columns):
+            constraints = self.column_constraints.get(column, [])
+            entries.append((position, column, CONVERTERS.get(self.column_datatype[column]),
+                            'NOT NULL' in constraints, position != 0 and 'UNIQUE' in constraints))
+        self.validator = tuple(entries)
+
+    def validate_row(self, row: list, record_id: str = None):
+        """
+        Check a row against the datatypes and the NOT NULL and UNIQUE constraints of the table.
+
+        Parameters:
+        row (list): The values of the row.
+        record_id (str, optional): The record the row replaces, whose values don't count against UNIQUE.
+
+        Returns:
+        str: Why the row is invalid, or None if it is valid.
+        """
+        if len(row) != len(self.validator):
+            return "Values missing for some columns"
+        for position, column, convert, not_null, unique in self.validator:
+            value = row[position]
+            if not_null and (value is None or value == ''):
+                return f"Column {column} doesn't allow NULL values"
+            if unique and self.holds_value(position, value, record_id):
+                return f"Column {column} only allows unique values"
+            error = self.check_type(column, convert, value)
+            if error is not None:
+                return error
+        return None
+
+    @staticmethod
+    def check_type(column: str, convert, value):
+        """
+        Return why value doesn't fit a column with the given converter, or None if it does.
+        """
+        if convert is None:
+            return None if isinstance(value, str) else f"Invalid Data type for column {column}. Expected str"
+        try:
+            convert(value)
+        except (TypeError, ValueError) as e:
+            return f"Conversion error: {e}"
+        return None
+
+    def holds_value(self, position: int, value, record_id: str = None) -> bool:
+        """
+        Return True if a record other than record_id holds value in the column at position.
+        The Bloom filter rules most new values out; otherwise an index on the column narrows
+        the records down before their values are compared.
+        """
+        column = self.columns[position]
+        if not self.might_contain(column, value):
+            return False
+        secondary = self.indexes.get(column) if self.has_index(position) else None
+        key = coerce(value, secondary.dtype) if secondary is not None else None
+        records = self.lookup(position, key) if key is not None and key == key else self.records.items()
+        return any(record[position] == value for other, record in records if other != record_id)
+
     def insert_record(self, content: list) -> str:
         """
         Insert a new record into the table.
@@ -89,43 +688,72 @@ class Table:
         """
         if len(content) != len(self.columns):
             return {"success": False, "message": f"Values missing for some columns"}
+        content = self.stamp_expiry(content)
         
         # Check for unique primary key
         primary_key_value = content[0]
         if primary_key_value in self.primary_key_values:
-            return {"sucess": False, "message": f"Primary key {primary_key_value} should be unique"}
+            return {"success": False, "message": f"Primary key {primary_key_value} should be unique"}
 
-        for column, value in zip(self.columns, content):
-            
+        with CONSTRAINT_CHECK_SECONDS.time(self.db_name, self.name, 'insert'), trace.phase('validation'):
+            error = self.validate_row(content)
+        if error is not None:
+            return {"success": False, "message": error}
 
-            # Check for NOT NULL constraint
-            if (value is None or value == '') and 'NOT NULL' in self.column_constraints.get(column, []):
-                return {"success":False,"message":f"Column {column} doesn't allow NULL values"}
+        record_id = self.add_row(content)
+        self.save_data()
+        return {"success": True , "message": f"Record inserted into the table", "record_id":record_id,
+                "record": content}
 
-            # Check for UNIQUE constraint
-            if 'UNIQUE' in self.column_constraints.get(column, []):
-                if any(record[self.columns.index(column)] == value for record in self.records.values()):
-                    return {"success": False , "message": f"Column {column} only allows unique values"}
-            
-            
-            datatype = self.column_datatype.get(column)
-            try:
-                value = self.convert_to_type(value, datatype)
-            except ValueError as e:
-                return {'success': False, "message": str(e) }
-            # Check for Data Type
-            if not isinstance(value, datatype):
-                return {"success": False , "message": f"Invalid Data type of column {column}. Expected {datatype.__name__}"}
+    def add_row(self, content: list) -> str:
+        """
+        Store a validated row under the next record id and index it, without saving.
+        """
+        # record ids are kept as strings so they match the keys loaded back from JSON
+        record_id = str(self.record_id_counter)
+        self.primary_key_values.add(content[0])
+        self.records[record_id] = content
+        self.index_row(record_id, new=content)
+        self.remember_unique(content)
+        self.record_id_counter += 1
+        self.index.insert_index(content[0], record_id)
+        return record_id
 
-        
+    def insert_records(self, rows: list) -> dict:
+        """
+        Insert many records, validating all of them before any is stored, and save the table once.
 
-        self.primary_key_values.add(primary_key_value)
-        record_id = self.record_id_counter
-        self.records[record_id] = content
-        self.record_id_counter+=1
-        self.save_data()
-        index.insert_index(primary_key_value,record_id)
-        return {"success": True , "message": f"Record inserted into the table", "record_id":record_id}
+        Parameters:
+        rows (list): Lists of values to insert into the table.
+
+        Returns:
+        dict: A message indicating success or failure, and on success the changes made, each with
+        the record id and the record.
+        """
+        if not isinstance(rows, list) or not all(isinstance(row, list) for row in rows):
+            return {"success": False, "message": "Rows must be a list of lists of values"}
+        rows = [self.stamp_expiry(row) for row in rows]
+        unique = [position for position, _, _, _, is_unique in self.validator if is_unique]
+        seen = {position: set() for position in [0] + unique}
+        with CONSTRAINT_CHECK_SECONDS.time(self.db_name, self.name, 'insert'), trace.phase('validation'):
+            for number, row in enumerate(rows, start=1):
+                error = self.validate_row(row)
+                if error is None and (row[0] in seen[0] or row[0] in self.primary_key_values):
+                    error = f"Primary key {row[0]} should be unique"
+                # the rows of the batch have to be unique among themselves too
+                for position in unique if error is None else ():
+                    if row[position] in seen[position]:
+                        error = f"Column {self.columns[position]} only allows unique values"
+                        break
+                if error is not None:
+                    return {"success": False, "message": f"Row {number}: {error}"}
+                for position, values in seen.items():
+                    values.add(row[position])
+
+        changes = [{'record_id': self.add_row(row), 'record': row} for row in rows]
+        if changes:
+            self.save_data()
+        return {"success": True, "message": f"{len(changes)} records inserted", "changes": changes}
 
     def define_columns(self, columns: list, datatype: list, constraints: dict = None) -> str:
         """
@@ -144,6 +772,7 @@ class Table:
            
 
         self.column_datatype = {col: self.convert_datatype(data) for col, data in zip(columns, datatype)}
+        self.filters = None
 
         for column in columns:
             self.columns.append(column)
@@ -151,6 +780,7 @@ class Table:
                 self.column_constraints[column] = constraints.get(column, [])
             else:
                 self.column_constraints[column] = []
+        self.compile_validator()
         return {"success": True, "message": "Columns inserted successfully"}
 
     def select(self) -> list:
@@ -162,6 +792,130 @@ class Table:
         """
         return self.records
 
+    def datatype_names(self) -> list:
+        return [self.column_datatype[column].__name__ for column in self.columns]
+
+    def query(self, where: list = None) -> dict:
+        """
+        Select the records matching a where clause.
+
+        Parameters:
+        where (list, optional): Conditions as [column, operator, value], all of which must hold.
+
+        Returns:
+        dict: The matching records keyed by record id.
+        """
+        if not where:
+            return self.records
+        record_ids = self.index_search(where)
+        if record_ids is None:
+            return self.scan(where)
+        predicate = compile_predicate(self.columns, self.datatype_names(), where)
+        # a hash index hands out its live set of ids, which a concurrent write may change
+        records = ((record_id, self.records.get(record_id)) for record_id in list(record_ids))
+        return {record_id: record for record_id, record in records if record is not None and predicate(record)}
+
+    def scan(self, where: list) -> dict:
+        predicate = compile_predicate(self.columns, self.datatype_names(), where)
+        # reads don't hold the database lock; dict.copy() takes the rows in one step, so a concurrent
+        # write can't change the dict while the predicate runs over it
+        return {record_id: record for record_id, record in dict.copy(self.records).items() if predicate(record)}
+
+    def order(self, where: list = None, order_by=None, limit: int = None) -> list:
+        """
+        Select the records matching a where clause in a given order, optionally only the first ones.
+
+        Ordering by the primary key alone walks the ordered primary key index, so with a limit
+        only about limit rows are looked at. Other orders use a top-k heap when there is a
+        limit and sort the matching records otherwise. There is no external sort: tables are
+        loaded whole, so the matching records are already in memory and spilling them to disk
+        wouldn't lower the peak.
+
+        Parameters:
+        where (list, optional): Conditions as [column, operator, value], all of which must hold.
+        order_by (str | list, optional): Sort keys such as 'age desc' or ['age', 'desc'], most significant first.
+        limit (int, optional): Return at most this many records.
+
+        Returns:
+        list: (record_id, record) pairs in order.
+        """
+        if limit is not None and (type(limit) is not int or limit < 0):
+            raise ValueError("Limit must be a non-negative integer")
+        order = parse_order(self.columns, self.datatype_names(), order_by)
+        if len(order) == 1 and order[0][0] == 0:
+            return list(islice(self.scan_primary_key(order[0][2], where, limit), limit))
+        # without a where clause query() returns the live records, which list() copies in one step
+        items = list(self.query(where).items())
+        if not order:
+            return items[:limit] if limit is not None else items
+        return order_records(items, order, limit)
+
+    def scan_primary_key(self, descending: bool, where: list = None, limit: int = None):
+        """
+        Yield the records matching a where clause in primary key order, from the ordered index.
+        """
+        predicate = compile_predicate(self.columns, self.datatype_names(), where)
+        entries = self.index.ordered(self.column_datatype[self.columns[0]])
+        if where or limit is None:
+            entries = list(entries)
+        elif descending:
+            entries = entries[max(len(entries) - limit, 0):]
+        else:
+            entries = entries[:limit]
+        for entry in reversed(entries) if descending else entries:
+            record_id = self.index.find_index(entry[-1])
+            record = self.records.get(record_id)
+            if record is not None and predicate(record):
+                yield record_id, record
+
+    def has_index(self, position: int) -> bool:
+        """
+        Return True if rows can be looked up by the value of the column at position without a scan.
+        """
+        return position == 0 or (self.columns[position] in self.indexes and
+                                 self.indexes[self.columns[position]].answers('=', None))
+
+    def lookup(self, position: int, value) -> list:
+        """
+        Return the (record_id, record) pairs whose column at position may equal value, found through
+        the index of the column. value is already converted to the column type; the primary key
+        index holds keys as they were inserted, so their usual spellings are tried. Callers check
+        the records they get back.
+        """
+        if position != 0:
+            if not self.has_index(position):
+                raise ValueError(f"Column {self.columns[position]} has no index")
+            # joins stream outside the database lock, so copy the ids out of the live index set first
+            record_ids = list(self.indexes[self.columns[position]].search('=', value))
+            records = ((record_id, self.records.get(record_id)) for record_id in record_ids)
+            return [(record_id, record) for record_id, record in records if record is not None]
+        candidates = [value, str(value)]
+        if isinstance(value, float) and value.is_integer():
+            candidates += [int(value), str(int(value))]
+        found = []
+        for key in dict.fromkeys(candidates):
+            record_id = self.index.find_index(key)
+            record = self.records.get(record_id) if record_id is not None else None
+            if record is not None:
+                found.append((record_id, record))
+        return found
+
+    def aggregate(self, function: str, column: str = None, where: list = None):
+        """
+        Compute count, sum, min, max or avg of a column over the records matching a where clause.
+        """
+        position, dtype = self.aggregate_target(function, column)
+        return aggregate(self.query(where).values(), function, position, dtype)
+
+    def aggregate_target(self, function: str, column: str = None):
+        if column is None:
+            if function != 'count':
+                raise ValueError(f"Aggregate {function} needs a column")
+            return None, None
+        if column not in self.columns:
+            raise ValueError(f"Column {column} doesn't exist")
+        return self.columns.index(column), self.column_datatype[column]
+
     def update_record(self, primary_key: any, new_record: list) -> str:
         """
         Update an existing record in the table.
@@ -176,13 +930,13 @@ class Table:
         # Find the index of the record with the given primary key
         
         
-        record_id = index.find_index(primary_key)
+        record_id = self.index.find_index(primary_key)
         
         #indexing failed, now manual search
         if record_id == None:
-            for index, record in self.records.items():
+            for rid, record in self.records.items():
                 if record[0] == primary_key:
-                   record_id = index
+                   record_id = rid
                    break
 
         if record_id is None:
@@ -199,53 +953,38 @@ class Table:
             return {'success': False, 'message':f"Primary key {new_primary_key} should be unique" }
 
         # Validate the new record values and constraints
-        for col, value in zip(self.columns, new_record):
-            datatype = self.column_datatype.get(col)
-
-        # Check for NOT NULL constraint
-            if value == '' and 'NOT NULL' in self.column_constraints.get(col, []):
-               return {'success': False, 'message':f"Column {col} doesn't allow NULL values" }
-
-        # Check for UNIQUE constraint
-            if 'UNIQUE' in self.column_constraints.get(col, []):
-               for index,record in self.records.items():
-                   if record[self.columns.index(col)] == value and record[0] != primary_key:
-                       return {'success': False, 'message': f"Column {col} only allows unique values"}
-
-            # Check for valid datatype
-            try:
-                value = self.convert_to_type(value, datatype)
-            except ValueError as e:
-                return str(e)
-
-            if not isinstance(value, datatype):
-                return {'success': False,'message': f"Invalid Data type for column {col}. Expected {datatype.__name__}" }
+        with CONSTRAINT_CHECK_SECONDS.time(self.db_name, self.name, 'update'), trace.phase('validation'):
+            error = self.validate_row(new_record, record_id)
+        if error is not None:
+            return {'success': False, 'message': error}
 
+        # Update the primary key set if the primary key is changed
+        if new_primary_key != primary_key:
+            old_pri_key = primary_key
+            new_pri_key = new_primary_key
             
+            self.primary_key_values.remove(primary_key)
+            self.primary_key_values.add(new_primary_key)
+            self.index.remove_index(primary_key)
+            self.index.insert_index(new_primary_key, record_id)
+        else:
+            old_pri_key = None
+            new_pri_key = None    
 
-            # Update the primary key set if the primary key is changed
-            if new_primary_key != primary_key:
-                old_pri_key = primary_key
-                new_pri_key = new_primary_key
-                
-                self.primary_key_values.remove(primary_key)
-                self.primary_key_values.add(new_primary_key)
-            else:
-                old_pri_key = None
-                new_pri_key = None    
-
-            # Update the record
-            original_record = self.records[record_id]
-            self.records[record_id] = new_record
-            self.save_data()
-            return {
-                    'success': True, 
-                    'message': f"Record with primary key {primary_key} has been updated successfully", 
-                    'record_id': record_id,
-                    'original_record': original_record,
-                    'old_pri_key': old_pri_key,
-                    'new_pri_key':new_pri_key 
-                    }
+        # Update the record
+        original_record = self.records[record_id]
+        self.records[record_id] = new_record
+        self.index_row(record_id, original_record, new_record)
+        self.remember_unique(new_record)
+        self.save_data()
+        return {
+                'success': True, 
+                'message': f"Record with primary key {primary_key} has been updated successfully", 
+                'record_id': record_id,
+                'original_record': original_record,
+                'old_pri_key': old_pri_key,
+                'new_pri_key':new_pri_key 
+                }
 
 
     def delete_record(self, primary_key: any) -> str:
@@ -259,18 +998,20 @@ class Table:
         str: A message indicating success or failure of the operation.
         """
         
-        record_id = index.find_index(primary_key)
+        record_id = self.index.find_index(primary_key)
          
         if record_id == None:
-            for index,record in self.records.items():
+            for rid,record in self.records.items():
                 if record[0] == primary_key:
-                    record_id = index
+                    record_id = rid
                     break
             
         if record_id is not None:
             record = self.records[record_id]
             del self.records[record_id]
+            self.index_row(record_id, old=record)
             self.primary_key_values.remove(primary_key)
+            self.index.remove_index(primary_key)
             old_pri_key = primary_key
             self.save_data()
             return {'success': True,
@@ -280,3 +1021,111 @@ class Table:
                     'old_pri_key': primary_key
                     }
         return {'success': False, 'message': f"Record with primary key {primary_key} not found" }
+
+    def matching(self, where: list = None) -> list:
+        """
+        Return the (record_id, record) pairs matching a where clause. Conditions an index can answer
+        are looked up in it; otherwise the table is scanned once.
+        """
+        return list(self.query(where).items())
+
+    def parse_assignments(self, assignments: dict) -> dict:
+        """
+        Validate a SET clause of column -> new value against the columns and their constraints.
+
+        Returns:
+        dict: column position -> new value. Raises ValueError if a column doesn't exist or a value
+        breaks its NOT NULL constraint or datatype.
+        """
+        if not isinstance(assignments, dict) or not assignments:
+            raise ValueError("Set must map at least one column to its new value")
+        parsed = {}
+        for column, value in assignments.items():
+            if column not in self.columns:
+                raise ValueError(f"Column {column} doesn't exist")
+            position = self.columns.index(column)
+            _, _, convert, not_null, _ = self.validator[position]
+            if not_null and (value is None or value == ''):
+                raise ValueError(f"Column {column} doesn't allow NULL values")
+            error = self.check_type(column, convert, value)
+            if error is not None:
+                raise ValueError(error)
+            parsed[position] = value
+        return parsed
+
+    def update_where(self, where: list, assignments: dict) -> dict:
+        """
+        Set columns of every record matching a where clause, validating all of them before any is
+        changed, and save the table once.
+
+        Parameters:
+        where (list): Conditions as [column, operator, value], all of which must hold.
+        assignments (dict): Column -> new value.
+
+        Returns:
+        dict: A message indicating success or failure, and on success the changes made, each with
+        the record id, the original and new record and the old and new primary key when it changed.
+        """
+        try:
+            values = self.parse_assignments(assignments)
+            matches = self.matching(where)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+        with CONSTRAINT_CHECK_SECONDS.time(self.db_name, self.name, 'update'), trace.phase('validation'):
+            matched_id = matches[0][0] if matches else None
+            for position, value in values.items():
+                column = self.columns[position]
+                if position != 0 and not self.validator[position][4]:
+                    continue
+                # a unique value can be given to at most one record, and only if no other holds it
+                if len(matches) > 1:
+                    return {'success': False, 'message': f"Column {column} only allows unique values"}
+                if position == 0 and value in self.primary_key_values and \
+                        all(record[0] != value for _, record in matches):
+                    return {'success': False, 'message': f"Primary key {value} should be unique"}
+                if position != 0 and self.holds_value(position, value, matched_id):
+                    return {'success': False, 'message': f"Column {column} only allows unique values"}
+
+        changes = []
+        for record_id, record in matches:
+            new_record = list(record)
+            for position, value in values.items():
+                new_record[position] = value
+            old_pri_key, new_pri_key = (record[0], new_record[0]) if new_record[0] != record[0] else (None, None)
+            if old_pri_key is not None:
+                self.primary_key_values.discard(old_pri_key)
+                self.primary_key_values.add(new_pri_key)
+                self.index.remove_index(old_pri_key)
+                self.index.insert_index(new_pri_key, record_id)
+            self.records[record_id] = new_record
+            self.index_row(record_id, record, new_record)
+            self.remember_unique(new_record)
+            changes.append({'record_id': record_id, 'original_record': record, 'record': new_record,
+                            'old_pri_key': old_pri_key, 'new_pri_key': new_pri_key})
+        if changes:
+            self.save_data()
+        return {'success': True, 'message': f"{len(changes)} records updated", 'changes': changes}
+
+    def delete_where(self, where: list) -> dict:
+        """
+        Delete every record matching a where clause and save the table once.
+
+        Returns:
+        dict: A message indicating success or failure, and on success the deleted records, each with
+        its record id, record and primary key.
+        """
+        try:
+            matches = self.matching(where)
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+        changes = []
+        for record_id, record in matches:
+            del self.records[record_id]
+            self.index_row(record_id, old=record)
+            self.primary_key_values.discard(record[0])
+            self.index.remove_index(record[0])
+            changes.append({'record_id': record_id, 'record': record, 'old_pri_key': record[0]})
+        if changes:
+            self.save_data()
+        return {'success': True, 'message': f"{len(changes)} records deleted", 'changes': changes}
@@ -0,0 +1,177 @@
+# profiling.py
+import io
+import os
+import time
+import pstats
+import marshal
+import logging
+import cProfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+SLOW_REQUEST_MS = float(os.environ.get('DIYDB_SLOW_REQUEST_MS', 500))
+SLOW_LOG_SIZE = int(os.environ.get('DIYDB_SLOW_LOG_SIZE', 100))
+
+PHASES = ('auth', 'validation', 'serialization', 'storage')
+
+logger = logging.getLogger('diydb.slow')
+
+
+class RequestTrace(threading.local):
+    def __init__(self):
+        """
+        Per-thread breakdown of where the current request spends its time.
+
+        The server starts a trace for every request; Table, Database and Auth code marks its
+        phases with trace.phase(name). Outside a request, e.g. in the compaction thread, every
+        call is a no-op.
+        """
+        self.active = False
+        self.started = 0.0
+        self.phases = {}
+        self.notes = {}
+        self.rows = 0
+
+    def start(self):
+        self.active = True
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.notes = {}
+        self.rows = 0
+
+    def finish(self) -> dict:
+        self.active = False
+        return {
+            'elapsed_ms': (time.perf_counter() - self.started) * 1000,
+            'phases_ms': {name: seconds * 1000 for name, seconds in self.phases.items()},
+            'rows': self.rows,
+            **self.notes,
+        }
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.active:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def note(self, **notes):
+        if self.active:
+            self.notes.update(notes)
+
+    def add_rows(self, rows: int):
+        if self.active:
+            self.rows += rows
+
+
+trace = RequestTrace()
+
+
+class SlowLog:
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_MS, size: int = SLOW_LOG_SIZE):
+        """
+        Logs every request slower than threshold_ms and keeps the most recent ones in memory.
+        """
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def record(self, entry: dict) -> bool:
+        if entry['elapsed_ms'] < self.threshold_ms:
+            return False
+        entry['ts'] = time.time()
+        with self.lock:
+            self.entries.append(entry)
+        phases = ' '.join(f"{name}={entry['phases_ms'].get(name, 0.0):.1f}ms" for name in PHASES)
+        logger.warning("slow request %s %s %.1fms status=%s db=%s table=%s rows=%s %s",
+                       entry.get('method'), entry.get('route'), entry['elapsed_ms'], entry.get('status'),
+                       entry.get('db_name'), entry.get('table_name'), entry['rows'], phases)
+        return True
+
+    def recent(self) -> list:
+        with self.lock:
+            return list(self.entries)
+
+
+class RouteProfiler:
+    def __init__(self):
+        """
+        Captures a cProfile profile of the next N requests to a route.
+
+        Only one request is profiled at a time: the profiler hooks are per process, and a
+        request arriving while another one is being profiled simply runs unprofiled and
+        waits for the next turn. The profiles of the N requests are merged into one.
+        """
+        self.armed = {}
+        self.results = {}
+        self.lock = threading.Lock()
+        self.busy = threading.Lock()
+
+    def arm(self, route: str, requests: int):
+        with self.lock:
+            self.armed[route] = {'route': route, 'requested': requests, 'remaining': requests, 'captured': 0,
+                                 'stats': None}
+            self.results.pop(route, None)
+
+    def start(self, route: str):
+        """
+        Return a Profile to run the request under, or None when the route isn't being profiled.
+        """
+        if route not in self.armed or not self.busy.acquire(blocking=False):
+            return None
+        with self.lock:
+            entry = self.armed.get(route)
+            if entry is None or entry['remaining'] <= 0:
+                self.busy.release()
+                return None
+            entry['remaining'] -= 1
+        return cProfile.Profile()
+
+    def finish(self, route: str, profile: cProfile.Profile):
+        try:
+            with self.lock:
+                entry = self.armed[route]
+                if entry['stats'] is None:
+                    entry['stats'] = pstats.Stats(profile)
+                else:
+                    entry['stats'].add(profile)
+                entry['captured'] += 1
+                if entry['remaining'] <= 0:
+                    self.results[route] = self.armed.pop(route)
+        finally:
+            self.busy.release()
+
+    def status(self) -> dict:
+        with self.lock:
+            summary = lambda entry: {key: entry[key] for key in ('route', 'requested', 'remaining', 'captured')}
+            return {'pending': [summary(entry) for entry in self.armed.values()],
+                    'finished': [summary(entry) for entry in self.results.values()]}
+
+    def dump(self, route: str, raw: bool = False, limit: int = 50):
+        """
+        Return the finished profile of a route, or None if it isn't complete yet.
+
+        Parameters:
+        route (str): The route rule, e.g. /select.
+        raw (bool, optional): Return the marshalled stats that pstats.Stats can load from a file.
+        limit (int, optional): The number of functions listed in the text report.
+
+        Returns:
+        str | bytes: The report sorted by cumulative time, or the raw stats.
+        """
+        with self.lock:
+            entry = self.results.get(route)
+            if entry is None:
+                return None
+            stats = entry['stats']
+            if raw:
+                return marshal.dumps(stats.stats)
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(limit)
+            return stream.getvalue()
@@ -0,0 +1,67 @@
+import sys
+import os
+import pytest
+
+# Add the parent directory to the sys.path, and models/ for the modules that import each other by name
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models')))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test inside an empty directory so databases/ and credentials are throwaway."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def make_db(workdir):
+    """
+    Return a factory of the 'shop' database of 'tester', with a table created from the arguments
+    of create_table and filled with rows. Without a table the database is returned empty.
+    """
+    from models.database import Database
+
+    def make(table=None, columns=None, datatypes=None, rows=(), constraints=None, partitions=1, **options):
+        db = Database('shop', 'tester')
+        if table is not None:
+            created = db.create_table(table, columns, datatypes, constraints, partitions, **options)
+            assert created['success'], created
+        if rows:
+            inserted = db.insert_many(table, [list(row) for row in rows])
+            assert inserted['success'], inserted
+        return db
+    return make
+
+
+@pytest.fixture
+def client(workdir):
+    import app as app_module
+    from cache import ResultCache
+
+    app_module.databases.clear()
+    app_module.auth.users = []
+    app_module.result_cache = ResultCache()
+    test_client = app_module.app.test_client()
+    test_client.post('/register', json={'username': 'tester', 'password': 'secret'})
+    token = test_client.post('/login', json={'username': 'tester', 'password': 'secret'}).json['token']
+    test_client.headers = {'x-access-token': f'Bearer {token}'}
+    return test_client
+
+
+@pytest.fixture
+def assert_indexes_current():
+    """Return a check that every secondary index of a table holds what rebuilding it from the rows would."""
+    from index import OrderedIndex
+
+    def contents(secondary):
+        if isinstance(secondary, OrderedIndex):
+            return sorted(zip(secondary.values, secondary.record_ids))
+        return sorted((value, record_id) for value, ids in secondary.entries.items() for record_id in ids)
+
+    def check(table):
+        for column, secondary in table.indexes.items():
+            fresh = type(secondary)(column, secondary.dtype)
+            fresh.build(table.records, table.columns.index(column))
+            assert contents(secondary) == contents(fresh)
+    return check
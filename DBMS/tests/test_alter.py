@@ -0,0 +1,136 @@
+import os
+import json
+
+from models.database import Database
+
+
+COLUMNS = ['id', 'name', 'age']
+DATATYPES = ['int', 'str', 'int']
+CONSTRAINTS = {'name': ['UNIQUE']}
+
+
+def make_rows(count):
+    return [[str(i), f'item{i}', str(20 + i)] for i in range(1, count + 1)]
+
+
+def file_contents(table):
+    contents = {}
+    for path in table.data_files():
+        with open(path, 'rb') as file:
+            contents[path] = file.read()
+    return contents
+
+
+def test_alter_only_writes_metadata(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    table = db.tables['items']
+    before = file_contents(table)
+
+    assert db.add_column('items', 'tier', 'str', 'basic')['success']
+    assert db.drop_column('items', 'age')['success']
+
+    assert file_contents(table) == before
+    assert table.columns == ['id', 'name', 'tier']
+    assert table.records['3'] == ['3', 'item3', 'basic']
+    assert db.query('items', [['tier', '=', 'basic']])['records']['1'] == ['1', 'item1', 'basic']
+
+    # read back from the untouched file, the rows are upgraded on load
+    reloaded = Database('shop', 'tester').tables['items']
+    assert reloaded.columns == ['id', 'name', 'tier']
+    assert reloaded.records == table.records
+    assert reloaded.column_datatype == {'id': int, 'name': str, 'tier': str}
+
+
+def test_drop_then_add_is_not_confused_with_the_old_layout(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    db.drop_column('items', 'name')
+    db.add_column('items', 'score', 'float', '1.5')
+    assert db.tables['items'].records['2'] == ['2', '22', '1.5']
+
+    reloaded = Database('shop', 'tester')
+    assert reloaded.tables['items'].records['2'] == ['2', '22', '1.5']
+    assert reloaded.insert('items', ['11', '31', '2.5'])['success']
+    assert Database('shop', 'tester').tables['items'].records['11'] == ['11', '31', '2.5']
+
+
+def test_partitions_are_upgraded_as_they_are_written(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS, partitions=4)
+    table = db.tables['items']
+    db.add_column('items', 'tier', 'str', 'basic')
+    assert not table.files_current()
+
+    db.update('items', '5', ['5', 'item5', '25', 'gold'])
+    versions = sorted(version for version, _ in table.file_versions.values())
+    assert versions == [1, 1, 1, 2]
+    with open(os.path.join('databases', 'shop', 'metadata.json')) as file:
+        assert len(json.load(file)['tables']['items']['schema_history']) == 1
+
+    reloaded = Database('shop', 'tester').tables['items']
+    assert reloaded.records == table.records
+
+    db.compact_table('items')
+    assert table.files_current()
+    with open(os.path.join('databases', 'shop', 'metadata.json')) as file:
+        schema = json.load(file)['tables']['items']
+    assert schema['schema_history'] == [] and schema['schema_version'] == 2
+    assert Database('shop', 'tester').tables['items'].records == table.records
+
+
+def test_files_written_after_the_metadata_use_the_current_schema(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    table = db.tables['items']
+    db.add_column('items', 'tier', 'str', 'basic')
+    table.records['1'] = ['1', 'item1', '21', 'gold']
+    # as if the process died between writing the table and writing metadata.json
+    table.save_data()
+
+    reloaded = Database('shop', 'tester').tables['items']
+    assert reloaded.records['1'] == ['1', 'item1', '21', 'gold']
+    assert reloaded.records['2'] == ['2', 'item2', '22', 'basic']
+
+
+def test_invalid_alters_are_rejected(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    assert 'primary key' in db.drop_column('items', 'id')['message']
+    assert not db.drop_column('items', 'height')['success']
+    assert 'already exists' in db.add_column('items', 'name', 'str')['message']
+    assert not db.add_column('items', 'tier', 'str', None, ['NOT NULL'])['success']
+    assert not db.add_column('items', 'code', 'str', 'x', ['UNIQUE'])['success']
+    assert not db.add_column('items', 'count', 'int', 'many')['success']
+    assert not db.add_column('items', 'tier', 'blob')['success']
+    assert db.tables['items'].schema_version == 1
+
+    assert db.drop_column('items', 'name')['success']
+    assert db.insert('items', ['11', '40'])['success']
+
+
+def test_replicas_apply_alters(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    db.add_column('items', 'tier', 'str', 'basic')
+    db.drop_column('items', 'age')
+    db.insert('items', ['11', 'item11', 'gold'])
+
+    replica = Database('copy', 'tester')
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    assert replica.tables['items'].columns == ['id', 'name', 'tier']
+    assert replica.tables['items'].records == db.tables['items'].records
+
+
+def test_alter_table_route(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'age'],
+                                       'datatypes': ['int', 'int']}, headers=client.headers)
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1', '30']},
+                headers=client.headers)
+
+    response = client.post('/alter_table', json={'db_name': 'shop', 'table_name': 'items', 'action': 'add_column',
+                                                 'column': 'tier', 'datatype': 'str', 'default': 'basic'},
+                           headers=client.headers)
+    assert response.status_code == 200
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=client.headers)
+    assert response.json['records'] == {'1': ['1', '30', 'basic']}
+
+    response = client.post('/alter_table', json={'db_name': 'shop', 'table_name': 'items', 'action': 'rename',
+                                                 'column': 'tier'}, headers=client.headers)
+    assert response.status_code == 400
@@ -0,0 +1,39 @@
+from benchmarks import run, compare
+
+
+def test_storage_benchmarks_produce_one_result_per_operation(workdir):
+    results = run.bench_storage(50, 'unique', 2)
+    assert [(r['suite'], r['operation']) for r in results] == [
+        ('table', 'insert_record'), ('table', 'update_record'), ('table', 'delete_record'), ('table', 'select'),
+        ('table', 'validate_row'), ('database', 'insert'), ('database', 'update'), ('database', 'delete'),
+        ('database', 'insert_many'),
+    ]
+    assert all(r['ops'] == 2 and r['size'] == 50 for r in results)
+
+
+def test_compare_flags_slowdowns_over_threshold():
+    result = {'suite': 'table', 'operation': 'insert_record', 'schema': 'plain', 'size': 1000}
+    baseline = {'results': [dict(result, p50_ms=1.0)]}
+    current = {'results': [dict(result, p50_ms=1.5)]}
+    assert compare.compare(baseline, current, 1.25)[0]['regressed']
+    assert not compare.compare(baseline, current, 2.0)[0]['regressed']
+
+
+def test_zipf_keys_favour_low_ranks():
+    import random
+    from benchmarks.loadtest import KeyChooser
+
+    rng = random.Random(1)
+    keys = [KeyChooser(1000, 'zipf').choose(rng) for _ in range(2000)]
+    assert all(1 <= key <= 1000 for key in keys)
+    assert keys.count(1) > keys.count(500) + 100
+
+
+def test_load_test_regressions_compare_latency_and_throughput():
+    from benchmarks.loadtest import regressions
+
+    baseline = {'throughput': 100.0, 'routes': {'/select': {'p50_ms': 10.0, 'p99_ms': 50.0}}}
+    same = {'throughput': 95.0, 'routes': {'/select': {'p50_ms': 11.0, 'p99_ms': 55.0}}}
+    slower = {'throughput': 60.0, 'routes': {'/select': {'p50_ms': 11.0, 'p99_ms': 90.0}}}
+    assert regressions(baseline, same, 1.25) == []
+    assert len(regressions(baseline, slower, 1.25)) == 2
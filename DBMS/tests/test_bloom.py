@@ -0,0 +1,81 @@
+import os
+import json
+
+from models.database import Database
+from bloom import BloomFilter, load_filters
+
+
+COLUMNS = ['id', 'name']
+DATATYPES = ['int', 'str']
+CONSTRAINTS = {'name': ['UNIQUE']}
+
+
+def make_rows(count):
+    return [[str(i), f'item{i}'] for i in range(1, count + 1)]
+
+
+def test_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(5000, 0.01)
+    for i in range(5000):
+        bloom.add(f'key{i}')
+    assert all(bloom.might_contain(f'key{i}') for i in range(5000))
+    false_positives = sum(bloom.might_contain(f'other{i}') for i in range(10000))
+    assert false_positives < 300
+
+    copy = BloomFilter.from_dict(json.loads(json.dumps(bloom.to_dict())))
+    assert copy.bits == bloom.bits and copy.count == 5000
+
+
+def test_duplicates_are_still_rejected(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    table = db.tables['items']
+    assert set(table.bloom_filters()) == {'name'}
+
+    assert table.insert_record(['3', 'fresh'])['message'] == 'Primary key 3 should be unique'
+    assert table.insert_record(['11', 'item4'])['message'] == 'Column name only allows unique values'
+    assert db.insert('items', ['11', 'item11'])['success']
+    assert table.update_record('11', ['5', 'item11'])['message'] == 'Primary key 5 should be unique'
+    assert table.update_record('11', ['11', 'item2'])['message'] == 'Column name only allows unique values'
+    assert db.update('items', '11', ['11', 'renamed'])['success']
+    assert table.might_contain('name', 'renamed')
+
+    # primary keys are looked up in their set, so a table without UNIQUE columns has no filters
+    db.create_table('plain', ['id'], ['int'])
+    assert db.insert('plain', ['1'])['success'] and not db.insert('plain', ['1'])['success']
+    assert db.tables['plain'].bloom_filters() == {} and not os.path.exists(db.tables['plain'].bloom_file)
+
+
+def test_saved_filters_are_reused_only_for_the_data_they_describe(make_db):
+    make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS, partitions=2)
+    reloaded = Database('shop', 'tester')
+    table = reloaded.tables['items']
+    assert load_filters(table.bloom_file, table.unique_columns(), table.file_crcs) is not None
+    assert table.might_contain('name', 'item7')
+    assert table.bloom_filters()['name'].count == 10
+
+    # data written behind the filter's back, e.g. restored from a snapshot, is never trusted
+    path = table.partition_file(0)
+    with open(path) as file:
+        records = json.load(file)
+    records['99'] = ['99', 'sneaky']
+    with open(path, 'w') as file:
+        json.dump(records, file)
+    table = Database('shop', 'tester').tables['items']
+    assert load_filters(table.bloom_file, table.unique_columns(), table.file_crcs) is None
+    assert table.might_contain('name', 'sneaky')
+    assert table.bloom_filters()['name'].count == 11
+
+
+def test_compaction_rebuilds_filters(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    for i in range(1, 7):
+        db.delete('items', str(i))
+    table = db.tables['items']
+    assert table.bloom_filters()['name'].count == 10
+
+    db.compact_table('items')
+
+    assert table.bloom_filters()['name'].count == 4
+    reloaded = Database('shop', 'tester').tables['items']
+    assert reloaded.bloom_filters()['name'].count == 4
+    assert db.insert('items', ['1', 'item1'])['success']
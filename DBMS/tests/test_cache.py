@@ -0,0 +1,60 @@
+from cache import ResultCache
+
+
+def test_lru_eviction_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=10)
+    cache.put(('db', 't', 'a'), b'12345', 0)
+    cache.put(('db', 't', 'b'), b'12345', 0)
+    assert cache.get(('db', 't', 'a')) == b'12345'
+    cache.put(('db', 't', 'c'), b'12345', 0)
+
+    assert cache.get(('db', 't', 'b')) is None
+    assert cache.get(('db', 't', 'a')) == b'12345'
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 10
+
+
+def test_invalidate_only_drops_the_written_table():
+    cache = ResultCache()
+    cache.put(('db', 't1', '{}'), b'one', 0)
+    cache.put(('db', 't2', '{}'), b'two', 0)
+    cache.invalidate('db', 't1')
+
+    assert cache.get(('db', 't1', '{}')) is None
+    assert cache.get(('db', 't2', '{}')) == b'two'
+
+
+def test_put_after_concurrent_write_is_rejected():
+    cache = ResultCache()
+    generation = cache.generation('db', 't')
+    cache.invalidate('db', 't')
+    assert not cache.put(('db', 't', '{}'), b'stale', generation)
+
+
+def test_key_ignores_parameter_order():
+    a = ResultCache.make_key('db', 't', {'db_name': 'db', 'table_name': 't', 'x': 1, 'y': 2})
+    b = ResultCache.make_key('db', 't', {'y': 2, 'x': 1})
+    assert a == b
+
+
+def test_select_route_is_served_from_cache_until_a_write(client):
+    import app as app_module
+
+    headers = client.headers
+    client.post('/select_database', json={'db_name': 'shop'}, headers=headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=headers)
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1', 'pen']},
+                headers=headers)
+
+    first = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=headers)
+    second = client.post('/select', json={'table_name': 'items', 'db_name': 'shop'}, headers=headers)
+    assert first.json == second.json == {'records': {'1': ['1', 'pen']}}
+    assert app_module.result_cache.stats()['hits'] == 1
+
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['2', 'ink']},
+                headers=headers)
+    third = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=headers)
+    assert third.json['records'] == {'1': ['1', 'pen'], '2': ['2', 'ink']}
+    assert app_module.result_cache.stats()['invalidations'] >= 1
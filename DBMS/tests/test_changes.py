@@ -0,0 +1,110 @@
+import json
+import threading
+
+from models.database import Database
+import changelog
+from changelog import ChangeLog, row_events
+
+
+def parse_events(body):
+    events = []
+    for block in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n') if line and not line.startswith(':'))
+        if fields:
+            events.append(dict(fields, data=json.loads(fields['data'])))
+    return events
+
+
+def test_set_based_writes_become_row_events(workdir):
+    db = Database('shop', 'tester')
+    db.create_table('items', ['id', 'name'], ['int', 'str'])
+    db.create_table('other', ['id'], ['int'])
+    db.insert_many('items', [['1', 'a'], ['2', 'b']])
+    db.insert('other', ['1'])
+    db.update_where('items', [], {'name': 'z'})
+    db.create_index('items', 'name')
+    db.delete('items', '1')
+
+    events = [event for entry in db.changelog.since(0) for event in row_events(entry, 'items')]
+    assert [(event['operation'], event.get('record_id')) for event in events] == [
+        ('create_table', None), ('insert', '1'), ('insert', '2'), ('update', '1'), ('update', '2'),
+        ('delete', '1')]
+    assert events[3]['record'] == ['1', 'z'] and events[1]['seq'] == events[2]['seq']
+
+
+def test_changes_are_read_back_from_disk(workdir, monkeypatch):
+    monkeypatch.setattr(changelog, 'CHANGELOG_SEGMENT_ENTRIES', 4)
+    monkeypatch.setattr(changelog, 'CHANGELOG_SEGMENTS', 3)
+    log = ChangeLog(buffer_size=5, path='changes')
+    for i in range(1, 21):
+        log.append({'operation': 'insert', 'table_name': 't', 'record_id': str(i), 'record': [str(i)]})
+
+    # the ring buffer holds 16-20, the files 9-20
+    assert log.since(10) is None
+    assert [entry['seq'] for entry in log.read(10, 3)] == [11, 12, 13]
+    assert [entry['seq'] for entry in log.read(8, 100)] == list(range(9, 21))
+    assert [entry['seq'] for entry in log.read(16, 2)] == [17, 18]
+    assert log.read(7, 100) is None and log.read(21, 1) is None and log.read(20, 1) == []
+    assert len(list((workdir / 'changes' / log.epoch).iterdir())) == 3
+
+    # a new epoch starts with an empty log, and only drops the files of the old one when it writes
+    epoch = log.epoch
+    assert ChangeLog(path='changes').read(0, 1) == []
+    assert len(list((workdir / 'changes' / epoch).iterdir())) == 3
+    del log
+    new_log = ChangeLog(path='changes')
+    new_log.append({'operation': 'insert', 'table_name': 't', 'record_id': '1', 'record': ['1']})
+    assert [path.name for path in (workdir / 'changes').iterdir()] == [new_log.epoch]
+
+
+def test_building_a_database_keeps_the_log_of_one_already_open(make_db):
+    db = make_db('items', ['id', 'name'], ['int', 'str'], [['1', 'pen']])
+    reloaded = Database('shop', 'tester')
+    reloaded.insert('items', ['2', 'ink'])
+    # read back from the files
+    db.changelog.buffer.clear()
+    assert [entry['change']['operation'] for entry in db.changelog.read(0, 10)] == ['create_table', 'insert_many']
+    assert reloaded.changelog.read(0, 10)[0]['change']['record_id'] == '2'
+
+
+def test_changes_route_streams_from_a_sequence_number(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    client.post('/insert_many', json={'db_name': 'shop', 'table_name': 'items', 'rows': [['1', 'a'], ['2', 'b']]},
+                headers=client.headers)
+    client.delete('/delete', json={'db_name': 'shop', 'table_name': 'items', 'primary_key': '1'},
+                  headers=client.headers)
+
+    response = client.get('/changes', query_string={'db_name': 'shop', 'table_name': 'items', 'since': 1,
+                                                    'wait': 0}, headers=client.headers)
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    events = parse_events(response.get_data(as_text=True))
+    assert events[0]['event'] == 'epoch'
+    changes = [(event['data']['operation'], event['data']['record_id'], event.get('id')) for event in events[1:]]
+    # only the last event of a commit carries its sequence number to resume from
+    assert changes == [('insert', '1', None), ('insert', '2', '2'), ('delete', '1', '3')]
+
+    epoch = events[0]['data']['epoch']
+    assert client.get('/changes', query_string={'db_name': 'shop', 'since': 1, 'epoch': 'old'},
+                      headers=client.headers).status_code == 410
+    assert client.get('/changes', query_string={'db_name': 'shop', 'since': 9, 'epoch': epoch},
+                      headers=client.headers).status_code == 410
+    assert client.get('/changes', query_string={'db_name': 'shop', 'table_name': 'missing'},
+                      headers=client.headers).status_code == 400
+
+
+def test_changes_route_long_polls_for_new_changes(client):
+    import app as app_module
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id'],
+                                       'datatypes': ['int']}, headers=client.headers)
+    db = app_module.databases['shop']
+    timer = threading.Timer(0.1, db.insert, args=('items', ['7']))
+    timer.start()
+    response = client.get('/changes', query_string={'db_name': 'shop', 'table_name': 'items', 'wait': 5},
+                          headers=client.headers)
+    timer.join()
+    events = parse_events(response.get_data(as_text=True))
+    assert [event['data'].get('record') for event in events[1:]] == [['7']]
+    assert events[1]['id'] == str(db.changelog.seq)
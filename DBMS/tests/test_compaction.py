@@ -0,0 +1,90 @@
+import os
+import time
+
+from models.database import Database
+from compaction import Compactor
+
+
+COLUMNS = ['id', 'name']
+DATATYPES = ['int', 'str']
+CONSTRAINTS = {'id': ['NOT NULL', 'UNIQUE']}
+
+
+def make_rows(count):
+    return [[str(i), f'item{i}'] for i in range(1, count + 1)]
+
+
+def test_compact_renumbers_records_and_shrinks_file(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(10), CONSTRAINTS)
+    for i in range(1, 7):
+        db.delete('items', str(i))
+    table = db.tables['items']
+    assert Compactor().dead_space_ratio(table) == 0.6
+
+    report = db.compact_table('items')
+
+    assert report['success']
+    assert report['record_ids_reclaimed'] == 6
+    assert report['bytes_reclaimed'] >= 0
+    assert sorted(table.records) == ['1', '2', '3', '4']
+    assert table.record_id_counter == 5
+    assert db.update('items', '8', ['8', 'renamed'])['success']
+    reloaded = Database('shop', 'tester')
+    assert [row[1] for row in reloaded.tables['items'].records.values()] == ['item7', 'renamed', 'item9', 'item10']
+
+
+def test_compaction_retries_when_a_writer_races_it(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(4), CONSTRAINTS)
+    db.delete('items', '1')
+    compactor = Compactor()
+    original_write = compactor.write_throttled
+    calls = []
+
+    def racing_write(path, payload, throttle=True):
+        if not calls:
+            db.insert('items', ['5', 'late'])
+        calls.append(throttle)
+        original_write(path, payload, throttle)
+
+    compactor.write_throttled = racing_write
+    report = compactor.compact(db, 'items')
+
+    assert report['retries'] == 1
+    assert [row[0] for row in db.tables['items'].records.values()] == ['2', '3', '4', '5']
+    assert not os.path.exists(db.tables['items'].table_file + '.compact')
+
+
+def test_dead_space_threshold_triggers_background_compaction(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(4), CONSTRAINTS)
+    for i in range(1, 4):
+        db.delete('items', str(i))
+    compactor = Compactor(dead_ratio=0.5, min_dead=2)
+
+    assert compactor.maybe_compact(db, 'items')
+    deadline = time.time() + 5
+    while not compactor.history and time.time() < deadline:
+        time.sleep(0.01)
+    assert compactor.history[-1]['records'] == 1
+    assert list(db.tables['items'].records) == ['1']
+
+
+def test_background_compaction_logs_failures_and_keeps_going(make_db, monkeypatch, caplog):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(4), CONSTRAINTS)
+    for i in range(1, 4):
+        db.delete('items', str(i))
+    compactor = Compactor(dead_ratio=0.5, min_dead=2)
+    compact = compactor.compact
+    monkeypatch.setattr(compactor, 'compact', lambda db, table_name: 1 / 0)
+
+    assert compactor.maybe_compact(db, 'items')
+    deadline = time.time() + 5
+    while compactor.queued and time.time() < deadline:
+        time.sleep(0.01)
+    assert 'Compaction of shop.items failed' in caplog.text and 'ZeroDivisionError' in caplog.text
+
+    monkeypatch.setattr(compactor, 'compact', compact)
+    assert compactor.maybe_compact(db, 'items')
+    while not compactor.history and time.time() < deadline:
+        time.sleep(0.01)
+    # a compaction that worked is only reported in the history
+    assert compactor.history[-1]['success'] and len(caplog.records) == 1
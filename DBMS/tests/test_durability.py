@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+
+import pytest
+
+from models.database import Database
+import durability
+from durability import flusher, write_file
+
+
+COLUMNS = ['id', 'user']
+DATATYPES = ['int', 'str']
+
+
+def count_writes(monkeypatch, table):
+    writes = []
+    original = type(table).write_data
+    monkeypatch.setattr(type(table), 'write_data', lambda self: writes.append(self.name) or original(self))
+    return writes
+
+
+def on_disk():
+    return Database('shop', 'tester').tables['sessions'].records
+
+
+def test_async_writes_are_coalesced_into_one_flush(make_db, monkeypatch):
+    monkeypatch.setattr(durability, 'FLUSH_INTERVAL_MS', 60000)
+    db = make_db('sessions', COLUMNS, DATATYPES)
+    db.set_durability('async')
+    table = db.tables['sessions']
+    writes = count_writes(monkeypatch, table)
+
+    for i in range(1, 21):
+        assert db.insert('sessions', [str(i), f'u{i}'])['success']
+    db.update('sessions', '3', ['3', 'changed'])
+    db.delete('sessions', '4')
+    assert writes == [] and table.pending and on_disk() == {}
+
+    flusher.flush_all()
+    assert writes == ['sessions'] and not table.pending
+    assert on_disk() == table.records and len(table.records) == 19
+
+
+def test_group_commits_wait_for_a_shared_flush(make_db, monkeypatch):
+    monkeypatch.setattr(durability, 'GROUP_COMMIT_MS', 50)
+    db = make_db('sessions', COLUMNS, DATATYPES)
+    db.set_durability('group')
+    writes = count_writes(monkeypatch, db.tables['sessions'])
+    barrier = threading.Barrier(8)
+
+    committed = []
+
+    def on_disk_ids():
+        with open(os.path.join('databases', 'shop', 'sessions.json')) as file:
+            return {row[0] for row in json.load(file).values()}
+
+    def insert(i):
+        barrier.wait()
+        assert db.insert('sessions', [str(i), f'u{i}'])['success']
+        # a group commit only returns once it is on disk
+        committed.append(str(i) in on_disk_ids())
+
+    threads = [threading.Thread(target=insert, args=(i,)) for i in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert committed == [True] * 8
+    assert on_disk_ids() == {str(i) for i in range(1, 9)}
+    assert len(writes) < 8
+
+
+def test_durability_can_be_set_per_table(make_db, monkeypatch):
+    monkeypatch.setattr(durability, 'FLUSH_INTERVAL_MS', 60000)
+    db = make_db('sessions', COLUMNS, DATATYPES)
+    db.set_durability('async', 'sessions')
+    db.create_table('orders', ['id', 'total'], ['int', 'float'])
+    db.insert('orders', ['1', '9.5'])
+    db.insert('sessions', ['1', 'u1'])
+    assert not db.tables['orders'].pending and db.tables['sessions'].pending
+
+    # switching back to sync writes whatever was waiting
+    assert db.set_durability(None, 'sessions')['message'] == "Durability of table sessions set to sync"
+    assert on_disk() == {'1': ['1', 'u1']}
+
+    db.set_durability('async', 'sessions')
+    reloaded = Database('shop', 'tester')
+    assert reloaded.durability == 'sync' and reloaded.durability_of('sessions') == 'async'
+    assert reloaded.tables['sessions'].write_mode == 'async'
+    assert not db.set_durability('eventually')['success']
+    assert not db.set_durability(None)['success']
+    assert not db.set_durability('sync', 'missing')['success']
+
+
+def test_alter_writes_pending_rows_in_their_own_schema(make_db, monkeypatch):
+    monkeypatch.setattr(durability, 'FLUSH_INTERVAL_MS', 60000)
+    db = make_db('sessions', COLUMNS, DATATYPES)
+    db.set_durability('async')
+    db.insert('sessions', ['1', 'u1'])
+    db.add_column('sessions', 'ttl', 'int', '60')
+    table = db.tables['sessions']
+    assert not table.pending and list(table.file_versions.values())[0][0] == 1
+
+    db.insert('sessions', ['2', 'u2', '30'])
+    flusher.flush_all()
+    assert on_disk() == {'1': ['1', 'u1', '60'], '2': ['2', 'u2', '30']}
+
+
+def test_files_are_replaced_whole(workdir, monkeypatch):
+    path = os.path.join(str(workdir), 'data.json')
+    write_file(path, b'old')
+
+    def fail(descriptor):
+        raise OSError('disk full')
+    with monkeypatch.context() as m:
+        m.setattr(os, 'fsync', fail)
+        with pytest.raises(OSError):
+            write_file(path, b'new contents')
+
+    with open(path, 'rb') as file:
+        assert file.read() == b'old'
+    assert not os.path.exists(path + '.tmp')
+    assert write_file(path, 'new') == 3
+
+
+def test_failed_background_flushes_are_logged(make_db, monkeypatch, caplog):
+    db = make_db('sessions', COLUMNS, DATATYPES)
+    db.set_durability('async')
+    db.insert('sessions', ['1', 'u1'])
+    with monkeypatch.context() as m:
+        m.setattr(db, 'flush', lambda: 1 / 0)
+        flusher.flush(db)
+    assert 'Flushing shop failed' in caplog.text and 'ZeroDivisionError' in caplog.text
+    flusher.flush(db)
+    assert on_disk() == {'1': ['1', 'u1']}
+
+
+def test_durability_route(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'sessions', 'columns': ['id'],
+                                       'datatypes': ['int']}, headers=client.headers)
+    response = client.post('/durability', json={'db_name': 'shop', 'mode': 'group', 'table_name': 'sessions'},
+                           headers=client.headers)
+    assert response.status_code == 200
+    response = client.post('/durability', json={'db_name': 'shop', 'mode': 'later'}, headers=client.headers)
+    assert response.status_code == 400
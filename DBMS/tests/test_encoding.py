@@ -0,0 +1,63 @@
+import json
+
+from models.database import Database
+import encoding
+from encoding import encode_records, decode_records, is_block_encoded
+
+
+def test_values_keep_their_exact_types():
+    records = {
+        '1': ['1', 'a', 1, 1.5, None, True],
+        '2': ['-20', 'b', -7, 2.0, 'x', False],
+        '3': ['007', 'a', 10 ** 30, float('inf'), ['nested'], 1],
+        'key': ['4', 'a', 0, -0.5, {'k': 1}, '1'],
+        '5': ['short row'],
+    }
+    decoded = decode_records(encode_records(records, ['int', 'str', 'int', 'float', 'str', 'str']))
+    assert decoded == records
+    for record_id, row in records.items():
+        assert [type(value) for value in decoded[record_id]] == [type(value) for value in row]
+
+
+def test_block_files_are_much_smaller_than_json():
+    records = {str(i): [str(i), f'user{i}@example.com', str(18 + i % 60), ['gold', 'silver'][i % 2]]
+               for i in range(1, 20001)}
+    data = encode_records(records, ['int', 'str', 'int', 'str'])
+    assert is_block_encoded(data)
+    assert len(data) * 5 < len(json.dumps(records, indent=4))
+    assert decode_records(data) == records
+
+
+def test_unchanged_blocks_are_reused(monkeypatch):
+    monkeypatch.setattr(encoding, 'BLOCK_ROWS', 100)
+    records = {str(i): [str(i), f'name{i}'] for i in range(1, 1001)}
+    cache = {}
+    first = encode_records(records, ['int', 'str'], cache)
+    encoded = []
+    original = encoding.encode_block
+    monkeypatch.setattr(encoding, 'encode_block', lambda items: encoded.append(items) or original(items))
+    records['150'] = ['150', 'renamed']
+    second = encode_records(records, ['int', 'str'], cache)
+    assert len(encoded) == 1 and encoded[0][0][0] == '100'
+    assert decode_records(second)['150'] == ['150', 'renamed']
+    assert len(second) != len(first) or second != first
+
+
+def test_block_encoded_tables_persist_and_reload(workdir):
+    db = Database('shop', 'tester')
+    assert not db.create_table('items', ['id', 'name'], ['int', 'str'], encoding='zip')['success']
+    assert db.create_table('items', ['id', 'name'], ['int', 'str'], encoding='block')['success']
+    assert db.create_table('parts', ['id', 'name'], ['int', 'str'], partitions=2, encoding='block')['success']
+    for i in range(1, 21):
+        db.insert('items', [str(i), f'item{i}'])
+        db.insert('parts', [str(i), f'part{i}'])
+    db.update('items', '3', ['3', 'changed'])
+    db.delete('parts', '4')
+
+    with open(db.tables['items'].table_file, 'rb') as file:
+        assert is_block_encoded(file.read())
+    reloaded = Database('shop', 'tester')
+    assert reloaded.tables['items'].encoding == 'block'
+    assert reloaded.tables['items'].records == db.tables['items'].records
+    assert reloaded.tables['parts'].records == db.tables['parts'].records
+    assert reloaded.query('items', [['name', '=', 'changed']])['records'] == {'3': ['3', 'changed']}
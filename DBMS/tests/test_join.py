@@ -0,0 +1,91 @@
+from query import coerce
+
+
+CUSTOMERS = [[str(i), f'c{i}', 'gold' if i % 2 else 'silver'] for i in range(1, 6)]
+
+
+def add_orders(db):
+    db.create_table('orders', ['order_id', 'customer', 'total'], ['int', 'int', 'float'])
+    for i, customer in enumerate(['1', '1', '2', '4', '9', 'none'], start=1):
+        db.insert('orders', [str(i), customer, str(i * 10)])
+
+
+def nested_loop(db, how, on=(1, 0)):
+    """The joined rows by definition, to compare the strategies against."""
+    rows = []
+    for left in db.tables['orders'].records.values():
+        matches = [right for right in db.tables['customers'].records.values()
+                   if coerce(left[on[0]], int) is not None
+                   and coerce(left[on[0]], int) == coerce(right[on[1]], int)]
+        rows += [left + right for right in matches]
+        if not matches and how == 'left':
+            rows.append(left + [None, None, None])
+    return sorted(rows, key=str)
+
+
+def test_index_join_probes_the_primary_key(make_db):
+    db = make_db('customers', ['id', 'name', 'tier'], ['int', 'str', 'str'], CUSTOMERS)
+    add_orders(db)
+    for how in ('inner', 'left'):
+        result = db.join('orders', 'customers', ['customer', 'id'], how)
+        assert result['strategy'] == 'index'
+        assert result['columns'][:2] == ['orders.order_id', 'orders.customer']
+        assert sorted(result['rows'], key=str) == nested_loop(db, how)
+
+
+def test_hash_join_matches_nested_loop(make_db, monkeypatch):
+    db = make_db('customers', ['id', 'name', 'tier'], ['int', 'str', 'str'], CUSTOMERS)
+    add_orders(db)
+    monkeypatch.setattr(db.tables['customers'], 'has_index', lambda position: False)
+    monkeypatch.setattr(db.tables['orders'], 'has_index', lambda position: False)
+    for how in ('inner', 'left'):
+        result = db.join('orders', 'customers', ['customer', 'id'], how)
+        assert result['strategy'] == 'hash'
+        assert sorted(result['rows'], key=str) == nested_loop(db, how)
+
+    # the larger side is probed, whichever of the two it is
+    result = db.join('orders', 'customers', ['customer', 'id'], 'left', left_where=[['order_id', '<=', '2']])
+    assert sorted(result['rows'], key=str) == [r for r in nested_loop(db, 'left') if r[0] in ('1', '2')]
+
+
+def test_inner_join_probes_whichever_side_is_indexed(make_db):
+    db = make_db('customers', ['id', 'name', 'tier'], ['int', 'str', 'str'], CUSTOMERS)
+    add_orders(db)
+    result = db.join('customers', 'orders', ['id', 'customer'], right_where=[['total', '>=', '30']])
+    assert result['strategy'] == 'index'
+    assert sorted(result['rows'], key=str) == sorted([['2', 'c2', 'silver', '3', '2', '30'],
+                                                      ['4', 'c4', 'silver', '4', '4', '40']], key=str)
+
+
+def test_invalid_joins_fail_before_streaming(make_db):
+    db = make_db('customers', ['id', 'name', 'tier'], ['int', 'str', 'str'], CUSTOMERS)
+    add_orders(db)
+    assert not db.join('orders', 'missing', 'id')['success']
+    assert "doesn't exist" in db.join('orders', 'customers', 'id')['message']
+    assert not db.join('orders', 'customers', ['customer', 'id'], 'outer')['success']
+    assert not db.join('orders', 'customers', ['customer', 'id'], left_where=[['total', '~', '1']])['success']
+
+
+def test_join_route_streams_rows(client, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, 'JOIN_BATCH_ROWS', 2)
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    db = app_module.databases['shop']
+    db.create_table('customers', ['id', 'name'], ['int', 'str'])
+    db.create_table('orders', ['order_id', 'customer'], ['int', 'int'])
+    for i in range(1, 4):
+        db.insert('customers', [str(i), f'c{i}'])
+    for i in range(1, 8):
+        db.insert('orders', [str(i), str(i % 4)])
+
+    response = client.post('/join', json={'db_name': 'shop', 'left': 'orders', 'right': 'customers',
+                                          'on': ['customer', 'id'], 'how': 'left'}, headers=client.headers)
+    assert response.status_code == 200 and response.is_streamed
+    body = response.json
+    assert body['columns'] == ['orders.order_id', 'orders.customer', 'customers.id', 'customers.name']
+    assert len(body['rows']) == 7
+    assert ['4', '0', None, None] in body['rows'] and ['5', '1', '1', 'c1'] in body['rows']
+
+    response = client.post('/join', json={'db_name': 'shop', 'left': 'orders', 'right': 'customers',
+                                          'on': 'name'}, headers=client.headers)
+    assert response.status_code == 400
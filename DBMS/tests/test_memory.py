@@ -0,0 +1,197 @@
+import time
+import threading
+
+import pytest
+
+from models.database import Database
+import durability
+import snapshot
+from durability import flusher
+from memory import budget, estimate_bytes
+
+
+@pytest.fixture(autouse=True)
+def fresh_budget():
+    # forget the tables of other tests, which may not have been collected yet
+    budget.__init__(budget.limit)
+
+
+def add_tables(db, count=3, rows=50):
+    for t in range(count):
+        db.create_table(f't{t}', ['id', 'name'], ['int', 'str'])
+        db.insert_many(f't{t}', [[str(i), f'name{i}'] for i in range(1, rows + 1)])
+
+
+def shrink(monkeypatch, limit):
+    # evict once under a small budget, then put it back so the background evictor stays out of the test
+    with monkeypatch.context() as patch:
+        patch.setattr(budget, 'limit', limit)
+        budget.enforce()
+
+
+def test_tables_are_loaded_when_first_used(make_db):
+    db = make_db()
+    add_tables(db)
+    budget.__init__(budget.limit)
+    db = Database('shop', 'tester')
+    assert list(db.tables) == ['t0', 't1', 't2'] and db.tables.resident() == {}
+
+    assert len(db.tables['t1'].records) == 50
+    assert set(db.tables.resident()) == {'t1'}
+    db.tables['t1']
+    stats = budget.stats()
+    assert (stats['misses'], stats['hits'], stats['hit_rate']) == (1, 1, 0.5)
+
+
+def test_least_recently_used_tables_are_evicted(make_db, monkeypatch):
+    db = make_db()
+    add_tables(db)
+    records = {name: dict(table.records) for name, table in db.tables.items()}
+    db.tables['t0']
+    size = estimate_bytes(db.tables['t0'])
+
+    # t1 and t2 were used least recently
+    shrink(monkeypatch, size)
+    assert set(db.tables.resident()) == {'t0'} and list(db.tables) == ['t0', 't1', 't2']
+    assert budget.stats()['evictions'] == 2
+
+    assert db.tables['t2'].records == records['t2']
+    assert db.query('t1', [['id', '=', '7']])['records'] == {'7': ['7', 'name7']}
+    assert db.insert('t1', ['51', 'name51'])['success']
+    assert Database('shop', 'tester').tables['t1'].records['51'] == ['51', 'name51']
+
+
+def test_evicted_tables_keep_unwritten_changes(make_db, monkeypatch):
+    monkeypatch.setattr(durability, 'FLUSH_INTERVAL_MS', 60000)
+    db = make_db()
+    add_tables(db, count=2)
+    db.set_durability('async')
+    db.insert('t0', ['51', 'late'])
+    db.update('t0', '1', ['1', 'renamed'])
+    assert db.tables['t0'].pending
+    db.tables['t1']
+
+    shrink(monkeypatch, 1)
+    assert set(db.tables.resident()) == {'t1'}
+    assert db.tables['t0'].records['51'] == ['51', 'late'] and db.tables['t0'].records['1'] == ['1', 'renamed']
+    flusher.flush_all()
+
+    # metadata.json is written from the tables in memory and the entries of evicted ones on disk
+    shrink(monkeypatch, 1)
+    db.create_table('t2', ['id'], ['int'])
+    reloaded = Database('shop', 'tester')
+    assert list(reloaded.tables) == ['t0', 't1', 't2']
+    assert reloaded.tables['t0'].primary_key_values == set(db.tables['t0'].records)
+
+
+def test_busy_databases_are_skipped(make_db, monkeypatch):
+    db = make_db()
+    add_tables(db, count=2)
+    db.tables['t1']
+    held, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with db.lock:
+            held.set()
+            release.wait()
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    held.wait()
+    shrink(monkeypatch, 1)
+    assert set(db.tables.resident()) == {'t0', 't1'}
+    release.set()
+    holder.join()
+
+    db.log_operation('insert', 't1', '1')
+    shrink(monkeypatch, 1)
+    assert set(db.tables.resident()) == {'t0', 't1'}
+    db.commit_transaction()
+    shrink(monkeypatch, 1)
+    assert set(db.tables.resident()) == {'t1'}
+
+
+def test_dropping_an_evicted_table(make_db, monkeypatch):
+    db = make_db()
+    add_tables(db, count=2)
+    db.tables['t1']
+    shrink(monkeypatch, 1)
+    assert db.drop_table('t0')['success']
+    assert list(Database('shop', 'tester').tables) == ['t1']
+    assert all(entry['table'] != 't0' for entry in budget.stats()['tables'])
+
+
+def test_status_and_snapshots_leave_evicted_tables_on_disk(make_db, monkeypatch):
+    db = make_db()
+    add_tables(db, count=2)
+    db.tables['t1']
+    shrink(monkeypatch, 1)
+    assert set(db.tables.resident()) == {'t1'}
+
+    status = db.compaction_status()['tables']
+    assert status['t0'] == {'records': 50, 'resident': False} and status['t1']['resident']
+    read = []
+    original = db.read_table
+
+    def read_table(name, schema=None):
+        # another thread can take the lock while the evicted table is read
+        def take_lock():
+            if db.lock.acquire(timeout=1):
+                db.lock.release()
+                read.append(name)
+        other = threading.Thread(target=take_lock)
+        other.start()
+        other.join()
+        return original(name, schema)
+
+    monkeypatch.setattr(db, 'read_table', read_table)
+    image = snapshot.capture(db)
+    assert list(image['tables']) == ['t0', 't1'] and image['tables']['t0']['7'] == ['7', 'name7']
+    assert set(db.tables.resident()) == {'t1'} and budget.stats()['misses'] == 0
+    assert read == ['t0']
+
+    # a table written between taking the image and reading its files is taken again
+    def read_after_a_write(name, schema=None):
+        read.append(name)
+        if len(read) == 1:
+            # loading the table for the write reads it through here too
+            assert db.insert(name, ['51', 'late'])['success']
+        return original(name, schema)
+
+    read.clear()
+    monkeypatch.setattr(db, 'read_table', read_after_a_write)
+    image = snapshot.capture(db)
+    assert image['tables']['t0']['51'] == ['51', 'late'] and image['seq'] == db.changelog.seq
+
+
+def test_eviction_runs_in_the_background(make_db, monkeypatch):
+    db = make_db()
+    add_tables(db, count=2)
+    monkeypatch.setattr(budget, 'limit', 1)
+    db.tables['t1']
+    deadline = time.monotonic() + 5
+    while db.tables.resident().keys() != {'t1'} and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert set(db.tables.resident()) == {'t1'}
+
+
+def test_memory_stats_route(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id'],
+                                       'datatypes': ['int']}, headers=client.headers)
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1']},
+                headers=client.headers)
+    response = client.get('/memory_stats', headers=client.headers)
+    assert response.status_code == 200
+    assert {'db': 'shop', 'table': 'items'}.items() <= response.json['tables'][-1].items()
+    assert 'diydb_resident_bytes' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_memory_stats_route_lists_only_the_callers_databases(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id'],
+                                       'datatypes': ['int']}, headers=client.headers)
+    client.post('/register', json={'username': 'other', 'password': 'secret'})
+    token = client.post('/login', json={'username': 'other', 'password': 'secret'}).json['token']
+    response = client.get('/memory_stats', headers={'x-access-token': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert all(entry['db'] != 'shop' for entry in response.json['tables'])
@@ -0,0 +1,75 @@
+from metrics import Registry
+
+
+def sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', ('operation',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, 'insert')
+
+    text = registry.render()
+    assert '# TYPE latency_seconds histogram' in text
+    assert sample(text, 'latency_seconds_bucket{operation="insert",le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{operation="insert",le="1.0"}') == 2
+    assert sample(text, 'latency_seconds_bucket{operation="insert",le="+Inf"}') == 3
+    assert sample(text, 'latency_seconds_count{operation="insert"}') == 3
+    assert sample(text, 'latency_seconds_sum{operation="insert"}') == 5.55
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter('writes_total', 'Writes', ('table',)).inc('a"b')
+    assert 'writes_total{table="a\\"b"} 1' in registry.render()
+
+
+def test_metrics_endpoint_reports_operations_and_bytes(client):
+    client.post('/select_database', json={'db_name': 'metricsdb'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'metricsdb', 'table_name': 'people', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    before = client.get('/metrics').get_data(as_text=True)
+    inserted = 'diydb_operations_total{db="metricsdb",operation="insert",status="success"}'
+    written = 'diydb_table_bytes_written_total{db="metricsdb",table="people"}'
+    insert_count = sample(before, inserted) or 0
+    bytes_before = sample(before, written) or 0
+
+    client.post('/insert_record', json={'db_name': 'metricsdb', 'table_name': 'people', 'content': ['1', 'ann']},
+                headers=client.headers)
+    client.post('/insert_record', json={'db_name': 'metricsdb', 'table_name': 'people', 'content': ['x', 'bob']},
+                headers=client.headers)
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert sample(text, inserted) == insert_count + 1
+    assert sample(text, 'diydb_operations_total{db="metricsdb",operation="insert",status="failure"}') >= 1
+    assert sample(text, written) > bytes_before
+    assert sample(text, 'diydb_constraint_check_seconds_count{db="metricsdb",table="people",operation="insert"}') >= 2
+    assert sample(text, 'diydb_auth_seconds_count{operation="verify_token"}') >= 1
+    assert sample(text, 'diydb_http_request_seconds_count{route="/insert_record",method="POST",status="200"}') >= 1
+    assert 'diydb_result_cache_hits_total' in text
+
+
+def test_dropped_tables_count_as_successful_operations(client):
+    client.post('/select_database', json={'db_name': 'metricsdb'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'metricsdb', 'table_name': 'people', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    dropped = 'diydb_operations_total{db="metricsdb",operation="drop_table",status="success"}'
+    missing = 'diydb_operations_total{db="metricsdb",operation="drop_table",status="failure"}'
+    before = client.get('/metrics').get_data(as_text=True)
+
+    response = client.post('/drop_table', json={'db_name': 'metricsdb', 'table_name': 'people'},
+                           headers=client.headers)
+    assert response.json['message']['success']
+    client.post('/drop_table', json={'db_name': 'metricsdb', 'table_name': 'people'}, headers=client.headers)
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert sample(text, dropped) == (sample(before, dropped) or 0) + 1
+    assert sample(text, missing) == (sample(before, missing) or 0) + 1
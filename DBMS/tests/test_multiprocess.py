@@ -0,0 +1,129 @@
+import threading
+import multiprocessing
+
+from models.database import Database
+import locking
+from auth import Auth
+
+
+def open_shop():
+    # every shared Database has a lock file descriptor of its own, so two in one process exclude each other
+    return Database('shop', 'tester', shared=True)
+
+
+def insert_rows(first, count):
+    db = open_shop()
+    for i in range(first, first + count):
+        assert db.insert('items', [str(i), f'item{i}'])['success']
+
+
+def test_processes_writing_one_table_lose_nothing(workdir):
+    db = open_shop()
+    db.create_table('items', ['id', 'name'], ['int', 'str'])
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=insert_rows, args=(1 + 100 * n, 25)) for n in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+    assert [worker.exitcode for worker in workers] == [0, 0, 0, 0]
+
+    expected = {str(1 + 100 * n + i) for n in range(4) for i in range(25)}
+    db.refresh()
+    assert {record[0] for record in db.tables['items'].records.values()} == expected
+    assert {record[0] for record in Database('shop', 'tester').tables['items'].records.values()} == expected
+
+
+def test_readers_reload_what_other_processes_wrote(workdir):
+    first, second = open_shop(), open_shop()
+    first.create_table('items', ['id', 'name'], ['int', 'str'])
+    second.refresh()
+    assert list(second.tables) == ['items']
+    first.insert('items', ['1', 'a'])
+    items = second.tables['items']
+    assert list(items.records.values()) == [['1', 'a']]
+
+    # a write picks up the other's rows under the lock, so both survive
+    first.insert('items', ['2', 'b'])
+    assert second.insert('items', ['3', 'c'])['success']
+    assert not second.insert('items', ['2', 'again'])['success']
+    first.refresh()
+    assert sorted(record[0] for record in first.tables['items'].records.values()) == ['1', '2', '3']
+    assert second.tables['items'] is not items
+
+    # a reader that sees nothing new keeps its tables in memory
+    loaded = first.tables['items']
+    first.refresh()
+    assert first.tables['items'] is loaded
+
+    second.add_column('items', 'price', 'float', '1.5')
+    second.create_table('other', ['id'], ['int'])
+    first.drop_table('items')
+    second.refresh()
+    assert list(second.tables) == ['other']
+    first.refresh()
+    assert list(first.tables) == ['other']
+
+
+def test_the_lock_excludes_other_processes(workdir):
+    first, second = open_shop(), open_shop()
+    first.create_table('items', ['id'], ['int'])
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with first.lock:
+            held.set()
+            release.wait()
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    assert not second.lock.acquire(blocking=False)
+    release.set()
+    holder.join()
+    assert second.lock.acquire(blocking=False)
+    second.lock.release()
+
+
+def test_shared_databases_write_through(workdir):
+    db = open_shop()
+    db.create_table('items', ['id'], ['int'])
+    assert db.set_durability('async')['message'].endswith('sync')
+    db.insert('items', ['1'])
+    assert not db.tables['items'].pending
+    assert db.changelog.path is None
+
+
+def test_users_are_shared(workdir):
+    first, second = Auth(shared=True), Auth(shared=True)
+    assert first.register_user('alice', 'secret') == 'User created successfully'
+    assert 'Invalid' not in second.authenticate_user('alice', 'secret')
+    assert second.register_user('alice', 'other') == 'alice already exists'
+    assert second.register_user('bob', 'secret') == 'User created successfully'
+    assert {user['username'] for user in Auth().users} == {'alice', 'bob'}
+
+
+def test_requests_see_databases_of_other_processes(client, monkeypatch):
+    monkeypatch.setattr(locking, 'MULTIPROCESS', True)
+    other = Database('shop', 'tester', shared=True)
+    other.create_table('items', ['id', 'name'], ['int', 'str'])
+    other.insert('items', ['1', 'a'])
+
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=client.headers)
+    assert response.status_code == 200 and response.json['records'] == {'1': ['1', 'a']}
+    other.insert('items', ['2', 'b'])
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=client.headers)
+    assert set(response.json['records']) == {'1', '2'}
+
+    # a request without a valid token is turned away before any database is loaded or refreshed
+    import app as app_module
+    app_module.databases.clear()
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'},
+                           headers={'x-access-token': 'Bearer forged'})
+    assert response.status_code == 401 and 'shop' not in app_module.databases
+
+    # names are claimed on disk, so another process can't hand the database to someone else
+    Database('private', 'someone', shared=True).save_metadata()
+    response = client.post('/select_database', json={'db_name': 'private'}, headers=client.headers)
+    assert response.status_code == 403
+    assert client.post('/select_database', json={'db_name': 'fresh'}, headers=client.headers).status_code == 200
+    assert Database('fresh', None).owner == 'tester'
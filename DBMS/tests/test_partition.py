@@ -0,0 +1,95 @@
+import os
+import json
+
+import pytest
+
+from models.database import Database
+import partition
+import query
+
+
+COLUMNS = ['id', 'name', 'age']
+DATATYPES = ['int', 'str', 'int']
+
+
+def make_rows(count):
+    return [[str(i), f'p{i}', str(20 + i % 10)] for i in range(1, count + 1)]
+
+
+def test_rows_are_routed_to_partition_files_by_primary_key(make_db):
+    db = make_db('people', COLUMNS, DATATYPES, make_rows(40), partitions=4)
+    table = db.tables['people']
+    on_disk = {}
+    for part, path in enumerate(table.data_files()):
+        with open(path) as file:
+            rows = json.load(file)
+        assert all(partition.partition_of(row[0], 4) == part for row in rows.values())
+        on_disk.update(rows)
+    assert on_disk == table.records
+
+    reloaded = Database('shop', 'tester').tables['people']
+    assert isinstance(reloaded, partition.PartitionedTable)
+    assert reloaded.records == table.records
+    assert reloaded.record_id_counter == 41
+
+
+def test_writes_only_rewrite_touched_partitions(make_db):
+    db = make_db('people', COLUMNS, DATATYPES, make_rows(40), partitions=4)
+    table = db.tables['people']
+    before = {path: os.stat(path).st_mtime_ns for path in table.data_files()}
+    db.update('people', '5', ['5', 'renamed', '30'])
+    after = {path: os.stat(path).st_mtime_ns for path in table.data_files()}
+    changed = [path for path in before if before[path] != after[path]]
+    assert changed == [table.partition_file(partition.partition_of('5', 4))]
+
+    db.delete('people', '5')
+    assert '5' not in table.primary_key_values
+    assert all('5' != row[0] for row in Database('shop', 'tester').tables['people'].records.values())
+
+
+def test_scans_and_aggregates_cover_every_partition(make_db):
+    db = make_db('people', COLUMNS, DATATYPES, make_rows(40), partitions=4)
+    where = [['age', '>=', 25], ['name', '!=', 'p7']]
+    expected = {record_id: record for record_id, record in db.tables['people'].records.items()
+                if int(record[2]) >= 25 and record[1] != 'p7'}
+
+    assert db.query('people', where)['records'] == expected
+    assert db.aggregate('people', 'sum', 'age', where)['value'] == sum(int(record[2]) for record in expected.values())
+    assert db.aggregate('people', 'count')['value'] == 40
+    assert db.aggregate('people', 'max', 'age')['value'] == 29
+
+
+def test_compaction_rewrites_every_partition(make_db):
+    db = make_db('people', COLUMNS, DATATYPES, make_rows(10), partitions=4)
+    for i in range(1, 6):
+        db.delete('people', str(i))
+    assert db.compact_table('people')['success']
+    reloaded = Database('shop', 'tester').tables['people']
+    assert sorted(reloaded.records, key=int) == ['1', '2', '3', '4', '5']
+
+
+def test_invalid_where_clause_is_reported():
+    with pytest.raises(ValueError):
+        query.compile_predicate(['id'], ['int'], [['missing', '=', 1]])
+    with pytest.raises(ValueError):
+        query.compile_predicate(['id'], ['int'], [['id', '~', 1]])
+
+
+def test_filtered_select_and_aggregate_routes(client):
+    headers = client.headers
+    client.post('/select_database', json={'db_name': 'shop'}, headers=headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'people', 'columns': ['id', 'age'],
+                                       'datatypes': ['int', 'int'], 'partitions': 2}, headers=headers)
+    for i in range(1, 6):
+        client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'people', 'content': [str(i), str(i * 10)]},
+                    headers=headers)
+
+    selected = client.post('/select', json={'db_name': 'shop', 'table_name': 'people', 'where': [['age', '>', 30]]},
+                           headers=headers)
+    assert sorted(selected.json['records']) == ['4', '5']
+    average = client.post('/aggregate', json={'db_name': 'shop', 'table_name': 'people', 'function': 'avg',
+                                              'column': 'age'}, headers=headers)
+    assert average.json == {'value': 30.0}
+    bad = client.post('/select', json={'db_name': 'shop', 'table_name': 'people', 'where': [['nope', '=', 1]]},
+                      headers=headers)
+    assert bad.status_code == 400
@@ -0,0 +1,56 @@
+import marshal
+
+import pytest
+
+
+@pytest.fixture
+def admin(client, monkeypatch):
+    import app as app_module
+    from profiling import SlowLog, RouteProfiler
+
+    monkeypatch.setattr(app_module, 'ADMINS', {'tester'})
+    monkeypatch.setattr(app_module, 'slow_log', SlowLog())
+    monkeypatch.setattr(app_module, 'profiler', RouteProfiler())
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str'], 'constraints': {'name': ['UNIQUE']}},
+                headers=client.headers)
+    return client
+
+
+def test_diagnostics_routes_are_admin_only(client):
+    assert client.get('/slow_requests', headers=client.headers).status_code == 403
+    assert client.post('/profile', json={'route': '/select'}, headers=client.headers).status_code == 403
+
+
+def test_slow_requests_carry_time_breakdown(admin):
+    assert admin.post('/slow_requests', json={'threshold_ms': 0}, headers=admin.headers).status_code == 200
+    admin.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1', 'pen']},
+               headers=admin.headers)
+    admin.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=admin.headers)
+
+    entries = admin.get('/slow_requests', headers=admin.headers).json['requests']
+    insert = next(entry for entry in entries if entry['route'] == '/insert_record')
+    assert insert['db_name'] == 'shop' and insert['table_name'] == 'items'
+    assert insert['operation'] == 'insert' and insert['rows'] == 1 and insert['status'] == 200
+    assert {'auth', 'validation', 'serialization', 'storage'} <= set(insert['phases_ms'])
+    select = next(entry for entry in entries if entry['route'] == '/select')
+    assert select['rows'] == 1
+
+
+def test_profile_next_requests_to_a_route(admin):
+    assert admin.post('/profile', json={'route': '/nope'}, headers=admin.headers).status_code == 400
+    assert admin.post('/profile', json={'route': '/select', 'requests': 2}, headers=admin.headers).status_code == 200
+    assert admin.get('/profile?route=/select', headers=admin.headers).status_code == 404
+
+    for _ in range(3):
+        admin.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=admin.headers)
+
+    status = admin.get('/profile', headers=admin.headers).json
+    assert status['pending'] == []
+    assert status['finished'][0]['captured'] == 2
+    report = admin.get('/profile?route=/select', headers=admin.headers)
+    assert report.status_code == 200
+    assert 'function calls' in report.get_data(as_text=True)
+    raw = admin.get('/profile?route=/select&format=pstats', headers=admin.headers).get_data()
+    assert any(name == 'select' for (_, _, name) in marshal.loads(raw))
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import json
+import subprocess
+
+import pytest
+
+from models.database import Database
+import replication
+from replication import ReplicationPublisher, Replica
+
+
+@pytest.fixture(autouse=True)
+def replication_key(monkeypatch):
+    monkeypatch.setattr(replication, 'REPLICATION_AUTHKEY', b'test-key')
+    # for replicas in a child process
+    monkeypatch.setenv('DIYDB_REPLICATION_KEY', 'test-key')
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def start_primary():
+    primary = Database('shop', 'tester', root='primary')
+    primary.create_table('items', ['id', 'name'], ['int', 'str'])
+    primary.insert('items', ['1', 'pen'])
+    publisher = ReplicationPublisher(('127.0.0.1', 0), {'shop': primary}.get).start()
+    return primary, publisher
+
+
+def test_replica_receives_snapshot_then_streamed_changes(workdir):
+    primary, publisher = start_primary()
+    replica = Replica(publisher.address, 'shop', root='replica', database_class=Database).start()
+    try:
+        assert wait_for(lambda: replica.database is not None)
+        assert replica.database.tables['items'].records == {'1': ['1', 'pen']}
+
+        primary.insert('items', ['2', 'ink'])
+        primary.update('items', '1', ['10', 'quill'])
+        primary.delete('items', '2')
+        primary.create_table('tags', ['id'], ['int'])
+        primary.insert('tags', ['7'])
+
+        assert wait_for(lambda: replica.applied_seq == primary.changelog.seq)
+        assert replica.database.tables['items'].records == primary.tables['items'].records
+        assert replica.database.tables['items'].primary_key_values == {'10'}
+        assert replica.database.tables['tags'].records == {'1': ['7']}
+        status = replica.status()
+        assert status['connected'] and status['lag_events'] == 0
+        assert publisher.status()['replicas'][0]['db_name'] == 'shop'
+    finally:
+        replica.close()
+        publisher.close()
+
+
+def test_compaction_sends_replicas_a_new_image(workdir):
+    primary, publisher = start_primary()
+    replica = Replica(publisher.address, 'shop', root='replica', database_class=Database).start()
+    try:
+        assert wait_for(lambda: replica.database is not None)
+        primary.insert('items', ['2', 'ink'])
+        primary.delete('items', '1')
+        assert primary.compact_table('items')['success']
+        primary.insert('items', ['3', 'nib'])
+
+        # the log only marks the compaction, the renumbered rows reach the replica in the image
+        compactions = [entry['change'] for entry in primary.changelog.since(0)
+                       if entry['change']['operation'] == 'compact']
+        assert compactions and compactions[0] == {'operation': 'compact', 'table_name': 'items'}
+        assert wait_for(lambda: replica.applied_seq == primary.changelog.seq)
+        assert replica.database.tables['items'].records == {'1': ['2', 'ink'], '2': ['3', 'nib']}
+        with pytest.raises(ValueError):
+            replica.database.apply_change(compactions[0])
+    finally:
+        replica.close()
+        publisher.close()
+
+
+def test_replica_in_separate_process(workdir):
+    primary, publisher = start_primary()
+    models_dir = os.path.join(os.path.dirname(__file__), '..', 'models')
+    script = (
+        "import sys, time, json\n"
+        f"sys.path.insert(0, {os.path.abspath(models_dir)!r})\n"
+        "from replication import Replica\n"
+        f"replica = Replica(('127.0.0.1', {publisher.address[1]}), 'shop', root='replica').start()\n"
+        "deadline = time.time() + 10\n"
+        "while time.time() < deadline and (replica.database is None or replica.applied_seq < 4):\n"
+        "    time.sleep(0.02)\n"
+        "print(json.dumps(replica.database.tables['items'].records))\n"
+    )
+    child = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+    try:
+        primary.insert('items', ['2', 'ink'])
+        primary.insert('items', ['3', 'cap'])
+        output, _ = child.communicate(timeout=20)
+        assert json.loads(output.strip().splitlines()[-1]) == primary.tables['items'].records
+    finally:
+        child.kill()
+        publisher.close()
+
+
+def test_replication_needs_a_shared_secret(workdir, monkeypatch):
+    primary, publisher = start_primary()
+    try:
+        with monkeypatch.context() as m:
+            m.setattr(replication, 'REPLICATION_AUTHKEY', None)
+            with pytest.raises(RuntimeError, match='DIYDB_REPLICATION_KEY'):
+                ReplicationPublisher(('127.0.0.1', 0), {'shop': primary}.get)
+            with pytest.raises(RuntimeError):
+                Replica(publisher.address, 'shop', root='replica')
+
+        # a replica with the wrong key gives up, and the primary keeps accepting the others
+        stranger = Replica(publisher.address, 'shop', root='stranger', authkey=b'guess').start()
+        assert wait_for(lambda: not stranger.running) and stranger.database is None
+        replica = Replica(publisher.address, 'shop', root='replica', database_class=Database).start()
+        assert wait_for(lambda: replica.database is not None)
+        replica.close()
+    finally:
+        publisher.close()
+
+
+def test_replica_resyncs_after_a_change_fails_to_apply(workdir, monkeypatch):
+    primary, publisher = start_primary()
+    replica = Replica(publisher.address, 'shop', root='replica', database_class=Database).start()
+    try:
+        assert wait_for(lambda: replica.database is not None)
+        apply_change = replica.database.apply_change
+        failures = []
+
+        def flaky(change):
+            if not failures:
+                failures.append(change)
+                raise ValueError('disk trouble')
+            return apply_change(change)
+        monkeypatch.setattr(replica.database, 'apply_change', flaky)
+        primary.insert('items', ['2', 'ink'])
+        primary.insert('items', ['3', 'cap'])
+
+        assert wait_for(lambda: replica.applied_seq == primary.changelog.seq)
+        assert failures and replica.running
+        assert replica.database.tables['items'].records == primary.tables['items'].records
+    finally:
+        replica.close()
+        publisher.close()
+
+
+def test_write_routes_are_rejected_on_a_replica(client):
+    import app as app_module
+
+    app_module.replication['replicas']['shop'] = object()
+    try:
+        response = client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1']},
+                               headers=client.headers)
+        assert response.status_code == 403
+    finally:
+        app_module.replication['replicas'].clear()
@@ -0,0 +1,134 @@
+import random
+
+import pytest
+
+from models.database import Database
+from index import HashIndex, OrderedIndex
+from table import Table
+
+
+COLUMNS = ['id', 'customer', 'total']
+DATATYPES = ['int', 'str', 'float']
+
+
+def make_rows(count):
+    rng = random.Random(3)
+    return [[str(i), f'c{rng.randint(1, 20)}', str(rng.randint(0, 500) / 4)] for i in range(1, count + 1)]
+
+
+def test_indexed_queries_match_scans(make_db, monkeypatch):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(200))
+    table = db.tables['orders']
+    wheres = [[['customer', '=', 'c7']], [['total', '>', '100']], [['total', '<=', '12.5']],
+              [['total', '>=', '30'], ['customer', '=', 'c3']], [['total', '=', '50']], [['total', '<', '0']]]
+    expected = [table.scan(where) for where in wheres]
+
+    assert db.create_index('orders', 'customer')['success']
+    assert db.create_index('orders', 'total', 'ordered')['success']
+    with monkeypatch.context() as m:
+        m.setattr(Table, 'scan', lambda self, where: pytest.fail(f'scanned for {where}'))
+        for where, records in zip(wheres, expected):
+            assert db.query('orders', where)['records'] == records
+
+    # a hash index can't answer ranges and nothing answers !=, so those still scan
+    assert db.drop_index('orders', 'total')['success']
+    assert not table.indexable([['total', '>', '1']]) and not table.indexable([['customer', '!=', 'c1']])
+    assert table.indexable([['customer', '=', 'c1']])
+
+
+def test_writes_keep_indexes_current(make_db, monkeypatch, assert_indexes_current):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(50))
+    table = db.tables['orders']
+    db.create_index('orders', 'customer')
+    db.create_index('orders', 'total', 'ordered')
+
+    db.insert('orders', ['51', 'c99', '9.5'])
+    db.update('orders', '3', ['3', 'c99', '1000'])
+    db.delete('orders', '4')
+    db.update_where('orders', [['customer', '=', 'c5']], {'total': '0.25'})
+    db.delete_where('orders', [['total', '>', '120']])
+    assert_indexes_current(table)
+    assert set(db.query('orders', [['customer', '=', 'c99']])['records']) == {'51'}
+
+    # a failed transaction puts the rows, and so the index entries, back
+    with monkeypatch.context() as m:
+        m.setattr(db, 'save_metadata', lambda *args: 1 / 0 if db.transaction_log else None)
+        assert not db.update_where('orders', [['customer', '=', 'c1']], {'customer': 'c2'})['success']
+        assert not db.delete_where('orders', [['customer', '=', 'c2']])['success']
+    assert_indexes_current(table)
+
+    db.compact_table('orders')
+    assert_indexes_current(table)
+
+
+def test_indexes_are_rebuilt_on_load_and_replicated(make_db, assert_indexes_current):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(30), partitions=3)
+    db.create_index('orders', 'customer')
+    db.create_index('orders', 'total', 'ordered')
+    db.drop_index('orders', 'customer')
+
+    reloaded = Database('shop', 'tester').tables['orders']
+    assert {column: secondary.kind for column, secondary in reloaded.indexes.items()} == {'total': 'ordered'}
+    assert_indexes_current(reloaded)
+
+    replica = Database('copy', 'tester')
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    assert set(replica.tables['orders'].indexes) == {'total'}
+    assert_indexes_current(replica.tables['orders'])
+
+    db.drop_column('orders', 'total')
+    assert db.tables['orders'].indexes == {}
+
+
+def test_joins_probe_secondary_indexes(make_db):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(40))
+    db.create_table('customers', ['id', 'name'], ['int', 'str'])
+    for i in range(1, 21):
+        db.insert('customers', [str(i), f'c{i}'])
+
+    hashed = db.join('customers', 'orders', ['name', 'customer'], 'left')
+    assert hashed['strategy'] == 'hash'
+    rows = sorted(hashed['rows'], key=str)
+    db.create_index('orders', 'customer')
+    indexed = db.join('customers', 'orders', ['name', 'customer'], 'left')
+    assert indexed['strategy'] == 'index'
+    assert sorted(indexed['rows'], key=str) == rows
+
+
+def test_invalid_indexes_are_rejected(make_db):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(5))
+    assert not db.create_index('orders', 'height')['success']
+    assert not db.create_index('orders', 'customer', 'btree')['success']
+    assert db.create_index('orders', 'customer')['success']
+    assert 'already has' in db.create_index('orders', 'customer', 'ordered')['message']
+    assert not db.drop_index('orders', 'total')['success']
+    assert not db.create_index('missing', 'customer')['success']
+
+
+def test_values_that_do_not_convert_are_not_indexed():
+    hashed, ordered = HashIndex('n', int), OrderedIndex('n', float)
+    for record_id, value in [('1', '5'), ('2', 'x'), ('3', None), ('4', '5')]:
+        hashed.add(record_id, value)
+        ordered.add(record_id, value)
+    ordered.add('5', 'nan')
+    assert hashed.search('=', 5) == {'1', '4'}
+    assert ordered.search('>=', 5.0) == ['1', '4'] and ordered.search('<', 5.0) == []
+    hashed.remove('1', '5')
+    ordered.remove('4', '5')
+    assert hashed.search('=', 5) == {'4'} and ordered.search('=', 5.0) == ['1']
+
+
+def test_index_routes(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'orders', 'columns': ['id', 'customer'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    response = client.post('/create_index', json={'db_name': 'shop', 'table_name': 'orders', 'column': 'customer',
+                                                  'kind': 'ordered'}, headers=client.headers)
+    assert response.status_code == 200
+    response = client.post('/drop_index', json={'db_name': 'shop', 'table_name': 'orders', 'column': 'customer'},
+                           headers=client.headers)
+    assert response.status_code == 200
+    response = client.post('/drop_index', json={'db_name': 'shop', 'table_name': 'orders', 'column': 'customer'},
+                           headers=client.headers)
+    assert response.status_code == 400
@@ -0,0 +1,111 @@
+from models.database import Database
+
+
+COLUMNS = ['id', 'name', 'age']
+DATATYPES = ['int', 'str', 'int']
+CONSTRAINTS = {'name': ['UNIQUE', 'NOT NULL']}
+
+
+def make_rows(count):
+    return [[str(i), f'item{i}', str(i % 5)] for i in range(1, count + 1)]
+
+
+def count_saves(monkeypatch, table):
+    saves = []
+    original = type(table).save_data
+    monkeypatch.setattr(type(table), 'save_data', lambda self: saves.append(self.name) or original(self))
+    return saves
+
+
+def test_delete_where_saves_once(make_db, monkeypatch):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS, partitions=2)
+    saves = count_saves(monkeypatch, db.tables['items'])
+
+    result = db.delete_where('items', [['age', '=', '0']])
+
+    assert result['success'] and len(result['changes']) == 4
+    assert saves == ['items']
+    assert sorted(db.query('items', [['age', '=', '0']])['records']) == []
+    assert db.insert('items', ['5', 'item5', '0'])['success']
+    assert Database('shop', 'tester').tables['items'].records == db.tables['items'].records
+
+
+def test_update_where_sets_columns_of_every_match(make_db, monkeypatch):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS)
+    saves = count_saves(monkeypatch, db.tables['items'])
+
+    result = db.update_where('items', [['age', '>=', '3']], {'age': '9'})
+
+    assert result['success'] and len(result['changes']) == 8
+    assert saves == ['items']
+    assert len(db.query('items', [['age', '=', '9']])['records']) == 8
+    assert db.update_where('items', [['age', '>', '100']], {'age': '1'})['changes'] == []
+
+    # an equality on the primary key is answered from the index and may move the key
+    assert len(db.update_where('items', [['id', '=', '7']], {'id': '70', 'name': 'moved'})['changes']) == 1
+    assert db.tables['items'].index.find_index('70') == '7'
+    assert db.query('items', [['id', '=', '70']])['records'] == {'7': ['70', 'moved', '2']}
+
+
+def test_invalid_updates_change_nothing(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS)
+    before = dict(db.tables['items'].records)
+
+    assert 'only allows unique' in db.update_where('items', [['age', '=', '1']], {'name': 'same'})['message']
+    assert 'only allows unique' in db.update_where('items', [['id', '=', '1']], {'name': 'item2'})['message']
+    assert 'should be unique' in db.update_where('items', [['id', '=', '1']], {'id': '2'})['message']
+    assert 'NULL' in db.update_where('items', [['id', '=', '1']], {'name': ''})['message']
+    assert 'Conversion error' in db.update_where('items', [], {'age': 'old'})['message']
+    assert "doesn't exist" in db.update_where('items', [], {'height': '1'})['message']
+    assert not db.delete_where('items', [['age', '~', '1']])['success']
+
+    assert db.tables['items'].records == before
+    assert db.update_where('items', [['id', '=', '1']], {'name': 'item1'})['success']
+
+
+def test_failed_set_writes_roll_back(make_db, monkeypatch):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS)
+    before = dict(db.tables['items'].records)
+    monkeypatch.setattr(db, 'save_metadata', lambda *args: 1 / 0 if db.transaction_log else None)
+
+    assert not db.delete_where('items', [['age', '<', '3']])['success']
+
+    assert db.tables['items'].records == before
+    assert db.tables['items'].index.find_index('1') == '1'
+    assert '1' in db.tables['items'].primary_key_values
+
+
+def test_replicas_apply_set_writes_in_one_entry(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(20), CONSTRAINTS)
+    db.update_where('items', [['age', '=', '1']], {'age': '8'})
+    db.delete_where('items', [['age', '=', '2']])
+    entries = [entry['change'] for entry in db.changelog.since(0)]
+    assert [entry['operation'] for entry in entries[-2:]] == ['update_where', 'delete_where']
+
+    replica = Database('copy', 'tester')
+    for change in entries:
+        replica.apply_change(change)
+    assert replica.tables['items'].records == db.tables['items'].records
+
+
+def test_set_write_routes(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'age'],
+                                       'datatypes': ['int', 'int']}, headers=client.headers)
+    for i in range(1, 11):
+        client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': [str(i), str(i)]},
+                    headers=client.headers)
+
+    response = client.put('/update_where', json={'db_name': 'shop', 'table_name': 'items',
+                                                 'where': [['age', '<=', '3']], 'set': {'age': '0'}},
+                          headers=client.headers)
+    assert response.status_code == 200 and response.json['count'] == 3
+    response = client.delete('/delete_where', json={'db_name': 'shop', 'table_name': 'items',
+                                                    'where': [['age', '=', '0']]}, headers=client.headers)
+    assert response.status_code == 200 and response.json['count'] == 3
+    response = client.delete('/delete_where', json={'db_name': 'shop', 'table_name': 'items'},
+                             headers=client.headers)
+    assert response.status_code == 400
+
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=client.headers)
+    assert sorted(response.json['records'], key=int) == [str(i) for i in range(4, 11)]
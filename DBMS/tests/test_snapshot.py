@@ -0,0 +1,53 @@
+import json
+import os
+
+import snapshot
+
+
+ROWS = [['1', 'pen'], ['2', 'ink']]
+
+
+def test_snapshot_is_not_affected_by_writes_after_the_checkpoint(make_db):
+    db = make_db('items', ['id', 'name'], ['int', 'str'], ROWS)
+    image = snapshot.capture(db)
+    db.update('items', '1', ['1', 'quill'])
+    db.delete('items', '2')
+    manifest = snapshot.write_snapshot('shop', image)
+
+    path = snapshot.snapshot_dir('shop', manifest['snapshot_id'])
+    with open(os.path.join(path, 'items.json')) as file:
+        assert json.load(file) == {'1': ['1', 'pen'], '2': ['2', 'ink']}
+    with open(os.path.join(path, 'metadata.json')) as file:
+        assert sorted(json.load(file)['tables']['items']['primary_key_value']) == ['1', '2']
+
+
+def test_restore_brings_back_snapshot_state(make_db):
+    db = make_db('items', ['id', 'name'], ['int', 'str'], ROWS)
+    snapshot_id = db.create_snapshot()['snapshot']['snapshot_id']
+    db.insert('items', ['3', 'cap'])
+    db.delete('items', '1')
+
+    result = db.restore_snapshot(snapshot_id)
+
+    assert result['success']
+    assert db.tables['items'].records == {'1': ['1', 'pen'], '2': ['2', 'ink']}
+    assert db.tables['items'].primary_key_values == {'1', '2'}
+    assert [m['snapshot_id'] for m in db.list_snapshots()] == [snapshot_id]
+    assert not db.restore_snapshot('../shop')['success']
+
+
+def test_snapshot_routes(client):
+    headers = client.headers
+    client.post('/select_database', json={'db_name': 'shop'}, headers=headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id'],
+                                       'datatypes': ['int']}, headers=headers)
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['1']}, headers=headers)
+    created = client.post('/snapshot', json={'db_name': 'shop'}, headers=headers)
+    assert created.status_code == 201
+    client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'items', 'content': ['2']}, headers=headers)
+
+    restored = client.post('/restore', json={'db_name': 'shop', 'snapshot_id': created.json['snapshot']['snapshot_id']},
+                           headers=headers)
+    assert restored.status_code == 200
+    records = client.post('/select', json={'db_name': 'shop', 'table_name': 'items'}, headers=headers).json
+    assert records == {'records': {'1': ['1']}}
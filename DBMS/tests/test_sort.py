@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from sort import parse_order, order_records
+
+
+COLUMNS = ['id', 'name', 'age']
+DATATYPES = ['int', 'str', 'int']
+
+
+def make_items(count, seed=7):
+    rng = random.Random(seed)
+    return [(str(i), [str(i), rng.choice(['ann', 'bob', 'cy']), str(rng.randint(1, 40))]) for i in range(1, count + 1)]
+
+
+def test_parse_order_accepts_strings_and_pairs():
+    assert parse_order(COLUMNS, DATATYPES, 'age') == [(2, int, False)]
+    assert parse_order(COLUMNS, DATATYPES, ['age', 'desc']) == [(2, int, True)]
+    assert parse_order(COLUMNS, DATATYPES, ['name', 'age DESC']) == [(1, str, False), (2, int, True)]
+    assert parse_order(COLUMNS, DATATYPES, [['age', 'desc'], 'id']) == [(2, int, True), (0, int, False)]
+    with pytest.raises(ValueError):
+        parse_order(COLUMNS, DATATYPES, 'height')
+    with pytest.raises(ValueError):
+        parse_order(COLUMNS, DATATYPES, 'age sideways')
+
+
+def test_mixed_directions_sort_numerically_and_stably():
+    items = make_items(500)
+    order = parse_order(COLUMNS, DATATYPES, ['name', 'age desc'])
+    expected = sorted(sorted(items, key=lambda item: -int(item[1][2])), key=lambda item: item[1][1])
+    assert order_records(items, order) == expected
+    assert order_records(items, order, limit=10) == expected[:10]
+
+
+def test_primary_key_order_comes_from_the_index(make_db):
+    db = make_db('people', COLUMNS, DATATYPES, [row for _, row in make_items(30)])
+    table = db.tables['people']
+
+    ids = lambda result: [record[0] for _, record in result['records']]
+    assert ids(db.order('people', order_by='id', limit=3)) == ['1', '2', '3']
+    assert table.index.sorted_keys is not None
+    db.insert('people', ['100', 'dee', '5'])
+    db.delete('people', '30')
+    db.update('people', '2', ['0', 'ann', '9'])
+    assert ids(db.order('people', order_by='id desc', limit=3)) == ['100', '29', '28']
+    assert ids(db.order('people', order_by='id', limit=2)) == ['0', '1']
+    assert ids(db.order('people', [['age', '>', '100']], order_by='id')) == []
+    assert not db.order('people', order_by='id', limit=-1)['success']
+
+
+def test_select_route_orders_and_limits(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'people', 'columns': COLUMNS,
+                                       'datatypes': DATATYPES}, headers=client.headers)
+    for _, row in make_items(12):
+        client.post('/insert_record', json={'db_name': 'shop', 'table_name': 'people', 'content': row},
+                    headers=client.headers)
+
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'people', 'order_by': ['age desc', 'id'],
+                                            'limit': 5}, headers=client.headers)
+    assert response.status_code == 200
+    ages = [int(record[2]) for _, record in response.json['records']]
+    assert len(ages) == 5 and ages == sorted(ages, reverse=True)
+
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'people', 'order_by': 'height'},
+                           headers=client.headers)
+    assert response.status_code == 400
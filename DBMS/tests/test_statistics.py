@@ -0,0 +1,120 @@
+import random
+
+import pytest
+
+from models.database import Database
+import stats
+from stats import HyperLogLog, TableStats
+
+
+COLUMNS = ['id', 'status', 'total', 'note']
+DATATYPES = ['int', 'str', 'float', 'str']
+
+
+def make_rows(count):
+    rng = random.Random(11)
+    return [[str(i), rng.choice(['open', 'paid']), str(rng.randint(0, 9999) / 10),
+             '' if i % 4 == 0 else f'n{i % 300}'] for i in range(1, count + 1)]
+
+
+def test_distinct_counts_are_estimated():
+    hll = HyperLogLog()
+    for i in range(50000):
+        hll.add(i)
+        hll.add(i)
+    assert hll.count() == pytest.approx(50000, rel=0.1)
+    small = HyperLogLog()
+    for value in ['a', 'b', 'c', 'a']:
+        small.add(value)
+    assert small.count() == 3
+    assert HyperLogLog.from_dict(hll.to_dict()).registers == hll.registers
+
+
+def test_statistics_describe_the_columns(make_db):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(2000))
+    table = db.tables['orders']
+    described = db.analyze('orders')['statistics']
+    assert described['rows'] == 2000
+    note = described['columns']['note']
+    assert note['null_fraction'] == 0.25 and note['distinct'] == pytest.approx(225, rel=0.1)
+    total = described['columns']['total']
+    assert total['min'] == min(float(record[2]) for record in table.records.values())
+    assert len(total['histogram']) == stats.HISTOGRAM_BUCKETS + 1 and total['histogram'] == sorted(total['histogram'])
+
+    # estimates are close to the rows that actually match
+    for where in ([['total', '<', '250']], [['total', '>=', '900.5']], [['status', '=', 'paid']],
+                  [['note', '=', 'n7']], [['id', '=', '5']], [['total', '>', '2000']], [['note', 'LIKE', 'n1%']]):
+        plan = table.explain(where)
+        assert plan['estimated_rows'] == pytest.approx(plan['actual_rows'], abs=max(20, plan['actual_rows'] * 0.2))
+
+
+def test_writes_keep_statistics_current_until_they_are_gathered_again(make_db):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(100))
+    table = db.tables['orders']
+    first = table.statistics()
+    db.insert('orders', ['101', 'open', '5000', 'n1'])
+    db.delete('orders', '1')
+    assert table.statistics() is first and first.modified == 2
+    assert first.columns['total']['max'] == 5000.0
+
+    # metadata.json keeps them, changes counted so far included
+    reloaded = Database('shop', 'tester').tables['orders']
+    assert reloaded.stats.modified == 2 and reloaded.stats.columns['total']['max'] == 5000.0
+
+    db.update_where('orders', [['status', '=', 'open']], {'note': 'x'})
+    assert first.stale()
+    refreshed = table.statistics()
+    assert refreshed is not first and (refreshed.rows, refreshed.modified) == (100, 0)
+
+    db.drop_column('orders', 'note')
+    assert set(table.stats.columns) == {'id', 'status', 'total'}
+    db.add_column('orders', 'tier', 'str', 'gold')
+    assert db.explain('orders', [['tier', '=', 'gold']])['success']
+
+
+def test_the_most_selective_index_is_searched(make_db, monkeypatch):
+    db = make_db('orders', COLUMNS, DATATYPES, make_rows(2000))
+    db.create_index('orders', 'status')
+    db.create_index('orders', 'total', 'ordered')
+    table = db.tables['orders']
+    where = [['status', '=', 'open'], ['total', '<', '20']]
+    expected = table.scan(where)
+
+    # only the index the statistics pick is searched, not every usable one
+    with monkeypatch.context() as m:
+        m.setattr(table.indexes['status'], 'search', lambda op, literal: pytest.fail('searched status'))
+        assert db.query('orders', where)['records'] == expected
+        plan = db.explain('orders', where)['plan']
+    assert (plan['access'], plan['index_condition']) == ('ordered index', ['total', '<', 20.0])
+    assert plan['actual_rows'] == len(expected)
+    assert [condition['estimated_rows'] for condition in plan['conditions']][0] == pytest.approx(1000, rel=0.1)
+
+    assert db.explain('orders', [['total', '>', '5'], ['id', '=', '9']])['plan']['access'] == 'primary key'
+    assert db.explain('orders', [['note', '=', 'n1']])['plan']['access'] == 'scan'
+
+
+def test_statistics_survive_an_empty_table(make_db):
+    db = make_db('empty', ['id', 'name'], ['int', 'str'])
+    plan = db.explain('empty', [['name', '>', 'a']])['plan']
+    assert (plan['estimated_rows'], plan['actual_rows']) == (0, 0)
+    assert TableStats.from_dict(db.tables['empty'].stats.to_dict()).rows == 0
+    assert not db.analyze('missing')['success']
+
+
+def test_analyze_and_explain_routes(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'users', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    client.post('/insert_many', json={'db_name': 'shop', 'table_name': 'users',
+                                      'rows': [['1', 'alice'], ['2', 'albert'], ['3', 'bob']]}, headers=client.headers)
+    response = client.post('/analyze', json={'db_name': 'shop', 'table_name': 'users'}, headers=client.headers)
+    assert response.status_code == 200
+    assert response.json['statistics']['columns']['name']['distinct'] == 3
+
+    response = client.post('/explain', json={'db_name': 'shop', 'table_name': 'users',
+                                             'where': [['name', 'LIKE', 'al%']]}, headers=client.headers)
+    assert response.status_code == 200
+    assert (response.json['plan']['access'], response.json['plan']['actual_rows']) == ('scan', 2)
+    response = client.post('/explain', json={'db_name': 'shop', 'table_name': 'users',
+                                             'where': [['height', '=', '1']]}, headers=client.headers)
+    assert response.status_code == 400
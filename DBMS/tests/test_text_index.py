@@ -0,0 +1,145 @@
+import random
+
+import pytest
+
+from models.database import Database
+from index import NgramIndex, PrefixIndex
+from query import like
+from stats import TableStats
+from table import Table
+
+
+COLUMNS = ['id', 'name', 'age']
+DATATYPES = ['int', 'str', 'int']
+
+
+def make_rows(count):
+    rng = random.Random(5)
+    syllables = ['al', 'bo', 'ca', 'de', 'li', 'ma', 'ne', 'ro', 'sa', 'ty']
+    return [[str(i), ''.join(rng.choice(syllables) for _ in range(rng.randint(1, 4))), str(rng.randint(18, 80))]
+            for i in range(1, count + 1)]
+
+
+def test_like_patterns():
+    assert like('carol', 'ca%') and like('carol', '%ro%') and like('carol', 'c_rol')
+    assert not like('carol', 'ca') and not like('carol', '_arl%') and not like('Carol', 'ca%')
+    # everything but the wildcards matches itself
+    assert like('a.b*c', 'a.b*%') and not like('axb', 'a.b')
+
+
+def test_indexed_like_queries_match_scans(make_db, monkeypatch):
+    db = make_db('users', COLUMNS, DATATYPES, make_rows(300))
+    table = db.tables['users']
+    prefixes = [[['name', 'LIKE', 'bo%']], [['name', 'like', 'ma%']], [['name', 'LIKE', 'ca%ro%']],
+                [['name', 'LIKE', 'zz%']], [['name', 'LIKE', 'de%'], ['age', '>', '40']]]
+    infixes = [[['name', 'LIKE', '%lima%']], [['name', 'LIKE', '%ali%de']], [['name', 'LIKE', '%syl%']]]
+    expected = {str(where): db.query('users', where)['records'] for where in prefixes + infixes}
+    assert sum(map(bool, expected.values())) == 6
+
+    def unscannable(m):
+        m.setattr(Table, 'scan', lambda self, where: pytest.fail(f'scanned for {where}'))
+
+    assert db.create_index('users', 'name', 'prefix')['success']
+    with monkeypatch.context() as m:
+        unscannable(m)
+        for where in prefixes:
+            assert db.query('users', where)['records'] == expected[str(where)]
+        # a prefix index still answers equality and ranges
+        assert set(db.query('users', [['name', '>=', 'ty']])['records']) == \
+               {record_id for record_id, record in table.records.items() if record[1] >= 'ty'}
+    assert not table.indexable([['name', 'LIKE', '%bo']]) and not table.indexable([['name', 'LIKE', '_bo%']])
+
+    db.drop_index('users', 'name')
+    assert db.create_index('users', 'name', 'ngram')['success']
+    with monkeypatch.context() as m:
+        unscannable(m)
+        for where in infixes:
+            assert db.query('users', where)['records'] == expected[str(where)]
+    # literal parts shorter than an n-gram, and equality, still scan
+    assert not table.indexable([['name', 'LIKE', '%ne']]) and not table.indexable([['name', '=', 'bo']])
+
+
+def test_writes_keep_text_indexes_current(make_db, assert_indexes_current):
+    db = make_db('users', COLUMNS, DATATYPES, make_rows(50))
+    db.create_index('users', 'name', 'prefix')
+    db.create_table('tags', ['id', 'tag'], ['int', 'str'])
+    db.create_index('tags', 'tag', 'ngram')
+    db.insert_many('tags', [['1', 'database'], ['2', 'data'], ['3', 'base']])
+
+    db.insert('users', ['51', 'zed', '30'])
+    db.update('users', '3', ['3', 'zara', '31'])
+    db.delete('users', '4')
+    db.update_where('users', [['name', 'LIKE', 'bo%']], {'name': 'zoe'})
+    db.delete_where('users', [['name', 'LIKE', 'ca%']])
+    db.insert('tags', ['4', 'metadata'])
+    db.update('tags', '2', ['2', 'dat'])
+    db.delete('tags', '1')
+    assert_indexes_current(db.tables['users'])
+    assert_indexes_current(db.tables['tags'])
+    assert set(db.query('tags', [['tag', 'LIKE', '%data%']])['records']) == {'4'}
+    assert 'dat' not in db.tables['tags'].indexes['tag'].entries.get('ata', set())
+
+    db.compact_table('users')
+    assert_indexes_current(db.tables['users'])
+
+
+def test_text_indexes_are_rebuilt_on_load_and_replicated(make_db, assert_indexes_current):
+    db = make_db('users', COLUMNS, DATATYPES, make_rows(40), partitions=3)
+    db.create_index('users', 'name', 'ngram')
+
+    reloaded = Database('shop', 'tester').tables['users']
+    assert reloaded.indexes['name'].kind == 'ngram'
+    assert_indexes_current(reloaded)
+
+    replica = Database('copy', 'tester')
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    assert_indexes_current(replica.tables['users'])
+    assert replica.query('users', [['name', 'LIKE', '%ali%']]) == db.query('users', [['name', 'LIKE', '%ali%']])
+
+
+def test_like_and_text_indexes_need_str_columns(make_db):
+    db = make_db('users', COLUMNS, DATATYPES, make_rows(5))
+    assert 'str column' in db.create_index('users', 'age', 'prefix')['message']
+    assert not db.create_index('users', 'age', 'ngram')['success']
+    assert 'only applies to str' in db.query('users', [['age', 'LIKE', '2%']])['message']
+    # a join can't probe an n-gram index, so it hashes instead
+    db.create_index('users', 'name', 'ngram')
+    db.create_table('names', ['id', 'name'], ['int', 'str'])
+    db.insert('names', ['1', db.tables['users'].records['1'][1]])
+    assert db.join('names', 'users', ['name', 'name'])['strategy'] == 'hash'
+
+
+def test_ngram_search_intersects_every_part():
+    ngrams = NgramIndex('tag', str)
+    for record_id, value in [('1', 'abcdef'), ('2', 'abcxyz'), ('3', 'xyzabc'), ('4', None)]:
+        ngrams.add(record_id, value)
+    assert ngrams.search('LIKE', '%abc%xyz%') == {'2', '3'}
+    assert ngrams.search('LIKE', '%ab%') is None and ngrams.search('=', 'abcdef') is None
+    ngrams.remove('2', 'abcxyz')
+    assert ngrams.search('LIKE', 'abc%xyz') == {'3'} and 'cxy' not in ngrams.entries
+
+
+def test_prefixes_ending_in_the_last_code_point():
+    top = chr(0x10FFFF)
+    prefixes = PrefixIndex('name', str)
+    for record_id, value in [('1', 'a' + top), ('2', 'a' + top + 'z'), ('3', 'b'), ('4', top + top), ('5', top)]:
+        prefixes.add(record_id, value)
+    assert sorted(prefixes.search('LIKE', 'a' + top + '%')) == ['1', '2']
+    assert sorted(prefixes.search('LIKE', top + '%')) == ['4', '5']
+    stats = TableStats.gather({'id': int, 'name': str}, {'1': ['1', 'a'], '2': ['2', 'b'], '3': ['3', top + 'c']})
+    assert 0 < stats.selectivity('name', 'LIKE', top + '%') <= 1
+
+
+def test_select_route_filters_with_like(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'users', 'columns': ['id', 'name'],
+                                       'datatypes': ['int', 'str']}, headers=client.headers)
+    client.post('/insert_many', json={'db_name': 'shop', 'table_name': 'users',
+                                      'rows': [['1', 'alice'], ['2', 'albert'], ['3', 'bob']]}, headers=client.headers)
+    response = client.post('/create_index', json={'db_name': 'shop', 'table_name': 'users', 'column': 'name',
+                                                  'kind': 'prefix'}, headers=client.headers)
+    assert response.status_code == 200
+    response = client.post('/select', json={'db_name': 'shop', 'table_name': 'users',
+                                            'where': [['name', 'LIKE', 'al%']]}, headers=client.headers)
+    assert set(response.json['records']) == {'1', '2'}
@@ -0,0 +1,152 @@
+import time
+
+import pytest
+
+from models.database import Database
+from expiry import reaper
+
+
+@pytest.fixture
+def no_reaper(monkeypatch):
+    # reap by hand, so nothing deletes rows behind the test's back
+    monkeypatch.setattr(reaper, 'schedule', lambda db, table_name, when: None)
+
+
+COLUMNS = ['id', 'user', 'expires_at']
+DATATYPES = ['int', 'str', 'float']
+TTL = {'column': 'expires_at', 'seconds': 3600}
+
+
+def test_expired_rows_are_hidden_at_once(make_db, monkeypatch, no_reaper):
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl=TTL)
+    table = db.tables['sessions']
+    past = str(time.time() - 1)
+    assert db.insert('sessions', ['1', 'alice', ''])['success']
+    db.insert_many('sessions', [['2', 'bob', past], ['3', 'carol', past], ['4', 'dave', None]])
+    assert float(table.records['1'][2]) == pytest.approx(time.time() + 3600, abs=5)
+
+    # due rows are found through the expiry heap, never by scanning the table
+    monkeypatch.setattr(table, 'records', type('Unscannable', (dict,), {
+        'items': lambda self: pytest.fail('scanned for expired rows')})(table.records))
+    assert db.aggregate('sessions', 'count')['value'] == 2
+    table.records = dict(table.records)
+    assert set(db.query('sessions')['records']) == {'1', '4'}
+    assert sorted(table.expired) == ['2', '3']
+
+    # the primary key of an expired row is free again
+    assert db.insert('sessions', ['2', 'bob', ''])['success']
+    assert not db.update('sessions', '3', ['3', 'carol', ''])['success']
+    db.update('sessions', '1', ['1', 'alice', past])
+    assert db.query('sessions', [['user', '=', 'alice']])['records'] == {}
+
+
+def test_reaping_deletes_from_the_files_in_batches(make_db, no_reaper):
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl=TTL)
+    past = str(time.time() - 1)
+    db.insert_many('sessions', [[str(i), f'u{i}', past if i <= 5 else ''] for i in range(1, 9)])
+    replica = Database('copy', 'tester')
+
+    first = db.reap('sessions', 2)
+    assert (first['count'], first['remaining']) == (2, 0)
+    assert len(Database('shop', 'tester').tables['sessions'].records) == 6
+    # rows a read took out are deleted along with the next batch
+    db.query('sessions')
+    assert db.tables['sessions'].expired.keys() == {'3', '4', '5'}
+    assert [db.reap('sessions', 2)['count'] for _ in range(3)] == [2, 1, 0]
+    assert set(Database('shop', 'tester').tables['sessions'].records) == {'6', '7', '8'}
+    assert db.reap('sessions')['next_expiry'] == pytest.approx(time.time() + 3600, abs=5)
+
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    assert replica.tables['sessions'].records == db.tables['sessions'].records
+    assert replica.tables['sessions'].ttl == {'column': 'expires_at', 'seconds': 3600}
+    assert replica.tables['sessions'].expired == {}
+
+
+def test_copies_hide_expired_rows_but_leave_deleting_them_to_the_primary(make_db, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(reaper, 'schedule', lambda db, table_name, when: scheduled.append(db.db_name))
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl=TTL)
+    db.insert_many('sessions', [['1', 'alice', str(time.time() - 1)], ['2', 'bob', '']])
+    replica = Database('copy', 'tester', replica=True)
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    changed = []
+    replica.add_listener(lambda db_name, table_name, operation: changed.append(operation))
+
+    # the rows go from cached results at once, but the files and record ids are left to the primary
+    assert set(replica.query('sessions')['records']) == {'2'}
+    assert changed == ['expire']
+    assert not replica.reap('sessions')['success']
+    assert set(Database('copy', 'tester', replica=True).tables['sessions'].records) == {'1', '2'}
+    assert 'copy' not in scheduled
+
+    db.reap('sessions')
+    replica.apply_change(db.changelog.since(0)[-1]['change'])
+    assert replica.tables['sessions'].records == db.tables['sessions'].records
+    assert replica.tables['sessions'].expired == {}
+
+
+def test_the_reaper_runs_in_the_background(make_db, monkeypatch):
+    monkeypatch.setattr(reaper, 'batch_rows', 3)
+    monkeypatch.setattr(reaper, 'pause_ms', 1)
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl=TTL)
+    soon = str(time.time() + 0.2)
+    db.insert_many('sessions', [[str(i), f'u{i}', soon if i <= 10 else ''] for i in range(1, 13)])
+
+    def batches():
+        return [len(entry['change']['changes']) for entry in db.changelog.since(0)
+                if entry['change']['operation'] == 'delete_where']
+
+    # nothing reads the table; the reaper comes when the first row expires
+    deadline = time.monotonic() + 5
+    while sum(batches()) < 10 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert batches() == [3, 3, 3, 1]
+    assert set(Database('shop', 'tester').tables['sessions'].records) == {'11', '12'}
+
+
+def test_failed_reaps_are_logged(make_db, monkeypatch, caplog, no_reaper):
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl=TTL)
+    monkeypatch.setattr(db, 'reap', lambda table_name, batch_rows: 1 / 0)
+    assert not reaper.reap(db, 'sessions')['success']
+    assert 'Reaping shop.sessions failed' in caplog.text and 'ZeroDivisionError' in caplog.text
+
+
+def test_ttl_is_kept_in_the_schema(make_db, no_reaper):
+    db = make_db('sessions', COLUMNS, DATATYPES, ttl={'column': 'expires_at', 'seconds': None})
+    later = str(time.time() + 3600)
+    assert db.insert('sessions', ['1', 'alice', later])['success']
+    # without seconds every row has to come with its expiry time
+    assert not db.insert('sessions', ['3', 'carol', ''])['success']
+    reloaded = Database('shop', 'tester')
+    assert reloaded.tables['sessions'].ttl == {'column': 'expires_at', 'seconds': None}
+    assert reloaded.tables['sessions'].records['1'] == ['1', 'alice', later]
+
+    # expiry times on disk that passed while the database was closed are hidden when it loads
+    db.insert('sessions', ['2', 'bob', str(time.time() - 1)])
+    assert set(Database('shop', 'tester').query('sessions')['records']) == {'1'}
+
+    db.drop_column('sessions', 'expires_at')
+    assert db.tables['sessions'].ttl is None and db.tables['sessions'].expiry == []
+
+
+def test_invalid_ttls_are_rejected(workdir, no_reaper):
+    db = Database('shop', 'tester')
+    columns, datatypes = ['id', 'user', 'expires_at'], ['int', 'str', 'int']
+    assert 'must be int or float' in db.create_table('t', columns, datatypes, ttl={'column': 'user'})['message']
+    assert not db.create_table('t', columns, datatypes, ttl={'column': 'id'})['success']
+    assert not db.create_table('t', columns, datatypes, ttl={'column': 'expires_at', 'seconds': -5})['success']
+    assert 't' not in db.tables
+    assert db.create_table('t', columns, datatypes, ttl={'column': 'expires_at', 'seconds': 60})['success']
+    db.insert('t', ['1', 'alice', ''])
+    assert db.tables['t'].records['1'][2] == str(int(db.tables['t'].records['1'][2]))
+
+
+def test_create_table_route_takes_a_ttl(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    response = client.post('/create_table', json={'db_name': 'shop', 'table_name': 'sessions',
+                                                  'columns': ['id', 'expires_at'], 'datatypes': ['int', 'float'],
+                                                  'ttl': {'column': 'expires_at', 'seconds': 60}},
+                           headers=client.headers)
+    assert response.json['message']['success']
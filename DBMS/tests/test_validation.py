@@ -0,0 +1,110 @@
+import pytest
+
+from models.database import Database
+
+
+COLUMNS = ['id', 'email', 'age']
+DATATYPES = ['int', 'str', 'int']
+CONSTRAINTS = {'email': ['UNIQUE', 'NOT NULL']}
+
+
+def make_rows(count):
+    return [[str(i), f'user{i}@x', str(20 + i)] for i in range(1, count + 1)]
+
+
+def test_validator_is_compiled_per_schema(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(5), CONSTRAINTS)
+    table = db.tables['items']
+    assert table.validator == ((0, 'id', int, False, False), (1, 'email', None, True, True),
+                               (2, 'age', int, False, False))
+
+    db.add_column('items', 'score', 'float', '0.5')
+    db.drop_column('items', 'age')
+    assert [entry[1] for entry in table.validator] == ['id', 'email', 'score']
+    assert Database('shop', 'tester').tables['items'].validator == table.validator
+
+
+def test_rows_are_checked_against_the_compiled_schema(make_db, monkeypatch):
+    table = make_db('items', COLUMNS, DATATYPES, make_rows(5), CONSTRAINTS).tables['items']
+    # constraints are no longer looked up per value
+    monkeypatch.setattr(table, 'column_constraints', None)
+
+    assert table.validate_row(['9', 'new@x', '30']) is None
+    assert table.validate_row(['9', 'new@x']) == "Values missing for some columns"
+    assert table.validate_row(['9', '', '30']) == "Column email doesn't allow NULL values"
+    assert table.validate_row(['9', None, '30']) == "Column email doesn't allow NULL values"
+    assert table.validate_row(['9', 'user2@x', '30']) == "Column email only allows unique values"
+    assert table.validate_row(['2', 'user2@x', '30'], '2') is None
+    assert 'Conversion error' in table.validate_row(['9', 'new@x', 'old'])
+    assert 'Conversion error' in table.validate_row(['9', 'new@x', None])
+    assert 'Expected str' in table.validate_row(['9', 7, '30'])
+
+
+def test_unique_checks_use_an_index_when_there_is_one(make_db, monkeypatch):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(50), CONSTRAINTS)
+    table = db.tables['items']
+    db.create_index('items', 'email')
+    monkeypatch.setattr(table, 'might_contain', lambda column, value: True)
+    with monkeypatch.context() as m:
+        m.setattr(table, 'records', type('Unscannable', (dict,), {
+            'items': lambda self: pytest.fail('scanned for a unique value')})(table.records))
+
+        assert table.validate_row(['99', 'user7@x', '30']) == "Column email only allows unique values"
+        assert table.validate_row(['7', 'user7@x', '30'], '7') is None
+        assert table.validate_row(['99', 'user99@x', '30']) is None
+        assert db.update_where('items', [['id', '=', '8']], {'email': 'user7@x'})['message'] == \
+            "Column email only allows unique values"
+
+    assert db.update_where('items', [['id', '=', '7']], {'email': 'user7@x', 'age': '40'})['success']
+
+
+def test_writes_report_why_they_failed(make_db):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(5), CONSTRAINTS)
+    assert db.insert('items', ['9', 'user1@x', '30'])['message'] == "Column email only allows unique values"
+    assert db.insert('missing', ['9', 'a', '30'])['message'] == "Table missing doesnt exist"
+    assert db.delete('missing', '1') == {'success': False, 'message': "Table missing doesnt exist"}
+    assert db.delete('items', '9') == {'success': False, 'message': "Record with primary key 9 not found"}
+    assert 'Conversion error' in db.update('items', '1', ['1', 'user1@x', 'old'])['message']
+    assert db.update('items', '1', ['1', '', '30'])['message'] == "Column email doesn't allow NULL values"
+    assert not db.update('missing', '1', ['1', 'a', '30'])['success']
+
+
+def test_insert_many_is_all_or_nothing(make_db, monkeypatch):
+    db = make_db('items', COLUMNS, DATATYPES, make_rows(5), CONSTRAINTS, partitions=2)
+    table = db.tables['items']
+    before = dict(table.records)
+
+    assert db.insert_many('items', [['6', 'a@x', '1'], ['7', 'user1@x', '1']])['message'] == \
+        "Row 2: Column email only allows unique values"
+    assert 'Row 2: Primary key 6' in db.insert_many('items', [['6', 'a@x', '1'], ['6', 'b@x', '1']])['message']
+    assert 'Row 2: Column email' in db.insert_many('items', [['6', 'a@x', '1'], ['7', 'a@x', '1']])['message']
+    assert 'Row 1: Primary key 5' in db.insert_many('items', [['5', 'a@x', '1']])['message']
+    assert not db.insert_many('items', [['6', 'a@x']])['success']
+    assert table.records == before
+
+    saves = []
+    original = type(table).save_data
+    monkeypatch.setattr(type(table), 'save_data', lambda self: saves.append(self.name) or original(self))
+    result = db.insert_many('items', [[str(i), f'new{i}@x', '40'] for i in range(6, 16)])
+    assert result['success'] and len(result['changes']) == 10
+    assert saves == ['items']
+    assert db.query('items', [['id', '=', '15']])['records'] == {'15': ['15', 'new15@x', '40']}
+    assert Database('shop', 'tester').tables['items'].records == table.records
+
+    replica = Database('copy', 'tester')
+    for entry in db.changelog.since(0):
+        replica.apply_change(entry['change'])
+    assert replica.tables['items'].records == table.records
+    assert replica.insert('items', ['16', 'new16@x', '1'])['record_id'] == '16'
+
+
+def test_insert_many_route(client):
+    client.post('/select_database', json={'db_name': 'shop'}, headers=client.headers)
+    client.post('/create_table', json={'db_name': 'shop', 'table_name': 'items', 'columns': ['id', 'age'],
+                                       'datatypes': ['int', 'int']}, headers=client.headers)
+    response = client.post('/insert_many', json={'db_name': 'shop', 'table_name': 'items',
+                                                 'rows': [['1', '30'], ['2', '31']]}, headers=client.headers)
+    assert response.status_code == 200 and response.json['count'] == 2
+    response = client.post('/insert_many', json={'db_name': 'shop', 'table_name': 'items',
+                                                 'rows': [['3', 'old']]}, headers=client.headers)
+    assert response.status_code == 400 and 'Row 1' in response.json['error']
@@ -7,12 +7,14 @@ import requests_mock
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from click.testing import CliRunner
-from cli import cli, set_database
+from cli import cli, set_current_db
 
 BASE_URL = "http://127.0.0.1:5000"
 
 @pytest.fixture
-def runner():
+def runner(tmp_path, monkeypatch):
+    # the CLI keeps the selected database and token in config.json in the working directory
+    monkeypatch.chdir(tmp_path)
     return CliRunner()
 
 @pytest.fixture
@@ -22,16 +24,16 @@ def requests_mock_fixture():
 
 def test_select_db(runner, requests_mock_fixture):
     db_name = 'test_db'
-    requests_mock_fixture.post(f'{BASE_URL}/select_db', json={'message': f'Database {db_name} selected'}, status_code=200)
+    requests_mock_fixture.post(f'{BASE_URL}/select_database', json={'message': f'Database {db_name} selected'}, status_code=200)
     result = runner.invoke(cli, ['select-db', db_name])
     print(result.output)
    
     assert result.exit_code == 0
-    assert f"Database selected: {db_name}" in result.output
+    assert f"Success: Database {db_name} selected" in result.output
 
 def test_create_table(runner, requests_mock_fixture):
     db_name = 'test_db'
-    set_database(db_name)
+    set_current_db(db_name)
     table_name = 'test_table'
     columns = 'id,name'
     datatypes = 'int,str'
@@ -45,7 +47,7 @@ def test_create_table(runner, requests_mock_fixture):
 
 def test_insert_record(runner, requests_mock_fixture):
     db_name = 'test_db'
-    set_database(db_name)
+    set_current_db(db_name)
     table_name = 'test_table'
     content = '1,John Doe'
     requests_mock_fixture.post(f'{BASE_URL}/insert_record', json={'message': 'Record inserted successfully'}, status_code=201)
@@ -56,7 +58,7 @@ def test_insert_record(runner, requests_mock_fixture):
 
 def test_update_record(runner, requests_mock_fixture):
     db_name = 'test_db'
-    set_database(db_name)
+    set_current_db(db_name)
     table_name = 'test_table'
     primary_key = '1'
     new_record = '1,Jane Doe'
@@ -69,7 +71,7 @@ def test_update_record(runner, requests_mock_fixture):
 
 def test_delete_record(runner, requests_mock_fixture):
     db_name = 'test_db'
-    set_database(db_name)
+    set_current_db(db_name)
     table_name = 'test_table'
     primary_key = '1'
     requests_mock_fixture.delete(f'{BASE_URL}/delete', json={'message': 'Record deleted successfully'}, status_code=200)
@@ -81,7 +83,7 @@ def test_delete_record(runner, requests_mock_fixture):
 
 def test_drop_table(runner, requests_mock_fixture):
     db_name = 'test_db'
-    set_database(db_name)
+    set_current_db(db_name)
     table_name = 'test_table'
     requests_mock_fixture.delete(f'{BASE_URL}/drop_table', json={'message': 'Table dropped successfully'}, status_code=200)
     result = runner.invoke(cli, ['drop-table', table_name])